@@ -1,167 +1,35 @@
 import argparse
 import logging
-import os
-import re
-from datetime import date, datetime
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-import pandas as pd
-import requests
-from bs4 import BeautifulSoup
-from playwright.sync_api import sync_playwright
-
-from .parser import read_menus
+# Only the light modules are imported here, pandas, the parser and the
+# browser are imported by main() once the arguments are valid, so that
+# --help and the argument errors are fast
+from .fetcher import DEFAULT_CONCURRENCY, DEFAULT_DEADLINE
 
 logger = logging.getLogger(__name__)
 
+# Number of imports shown by --import-time
+IMPORT_TIME_TOP = 15
 
-def download_html(uri, file):
-
-    with sync_playwright() as p:
-        logger.info(f"Acessing {uri}")
-        browser = p.chromium.launch(headless=True)
-        page = browser.new_page()
-        page.goto(uri)
-
-        # Wait for content to load (e.g., an element that appears after JS finishes)
-        try:
-            page.wait_for_selector(
-                ".category-grid"
-            )  # Change selector based on the site
-        except Exception as e:
-            page.screenshot(path=raw_html / "debug.png", full_page=True)
-            pass
-        content = page.content()
-
-        browser.close()
-
-    # Save the content to a file
-
-    with open(file, "w", encoding="utf-8") as f:
-        f.write(content)
-
-    logger.info(f"Downloaded content from {uri} to {file}")
-    return file
-
-
-def get_mattermost_webhook_url(url_file: Path) -> str:
-    """Get the Mattermost webhook URL from environment variable or file."""
-    url = os.environ.get("MATTERMOST_WEBHOOK_URL")
-    if url is not None:
-        return url
-    if not url_file.is_file():
-        raise ValueError(
-            f"Mattermost webhook URL not found in environment variable "
-            f"MATTERMOST_WEBHOOK_URL or file {url_file}"
-        )
-    with open(url_file, "r") as f:
-        url = f.read().strip()  # Read the URL from a text file
-    return url
-
-
-def send_mattermost_message(url: str, text: str):
-
-    # Send a message to Mattermost
-
-    headers = {"Content-Type": "application/json"}
 
-    payload = {"text": text}
-
-    response = requests.post(url, json=payload, headers=headers)
-
-    assert (
-        response.status_code == 200
-    ), f"Expected status code 200, got {response.status_code}"
-
-
-def parse_price(price_str: str) -> str:
-    """Depending on the price, return a formatted string."""
-    try:
-        price_str = str(price_str).strip()
-    except Exception as e:
-        logger.error(f"Error parsing price: {e}")
-        return "N/A"
-
-    try:
-        price_float = float(price_str)
-    except ValueError:
-        logger.error(f"Error converting price to float: {price_str}")
-        return "N/A"
-
-    # Format the price string
-    return f"*{price_float:.2f}*"
-
-
-def format_as_markdown(df: pd.DataFrame, uris: dict[str, str] = {}) -> str:
-    # Format the dataframe as markdown table for Mattermost
-    df_formatted: pd.DataFrame = df[
-        [
-            "restaurant",
-            "price",
-            "vegan",
-            "glutenfree",
-            "title",
-            "description",
-            "co2_footprint",
-        ]
-    ].copy(deep=True)
-    # Put the column names with the first letter capitalized
-    df_formatted.columns = [col.capitalize() for col in df_formatted.columns]
-
-    # Put the resturant in bold
-    make_bold = lambda col: col.str.replace(r"(\w+)", r"**\1**", regex=True)
-    make_link = lambda col: f"[{col}]({uris[col]})" if col in uris else col
-    df_formatted["Restaurant"] = df_formatted["Restaurant"].apply(make_link)
-    df_formatted["Title"] = make_bold(df_formatted["Title"])
-    # Format price with 2 decimal places (enforce for the markdown transformation)
-    df_formatted["Price"] = df_formatted["Price"].apply(parse_price)
-    df_formatted["Vegan"] = df_formatted["Vegan"].apply(lambda x: "✔️" if x else "❌")
-    df_formatted["Glutenfree"] = df_formatted["Glutenfree"].apply(
-        lambda x: "✔️" if x else "❌"
-    )
-    df_formatted = df_formatted.rename(columns={"Co2_footprint": "kg CO2eq"})
-    df_formatted["kg CO2eq"] = df_formatted["kg CO2eq"].apply(
-        lambda x: f"{x:.2f}" if pd.notnull(x) else ""
-    )
-    df_md = df_formatted.to_markdown(index=False, tablefmt="github")
-
-    return df_md
-
-
-def determine_target_date(custom_date_str: str = None, use_today: bool = False) -> date:
+def should_append_date(
+    use_today: bool, date_range: list[str] | None = None, week: bool = False
+) -> bool:
     """
-    Determine the target date for fetching the menu.
-
-    Args:
-        custom_date_str: Custom date in YYYY-MM-DD format. Takes precedence over use_today.
-        use_today: If True, use today's date. Otherwise, use next workday.
-
-    Returns:
-        The date to fetch the menu for.
+    Whether the date is appended to the URIs of the menu pages.
 
-    Raises:
-        ValueError: If custom_date_str is provided but invalid format.
+    Only a plain --today fetches the pages without a date, the page of a day
+    of --range or --week is always the page of that day.
     """
-    if custom_date_str:
-        # Custom date provided
-        try:
-            return datetime.strptime(custom_date_str, "%Y-%m-%d").date()
-        except ValueError:
-            logger.error(f"Invalid date format: {custom_date_str}. Expected YYYY-MM-DD")
-            raise ValueError(
-                f"Invalid date format: {custom_date_str}. Expected YYYY-MM-DD"
-            )
-
-    # Use --today flag or default to next workday
-    today = date.today()
-    if use_today:
-        return today
+    return not use_today or bool(date_range) or week
 
-    # Calculate next workday (skip to Monday if Friday)
-    return today + pd.DateOffset(days=1 if today.weekday() != 4 else 3)
 
-
-def parse_arguments():
+def parse_arguments(argv: list[str] | None = None):
     """Parse command line arguments."""
     parser = argparse.ArgumentParser(
         description="Mensabot - Fetch vegetarian/vegan menu items from SV restaurants",
@@ -175,6 +43,9 @@ Examples:
   %(prog)s --date 2026-02-15              # Get menu for a specific date
   %(prog)s --debug --no-download          # Debug mode with existing files
   %(prog)s --date 2026-02-12 --debug      # Get menu for specific date in debug mode
+  %(prog)s --week                         # Get the menus of the whole week
+  %(prog)s --range 2026-02-02 2026-02-13  # Get the menus of every workday in a range
+  %(prog)s serve --help                   # Fetch and post on schedules, see serve
         """,
     )
 
@@ -191,6 +62,23 @@ Examples:
         help="Don't download new HTML files, use existing ones",
     )
 
+    parser.add_argument(
+        "--no-cache",
+        dest="no_cache",
+        action="store_true",
+        help="Always parse the HTML files, even if they were already parsed",
+    )
+
+    parser.add_argument(
+        "--skip-unchanged",
+        dest="skip_unchanged",
+        action="store_true",
+        help=(
+            "Stop without parsing, saving or posting when no page changed since "
+            "the last fetch, for refresh runs during the day"
+        ),
+    )
+
     parser.add_argument(
         "--today",
         action="store_true",
@@ -204,6 +92,21 @@ Examples:
         help="Specify a custom date (YYYY-MM-DD format). Overrides --today if provided",
     )
 
+    parser.add_argument(
+        "--range",
+        dest="date_range",
+        nargs=2,
+        metavar=("START", "END"),
+        default=None,
+        help="Get the menus of every workday from START to END (YYYY-MM-DD format)",
+    )
+
+    parser.add_argument(
+        "--week",
+        action="store_true",
+        help="Get the menus of the Monday to Friday week of the target date",
+    )
+
     parser.add_argument(
         "--work-dir",
         type=str,
@@ -211,6 +114,91 @@ Examples:
         help="Working directory for storing menu data (default: %(default)s)",
     )
 
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="Number of pages downloaded at the same time (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--parse-workers",
+        dest="parse_workers",
+        type=int,
+        default=None,
+        help="Number of processes parsing the pages (default: one per cpu for many pages)",
+    )
+
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        default=DEFAULT_DEADLINE,
+        help=(
+            "Maximum time for downloading all the pages, including the retries, "
+            "in seconds (default: %(default)s)"
+        ),
+    )
+
+    parser.add_argument(
+        "--timeout",
+        dest="timeouts",
+        action="append",
+        default=[],
+        metavar="[RESTAURANT=]SECONDS",
+        help=(
+            "Maximum time of one attempt to download a page, for all the "
+            "restaurants or only one (repeatable)"
+        ),
+    )
+
+    parser.add_argument(
+        "--no-circuit-breaker",
+        dest="circuit_breaker",
+        action="store_false",
+        help=(
+            "Also download the restaurants skipped because they failed in "
+            "several runs in a row"
+        ),
+    )
+
+    parser.add_argument(
+        "--allow-domain",
+        dest="allow_domains",
+        action="append",
+        default=[],
+        metavar="DOMAIN",
+        help=(
+            "Domain the browser may load resources from, besides the page's "
+            "own domain and the menu API (repeatable)"
+        ),
+    )
+
+    parser.add_argument(
+        "--load-all-resources",
+        dest="load_all_resources",
+        action="store_true",
+        help="Let the browser load the images, fonts and third-party resources",
+    )
+
+    parser.add_argument(
+        "--store",
+        choices=["csv", "parquet"],
+        default="csv",
+        help=(
+            "Save the menus as csv files per restaurant and day, or in the "
+            "parquet archive of the work directory (default: %(default)s)"
+        ),
+    )
+
+    parser.add_argument(
+        "--snapshots",
+        action="store_true",
+        help=(
+            "Also keep the downloaded pages in the compressed snapshot store of "
+            "the work directory, see mensabot.snapshots"
+        ),
+    )
+
     parser.add_argument(
         "--log-level",
         "--log",
@@ -220,17 +208,123 @@ Examples:
         help="Set logging level (default: %(default)s)",
     )
 
-    return parser.parse_args()
+    parser.add_argument(
+        "--log-format",
+        dest="log_format",
+        choices=["text", "json"],
+        default="text",
+        help=(
+            "Format of the logs, json for one object per line with the timings "
+            "of the stages as fields (default: %(default)s)"
+        ),
+    )
+
+    parser.add_argument(
+        "--metrics-file",
+        dest="metrics_file",
+        type=Path,
+        default=None,
+        help=(
+            "Write the timings of the stages and the counters of the run to "
+            "this file, in the Prometheus text format"
+        ),
+    )
+
+    parser.add_argument(
+        "--import-time",
+        dest="import_time",
+        action="store_true",
+        help="Run with python -X importtime and show the slowest imports",
+    )
+
+    return parser.parse_args(argv)
 
 
-if __name__ == "__main__":
+def report_import_times(argv: list[str], top: int = IMPORT_TIME_TOP) -> int:
+    """
+    Run mensabot again with ``python -X importtime`` and report its imports.
+
+    The output of the run is shown as usual, followed by the total time of
+    the run, the time spent importing and the slowest top level imports.
+
+    Args:
+        argv: Arguments of the run, --import-time is removed from them.
+        top: Number of imports shown.
+
+    Returns:
+        The exit code of the run.
+    """
+    argv = [arg for arg in argv if arg != "--import-time"]
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "mensabot", *argv],
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+
+    # Lines like "import time:  self [us] | cumulative | imported package",
+    # the nested imports are indented under the module importing them
+    imports = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:"):
+            sys.stderr.write(line + "\n")
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if cumulative.strip().isdigit() and not name.startswith("  "):
+            imports.append((int(cumulative), name.strip()))
+
+    total = sum(cumulative for cumulative, _ in imports)
+    print(f"Run: {elapsed * 1000:.0f} ms, imports: {total / 1000:.0f} ms")
+    for cumulative, name in sorted(imports, reverse=True)[:top]:
+        print(f"{cumulative / 1000:8.1f} ms  {name}")
+    return process.returncode
+
+
+def main(argv: list[str] | None = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["serve"]:
+        # The daemon, see mensabot.serve
+        from .serve import main as serve_main
+
+        return serve_main(argv[1:], prog="mensabot serve")
+    # Checked before parsing, so that the time of --help can be measured too
+    if "--import-time" in argv:
+        sys.exit(report_import_times(argv))
+
     # Parse command line arguments
-    args = parse_arguments()
+    args = parse_arguments(argv)
+
+    from .metrics import METRICS, configure_logging, span
 
     # Configure logging based on arguments
-    logging.basicConfig(
-        level=getattr(logging, args.log_level),
-        format="%(asctime)s - %(levelname)s - %(message)s",
+    configure_logging(args.log_level, args.log_format)
+
+    try:
+        with span("run"):
+            run(args)
+    finally:
+        # Also when the run failed, to see where
+        METRICS.set_gauge("last_run_timestamp_seconds", time.time())
+        logger.info("Run metrics", extra={"metrics": METRICS.summary()})
+        if args.metrics_file is not None:
+            METRICS.write_prometheus(args.metrics_file)
+
+
+def run(args: argparse.Namespace):
+    """Fetch, parse, save and post the menus as given by the arguments."""
+    from .cache import ParseCache, get_cache_dir
+    from .delivery import get_mattermost_webhook_urls, send_mattermost_message
+    from .fetcher import CircuitBreaker, fetch_all, make_route_policy
+    from .formatting import format_message, format_sections
+    from .pipeline import (
+        RESTAURANT_URIS,
+        determine_target_date,
+        determine_target_days,
+        make_fetch_jobs,
+        parse_jobs,
+        parse_timeouts,
+        save_menus,
     )
 
     # Configuration from arguments
@@ -243,8 +337,14 @@ if __name__ == "__main__":
         custom_date_str=args.date, use_today=args.today
     )
 
-    # Append date to URI only if we're not using today's date (i.e., for next workday or custom date)
-    append_date_to_uri = not args.today
+    # All the days to process, only day_to_download without --range or --week
+    days = determine_target_days(
+        day_to_download, date_range=args.date_range, week=args.week
+    )
+    if not days:
+        raise ValueError("No workday to process in the given range")
+
+    append_date_to_uri = should_append_date(args.today, args.date_range, args.week)
 
     # Print configuration in debug mode
     if debug:
@@ -252,83 +352,135 @@ if __name__ == "__main__":
         logger.info(f"Work directory: {work_dir}")
         logger.info(f"Debug mode: {debug}")
         logger.info(f"Download new files: {download}")
-        logger.info(f"Date to process: {day_to_download.strftime('%Y-%m-%d')}")
+        logger.info(f"Dates to process: {[d.strftime('%Y-%m-%d') for d in days]}")
         logger.info(f"Append date to URI: {append_date_to_uri}")
         logger.info(f"Log level: {args.log_level}")
         logger.info("===============================")
 
-    uris = {
-        "Empa": "https://sv-restaurant.ch/menu/Empa-EAWAG,%20D%C3%BCbendorf/Mittagsmen%C3%BC%20Fire",
-        "Eawag": "https://sv-restaurant.ch/menu/Empa-EAWAG,%20D%C3%BCbendorf/Lunch%20Aqa",
-        "Amag": "https://sv-restaurant.ch/menu/AMAG,%20D%C3%BCbendorf/Mittagsmen%C3%BC",
-        "Memphis": "https://sv-restaurant.ch/menu/Memphis,%20D%C3%BCbendorf/Lunch",
-    }
+    uris = RESTAURANT_URIS
 
-    mensa_files = []
+    menus = []
 
     errors = []
 
-    for restaurant, uri in uris.items():
-        save_path = work_dir / restaurant
+    # The menus are saved in the background while the message is built
+    persist_executor = ThreadPoolExecutor(max_workers=1)
+    persist_futures = {}
+
+    # All the (restaurant, day) pages go through the same fetch and parse
+    jobs = make_fetch_jobs(
+        work_dir,
+        days,
+        uris=uris,
+        append_date_to_uri=append_date_to_uri,
+        timeouts=parse_timeouts(args.timeouts, list(uris)),
+    )
+
+    cache = None if args.no_cache else ParseCache(get_cache_dir(work_dir))
+
+    if download:
+        # All the pages are fetched at once
+        results = fetch_all(
+            jobs,
+            concurrency=args.concurrency,
+            route_policy=make_route_policy(
+                args.allow_domains, load_all=args.load_all_resources
+            ),
+            deadline=args.deadline,
+            # Persisted over the runs, so that a site down for a while does
+            # not slow down every run
+            breaker=(
+                CircuitBreaker(work_dir / "circuit_breaker.json")
+                if args.circuit_breaker
+                else None
+            ),
+        )
+        fetch_errors = {result.job: result.error for result in results if not result.ok}
+        unchanged = {
+            result.job for result in results if result.ok and not result.changed
+        }
+        if args.snapshots:
+            from .snapshots import SnapshotStore, get_snapshot_dir
+
+            snapshots = SnapshotStore(get_snapshot_dir(work_dir))
+            for result in results:
+                if result.ok and result.changed:
+                    snapshots.put(
+                        result.job.restaurant,
+                        result.job.day,
+                        result.job.file.read_bytes(),
+                    )
+    else:
+        fetch_errors = {}
+        unchanged = set()
+
+    if (
+        args.skip_unchanged
+        and download
+        and len(unchanged) + len(fetch_errors) == len(jobs)
+    ):
+        for job, error in fetch_errors.items():
+            logger.error(
+                f"Error processing {job.restaurant} menu of {job.day}: {error}"
+            )
+        logger.info("No menu changed since the last fetch, nothing to post")
+        return
 
-        raw_html = save_path / "raw_html"
-        raw_html.mkdir(exist_ok=True, parents=True)
-        cleaned_csv_dir = save_path / "menus"
-        cleaned_csv_dir.mkdir(exist_ok=True, parents=True)
+    parse_results = parse_jobs(
+        [job for job in jobs if job not in fetch_errors],
+        cache=cache,
+        workers=args.parse_workers,
+    )
+    parse_results = {result.job: result for result in parse_results}
 
-        file = raw_html / f"menu_{day_to_download.strftime('%Y-%m-%d')}.html"
+    for job in jobs:
+        restaurant = job.restaurant
+        day = job.day
 
         try:
-            if download:
-                if append_date_to_uri:
-                    uri = uri + "/date/" + day_to_download.strftime("%Y-%m-%d")
-                try:
-                    download_html(uri, file)
-                except Exception as e:
-                    logger.error(f"Error downloading {restaurant} menu: {e}")
-                    # try again (sometimes connexion fails)
-                    download_html(uri, file)
-            df = read_menus(file, date=day_to_download)
+            if job in fetch_errors:
+                raise fetch_errors[job]
+            result = parse_results[job]
+            if not result.ok:
+                raise result.error
+            df = result.menus
         except Exception as e:
-            logger.error(f"Error processing {restaurant} menu: {e}")
+            logger.error(f"Error processing {restaurant} menu of {day}: {e}")
             if debug:
                 raise e
-            errors.append(f"Error processing {restaurant} menu: {e}")
+            errors.append(f"Error processing {restaurant} menu of {day}: {e}")
             continue
 
         logger.info(f"Parsed DataFrame:\n{df}")
 
-        df["restaurant"] = restaurant
+        menus.append(df)
 
-        # Save the data
-        mensa_file = (
-            cleaned_csv_dir / f"menu_{day_to_download.strftime('%Y-%m-%d')}.csv"
+        # Save the data, the saved menus of an unchanged page are up to date
+        if args.skip_unchanged and job in unchanged:
+            continue
+        persist_futures[(restaurant, day)] = persist_executor.submit(
+            save_menus, work_dir, restaurant, day, df, store=args.store
         )
-        mensa_files.append(mensa_file)
-        df.to_csv(mensa_file, index=False)
 
+    sections = []
     try:
-        # Read the dataframes
-        df = pd.concat([pd.read_csv(mensa_file) for mensa_file in mensa_files])
-
-        # Select only the vegetarian and vegan options
-        df_veg = df[(df["vegetarian"] == True) | (df["vegan"] == True)].copy(deep=True)
+        sections = format_sections(menus, days, uris=uris)
 
-        df_md = format_as_markdown(df_veg, uris=uris)
-
-        logger.info(f"Formatted DataFrame for Mattermost:\n{df_md}")
+        logger.info(f"Formatted DataFrame for Mattermost:\n{sections}")
     except Exception as e:
         logger.error(f"Error processing the dataframes: {e}")
 
         if debug:
             raise e
         errors.append(f"Error processing the dataframes: {e}")
-        df_md = "No data available"
+        sections = [f"# {days[0].strftime('%A %d %B')} \n\nNo data available"]
 
-    error_md = (
-        "\n\n ## Errors when processing data" + "\n".join(errors) if errors else ""
-    )
-    text = f"# {day_to_download.strftime('%A %d %B')} \n\n{df_md}{error_md}"
+    persist_executor.shutdown(wait=True)
+    for saved, future in persist_futures.items():
+        if future.exception() is not None:
+            logger.error(f"Error saving {saved}: {future.exception()}")
+
+    text = format_message(sections, errors)
 
     if debug:
         logger.info(f"Debug mode - Message content:\n{text}")
@@ -336,5 +488,9 @@ if __name__ == "__main__":
         logger.info("Message was not sent to Mattermost (debug mode enabled)")
         logger.info("To send the actual message, run without --debug flag")
     else:
-        url = get_mattermost_webhook_url(work_dir / "mattermost_url.txt")
-        send_mattermost_message(url=url, text=text)
+        urls = get_mattermost_webhook_urls(work_dir / "mattermost_url.txt")
+        send_mattermost_message(urls=urls, text=text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,450 @@
+"""
+HTTP API serving the parsed menus.
+
+The menus of each day are loaded from the saved menus (or pushed by the
+daemon when it fetches them) and kept in memory with an index of the
+filterable columns. The responses are rendered once per query, the files
+are read again at most every minute::
+
+    GET /menus?date=2025-08-01&vegan=1&max_co2=0.8&restaurant=Eawag
+    GET /menus?format=markdown
+    GET /health
+    GET /metrics
+
+Run it alone with::
+
+    python -m mensabot.api --port 8080
+
+or next to the daemon with ``python -m mensabot.serve --api-port 8080``.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from .formatting import format_as_markdown
+from .metrics import METRICS
+from .pipeline import RESTAURANT_URIS, load_saved_menus
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8080
+
+# Number of rendered responses kept in memory
+RESPONSE_CACHE_SIZE = 256
+
+# Seconds after which the menus of a day are read again from the disk, to
+# see the menus saved by other processes
+DEFAULT_MAX_AGE = 60.0
+
+# Limits of the requests, larger ones are rejected
+MAX_HEADER_LINES = 100
+MAX_LINE_BYTES = 8192
+MAX_BODY_BYTES = 65536
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Content Too Large",
+    500: "Internal Server Error",
+}
+
+_FLAGS = ("vegan", "vegetarian", "glutenfree")
+_FORMATS = ("json", "markdown")
+_PATHS = ("/menus", "/health", "/metrics")
+
+
+class _DayIndex:
+    """Menus of one day, with the masks and JSON of its rows precomputed."""
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df.reset_index(drop=True)
+        self.masks = {flag: self.df[flag].to_numpy(dtype=bool) for flag in _FLAGS}
+        self.co2 = self.df["co2_footprint"].to_numpy(dtype=float)
+        self.restaurants = {
+            restaurant: (self.df["restaurant"] == restaurant).to_numpy(dtype=bool)
+            for restaurant in self.df["restaurant"].unique()
+        }
+        records = self.df.astype(object).where(self.df.notna(), None)
+        self.rows_json = [
+            json.dumps(record, ensure_ascii=False)
+            for record in records.to_dict(orient="records")
+        ]
+
+    def select(
+        self,
+        flags: list[str],
+        max_co2: float | None,
+        restaurants: list[str] | None,
+    ) -> np.ndarray:
+        """Positions of the rows matching all the filters."""
+        mask = np.ones(len(self.df), dtype=bool)
+        for flag in flags:
+            mask &= self.masks[flag]
+        if max_co2 is not None:
+            # Menus without CO2 value are excluded (NaN comparisons are False)
+            mask &= self.co2 <= max_co2
+        if restaurants is not None:
+            selected = np.zeros(len(self.df), dtype=bool)
+            for restaurant in restaurants:
+                if restaurant in self.restaurants:
+                    selected |= self.restaurants[restaurant]
+            mask &= selected
+        return np.flatnonzero(mask)
+
+
+class MenuIndex:
+    """
+    In-memory menus by day, loaded from the saved menus on first use.
+
+    Not thread-safe: only `load_day` can run in another thread, its result
+    is stored with `set_day`.
+
+    Args:
+        work_dir: Working directory with the saved menus.
+        store: How the menus are saved, see `save_menus`.
+        uris: Menu page of each restaurant, for the markdown links.
+        max_age: Seconds after which the menus of a day are loaded again.
+    """
+
+    def __init__(
+        self,
+        work_dir: Path,
+        store: str = "csv",
+        uris: dict[str, str] = RESTAURANT_URIS,
+        max_age: float = DEFAULT_MAX_AGE,
+    ):
+        self.work_dir = Path(work_dir)
+        self.store = store
+        self.uris = uris
+        self.max_age = max_age
+        # Index and load time of each day
+        self._days: dict[date, tuple[_DayIndex, float]] = {}
+        self._responses = OrderedDict()
+
+    def needs_load(self, day: date) -> bool:
+        """Whether the menus of the day have to be read from the disk."""
+        return (
+            day not in self._days
+            or time.monotonic() - self._days[day][1] > self.max_age
+        )
+
+    def load_day(self, day: date) -> _DayIndex:
+        """Read the menus of a day from the disk, without storing them."""
+        return _DayIndex(load_saved_menus(self.work_dir, day, self.store))
+
+    def set_day(
+        self, day: date, index: _DayIndex, loaded_at: float | None = None
+    ) -> None:
+        """
+        Store the menus of a day and drop its rendered responses.
+
+        Args:
+            day: Day of the menus.
+            index: The menus, see `load_day`.
+            loaded_at: Time (`time.monotonic`) the load of the menus started.
+                They are not stored if the day was updated since then.
+        """
+        if loaded_at is None:
+            loaded_at = time.monotonic()
+        elif day in self._days and self._days[day][1] > loaded_at:
+            return
+        self._days[day] = (index, loaded_at)
+        for key in [key for key in self._responses if key[0] == day]:
+            del self._responses[key]
+
+    def get_day(self, day: date) -> _DayIndex:
+        if self.needs_load(day):
+            self.set_day(day, self.load_day(day))
+        return self._days[day][0]
+
+    def update(self, restaurant: str, day: date, df: pd.DataFrame) -> None:
+        """
+        Replace the menus of a restaurant for a day, e.g. after a fetch.
+
+        The menus must already be saved: a day that is not in memory is not
+        read here, but from the disk on its next query.
+        """
+        if self.needs_load(day):
+            self._days.pop(day, None)
+            return
+        current = self._days[day][0].df
+        df = df.assign(restaurant=restaurant)
+        others = current[current["restaurant"] != restaurant]
+        menus = pd.concat([others, df], ignore_index=True) if len(others) else df
+        self.set_day(day, _DayIndex(menus[current.columns]))
+
+    def query(
+        self,
+        day: date,
+        flags: list[str] = [],
+        max_co2: float | None = None,
+        restaurants: list[str] | None = None,
+        format: str = "json",
+    ) -> bytes:
+        """
+        Render the menus of a day matching the filters.
+
+        Args:
+            day: Day of the menus.
+            flags: Only the menus having all these labels, of "vegan",
+                "vegetarian" and "glutenfree".
+            max_co2: Only the menus with at most this CO2 footprint, in kg.
+            restaurants: Only the menus of these restaurants.
+            format: "json" for a list of menus, or "markdown" for the table
+                of the Mattermost messages.
+
+        Returns:
+            The body of the response, in UTF-8.
+        """
+        index = self.get_day(day)
+        key = (
+            day,
+            tuple(sorted(flags)),
+            max_co2,
+            tuple(sorted(restaurants)) if restaurants is not None else None,
+            format,
+        )
+        if key in self._responses:
+            self._responses.move_to_end(key)
+            return self._responses[key]
+
+        positions = index.select(flags, max_co2, restaurants)
+        if format == "markdown":
+            body = format_as_markdown(index.df.iloc[positions], uris=self.uris)
+        else:
+            body = "[" + ",".join(index.rows_json[i] for i in positions) + "]"
+        body = body.encode()
+
+        self._responses[key] = body
+        if len(self._responses) > RESPONSE_CACHE_SIZE:
+            self._responses.popitem(last=False)
+        return body
+
+
+def _parse_bool(value: str) -> bool:
+    if value.lower() in ("1", "true", "yes"):
+        return True
+    if value.lower() in ("0", "false", "no"):
+        return False
+    raise ValueError(f"Invalid boolean '{value}'")
+
+
+def parse_query(query: str) -> dict:
+    """
+    Read the parameters of a /menus request.
+
+    Raises:
+        ValueError: If a parameter is invalid.
+    """
+    params = parse_qs(query)
+    unknown = set(params) - {"date", "restaurant", "max_co2", "format", *_FLAGS}
+    if unknown:
+        raise ValueError(f"Unknown parameters {sorted(unknown)}")
+
+    day_str = params.get("date", ["today"])[-1]
+    day = (
+        date.today()
+        if day_str == "today"
+        else datetime.strptime(day_str, "%Y-%m-%d").date()
+    )
+    format = params.get("format", ["json"])[-1]
+    if format not in _FORMATS:
+        raise ValueError(f"Unknown format {format}, expected one of {_FORMATS}")
+    max_co2 = float(params["max_co2"][-1]) if "max_co2" in params else None
+
+    return {
+        "day": day,
+        "flags": [flag for flag in _FLAGS if _parse_bool(params.get(flag, ["0"])[-1])],
+        "max_co2": max_co2,
+        "restaurants": params.get("restaurant"),
+        "format": format,
+    }
+
+
+class MenuApi:
+    """
+    Minimal HTTP/1.1 server of the menus, with keep-alive connections.
+
+    Args:
+        index: The menus to serve.
+    """
+
+    def __init__(self, index: MenuIndex):
+        self.index = index
+        self.requests = 0
+
+    async def _load(self, day: date) -> None:
+        # Reading the saved menus blocks, keep the other connections served.
+        # The index itself is only changed in the event loop.
+        if self.index.needs_load(day):
+            loaded_at = time.monotonic()
+            day_index = await asyncio.to_thread(self.index.load_day, day)
+            self.index.set_day(day, day_index, loaded_at)
+
+    async def respond(self, method: str, target: str) -> tuple[int, str, bytes]:
+        """Status, content type and body of the response to a request."""
+        url = urlsplit(target)
+        if url.path not in _PATHS:
+            return 404, "application/json", b'{"error":"not found"}'
+        if method not in ("GET", "HEAD"):
+            return 405, "application/json", b'{"error":"method not allowed"}'
+        if url.path == "/health":
+            return 200, "application/json", b'{"status":"ok"}'
+        if url.path == "/metrics":
+            # The timings and counters of this process, e.g. of the daemon
+            return 200, PROMETHEUS_CONTENT_TYPE, METRICS.to_prometheus().encode()
+
+        try:
+            query = parse_query(url.query)
+        except ValueError as e:
+            return 400, "application/json", json.dumps({"error": str(e)}).encode()
+
+        await self._load(query["day"])
+        body = self.index.query(**query)
+        if query["format"] == "markdown":
+            return 200, "text/markdown; charset=utf-8", body
+        return 200, "application/json", body
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve the requests of a connection until it is closed."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                if len(request_line) > MAX_LINE_BYTES:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+
+                headers = {}
+                for _ in range(MAX_HEADER_LINES):
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip().lower()
+
+                connection = headers.get("connection", "")
+                keep_alive = (
+                    connection != "close"
+                    if version == "HTTP/1.1"
+                    else connection == "keep-alive"
+                )
+
+                # The bodies are not used, but read so that the next request
+                # of the connection starts after them
+                error = None
+                length = headers.get("content-length", "0")
+                if "transfer-encoding" in headers or not length.isdigit():
+                    error = 400, b'{"error":"invalid body"}'
+                elif int(length) > MAX_BODY_BYTES:
+                    error = 413, b'{"error":"body too large"}'
+                elif int(length):
+                    await reader.readexactly(int(length))
+
+                if error is not None:
+                    # The end of the body is unknown, the connection is closed
+                    keep_alive = False
+                    (status, body), content_type = error, "application/json"
+                else:
+                    try:
+                        status, content_type, body = await self.respond(method, target)
+                    except Exception as e:
+                        logger.exception(f"Error serving {target}: {e}")
+                        status, content_type, body = 500, "application/json", b"{}"
+                self.requests += 1
+
+                head = (
+                    f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                )
+                writer.write(head.encode() + (body if method != "HEAD" else b""))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT):
+        """Start listening, returns the :class:`asyncio.Server`."""
+        server = await asyncio.start_server(self.handle, host, port)
+        logger.info(f"Serving the menus on http://{host}:{port}")
+        return server
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Mensabot - HTTP API of the saved menus",
+    )
+
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Address to listen on (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=DEFAULT_PORT,
+        help="Port to listen on (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--work-dir",
+        type=str,
+        default=Path.home() / ".mensabot",
+        help="Working directory with the menu data (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--store",
+        choices=["csv", "parquet"],
+        default="csv",
+        help="How the menus are saved (default: %(default)s)",
+    )
+
+    return parser.parse_args()
+
+
+async def _serve_forever(api: MenuApi, host: str, port: int) -> None:
+    server = await api.start(host, port)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+
+    api = MenuApi(MenuIndex(Path(args.work_dir), store=args.store))
+    try:
+        asyncio.run(_serve_forever(api, args.host, args.port))
+    except KeyboardInterrupt:
+        logger.info("Stopped")
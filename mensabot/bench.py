@@ -0,0 +1,467 @@
+"""
+Benchmarks of the menu parsing and formatting.
+
+Times `read_menus`, `iter_menu_items`, `find_labels`, `extract_co2_value` and
+`format_as_markdown` on the html fixtures of the tests and on synthetic
+pages with many products, and reports the peak memory of each case.
+
+Run with::
+
+    python -m mensabot.bench
+
+With ``--fetch``, the browser fetch of a local copy of a menu page is timed
+with and without blocking its images, fonts and third-party resources
+(needs the playwright browsers).
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import re
+import threading
+import time
+import tracemalloc
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from .fetcher import FetchJob, RoutePolicy, fetch_all_async
+from .formatting import format_as_markdown
+from .labels import extract_co2_value
+from .parser import (
+    _get_parser,
+    find_labels,
+    iter_menu_items,
+    read_menus,
+)
+
+logger = logging.getLogger(__name__)
+
+# Html fixtures of the tests, only available in a source checkout
+DEFAULT_DATA_DIR = Path(__file__).parent.parent / "tests" / "data"
+
+# Number of products of the synthetic pages
+DEFAULT_SIZES = (100, 1_000, 10_000)
+
+BENCH_DATE = date(2025, 8, 1)
+
+# A case is not run again once it has used this time, in seconds
+TIME_BUDGET = 2.0
+
+# Delay of the resources of the local test site, like a remote CDN, in seconds
+ASSET_DELAY = 0.2
+
+_EXTERNAL_URL = re.compile(r"https://([a-z0-9.-]+)/")
+
+_PRODUCT_TEMPLATE = """\
+<app-category class="grid-row ng-star-inserted"><h3 class="h3 category-header"> \
+Category {i} </h3><app-product-list class="ng-star-inserted"><div \
+appclickablearea="" class="product-wrapper ng-star-inserted"><div layout="row">\
+<div flex=""><div layout-gt-sm="row"><div class="name-column pad-right-sm \
+pad-bottom-sm"><button class="button-reset link-reset"><span class="pre-wrap \
+legacy-text-xxl">Menu {i}</span></button><div class="product-teaser push-top-xs \
+ng-star-inserted"> mit Quinoa, Falafel und Zucchetti | Tagessalat und 1dl Saft \
+</div></div><div class="allergen-column ng-star-inserted"><app-product-label-list>\
+<div class="label-list customtag-list ng-star-inserted"><app-product-custom-tag>\
+<img src="https://files.qnips.com/releaseicons/vegan.png" title="Vegan" \
+alt="Vegan"></app-product-custom-tag><app-product-custom-tag><img \
+src="https://files.qnips.com/releaseicons/glutenfrei.png" title="Glutenfrei" \
+alt="Glutenfrei"></app-product-custom-tag><img class="mat-mdc-tooltip-trigger" \
+src="https://files.qnips.com/releaseratinglabels/co2.png" alt="CO₂ CO₂-Wert" \
+aria-describedby="cdk-describedby-message-{i}"></div></app-product-label-list>\
+</div><div class="price-column legacy-text-lg text-right pad-left-sm"><div \
+class="price ng-star-inserted"> &nbsp;CHF&nbsp;{price:.2f} </div></div></div>\
+</div></div></div></app-product-list></app-category>"""
+
+_TOOLTIP_TEMPLATE = (
+    '<div id="cdk-describedby-message-{i}" role="tooltip">'
+    "The CO₂ value of this menu is {co2:.1f} kg CO₂e.</div>"
+)
+
+
+def make_synthetic_page(n_products: int) -> str:
+    """Html page in the old menu format with `n_products` products."""
+    products = "".join(
+        _PRODUCT_TEMPLATE.format(i=i, price=10 + i % 10) for i in range(n_products)
+    )
+    tooltips = "".join(
+        _TOOLTIP_TEMPLATE.format(i=i, co2=0.1 * (i % 20)) for i in range(n_products)
+    )
+    return (
+        "<html><head><title>Menu</title></head><body>"
+        f'<div class="category-grid ng-star-inserted">{products}</div>'
+        '<div class="cdk-describedby-message-container cdk-visually-hidden">'
+        f"{tooltips}</div></body></html>"
+    )
+
+
+def _timeit(func, repeat: int) -> float:
+    """Best wall-clock time of up to `repeat` calls of `func`, in seconds."""
+    best = float("inf")
+    total = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        total += elapsed
+        if total > TIME_BUDGET:
+            break
+    return best
+
+
+def _peak_memory(func) -> int:
+    """Peak memory allocated during a call of `func`, in bytes."""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def bench_case(name: str, case: str, func, repeat: int) -> dict:
+    """Time a function and measure its peak memory."""
+    result = {
+        "name": name,
+        "case": case,
+        "seconds": _timeit(func, repeat),
+        "peak_bytes": _peak_memory(func),
+    }
+    logger.info(
+        f"{name:<20} {case:<28} {result['seconds'] * 1000:10.2f} ms "
+        f"{result['peak_bytes'] / 1024:10.0f} KiB"
+    )
+    return result
+
+
+def bench_debug_logging(file: Path, engine: str = "auto", repeat: int = 20) -> dict:
+    """
+    Time `read_menus` with the parser logs at INFO and at DEBUG level.
+
+    At DEBUG the parser serializes the html of every item for the logs, at
+    INFO it must not do any of that work. The records go to a null handler
+    so only the cost of building them is measured.
+
+    Returns:
+        The best time in seconds for each log level.
+    """
+    parser_logger = logging.getLogger("mensabot.parser")
+    previous_level = parser_logger.level
+    previous_propagate = parser_logger.propagate
+    null_handler = logging.NullHandler()
+    parser_logger.addHandler(null_handler)
+    parser_logger.propagate = False
+    try:
+        timings = {}
+        for level in ("INFO", "DEBUG"):
+            parser_logger.setLevel(level)
+            timings[level] = _timeit(
+                lambda: read_menus(file, date=BENCH_DATE, engine=engine), repeat
+            )
+    finally:
+        parser_logger.removeHandler(null_handler)
+        parser_logger.setLevel(previous_level)
+        parser_logger.propagate = previous_propagate
+    return timings
+
+
+class _SiteHandler(BaseHTTPRequestHandler):
+    """
+    Serve the menu page on /, and a delayed dummy body for the other paths.
+
+    The number of requests and of bytes served are counted on the server.
+    """
+
+    page: bytes = b""
+
+    def do_GET(self):
+        if self.path == "/":
+            body = self.page
+        else:
+            time.sleep(ASSET_DELAY)
+            body = b"\0" * 4096
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.bytes += len(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def bench_fetch(file: Path, work_dir: Path, repeat: int = 3) -> list[dict]:
+    """
+    Time the browser fetch of a local copy of a menu page.
+
+    The page is served on 127.0.0.1, its images, fonts, scripts and
+    trackers are served delayed on localhost, which is a third-party domain
+    for the page. The page is fetched loading all its resources and with
+    the default blocking of :class:`mensabot.fetcher.RoutePolicy`.
+
+    Returns:
+        For each policy, the best time in seconds and the requests and bytes
+        served per fetch.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SiteHandler)
+    server.lock = threading.Lock()
+    port = server.server_port
+    html = file.read_text(encoding="utf-8")
+    # All the external resources of the saved page go to the local site
+    _SiteHandler.page = _EXTERNAL_URL.sub(
+        lambda m: f"http://localhost:{port}/{m.group(1)}/", html
+    ).encode("utf-8")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    job = FetchJob("bench", f"http://127.0.0.1:{port}/", work_dir / "fetched.html")
+    results = []
+    try:
+        for case, policy in [("load all", None), ("blocking", RoutePolicy())]:
+            server.requests = server.bytes = 0
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                (fetched,) = asyncio.run(
+                    fetch_all_async([job], retries=0, route_policy=policy)
+                )
+                times.append(time.perf_counter() - start)
+                if not fetched.ok:
+                    raise fetched.error
+            result = {
+                "name": "fetch_all_async",
+                "case": case,
+                "seconds": min(times),
+                "requests": server.requests / repeat,
+                "bytes": server.bytes / repeat,
+            }
+            logger.info(
+                f"{'fetch_all_async':<20} {case:<28} "
+                f"{result['seconds'] * 1000:10.2f} ms "
+                f"{result['requests']:6.0f} requests {result['bytes'] / 1024:8.0f} KiB"
+            )
+            results.append(result)
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def run_benchmarks(
+    data_dir: Path,
+    work_dir: Path,
+    sizes=DEFAULT_SIZES,
+    engine: str = "auto",
+    repeat: int = 10,
+) -> list[dict]:
+    """
+    Run all the benchmarks.
+
+    Args:
+        data_dir: Directory with the html fixtures.
+        work_dir: Directory where the synthetic pages are written.
+        sizes: Number of products of the synthetic pages.
+        engine: Parser engine used.
+        repeat: Maximum number of runs of each case, the best is kept.
+
+    Returns:
+        One result per case, with its best time and peak memory.
+    """
+    pages = {file.name: file for file in sorted(data_dir.glob("*.html"))}
+    for size in sizes:
+        file = work_dir / f"synthetic_{size}.html"
+        file.write_text(make_synthetic_page(size), encoding="utf-8")
+        pages[f"synthetic_{size}"] = file
+
+    parse = _get_parser(engine)
+    results = []
+    for case, file in pages.items():
+        df = read_menus(file, date=BENCH_DATE, engine=engine)
+        results.append(
+            bench_case(
+                "read_menus",
+                case,
+                lambda: read_menus(file, date=BENCH_DATE, engine=engine),
+                repeat,
+            )
+        )
+
+        # Time to the first item, what a consumer of the stream waits for
+        results.append(
+            bench_case(
+                "iter_menu_items[0]",
+                case,
+                lambda: next(
+                    iter_menu_items(file, date=BENCH_DATE, engine=engine), None
+                ),
+                repeat,
+            )
+        )
+
+        # Label classification alone, on the images of the already parsed page
+        images = []
+        tooltips = None
+        for raw_item, tooltips in parse(file):
+            images.extend(raw_item.images)
+        results.append(
+            bench_case(
+                "find_labels",
+                case,
+                lambda: [find_labels(img, tooltips) for img in images],
+                repeat,
+            )
+        )
+
+        df["restaurant"] = "Empa"
+        results.append(
+            bench_case(
+                "format_as_markdown",
+                case,
+                lambda: format_as_markdown(df, uris={"Empa": "https://example.com"}),
+                repeat,
+            )
+        )
+
+    for size in (1, *sizes):
+        texts = [
+            f"co2-wert the co₂ value of this menu is {0.1 * (i % 20):.1f} kg co₂e."
+            for i in range(size)
+        ]
+        # The regexes alone, extract_co2_value is memoized and the texts of
+        # the CO2 values of a page repeat
+        results.append(
+            bench_case(
+                "extract_co2_value",
+                f"{size} texts",
+                lambda: [extract_co2_value.__wrapped__(text) for text in texts],
+                repeat,
+            )
+        )
+
+        def extract_cached():
+            # Each run starts cold, like the parsing of a new page
+            extract_co2_value.cache_clear()
+            return [extract_co2_value(text) for text in texts]
+
+        results.append(
+            bench_case(
+                "extract_co2_value[cached]", f"{size} texts", extract_cached, repeat
+            )
+        )
+
+    return results
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Mensabot - Parser benchmarks",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s                                # Run all the benchmarks
+  %(prog)s --sizes 100 1000               # Smaller synthetic pages
+  %(prog)s --output bench.json            # Save the results to compare runs
+  %(prog)s --debug-logging                # Cost of the parser debug logs
+  %(prog)s --fetch                        # Browser fetch with and without blocking
+        """,
+    )
+
+    parser.add_argument(
+        "--data-dir",
+        type=Path,
+        default=DEFAULT_DATA_DIR,
+        help="Directory with the html fixtures (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--work-dir",
+        type=Path,
+        default=Path.home() / ".mensabot" / "bench",
+        help="Directory for the synthetic pages (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="*",
+        default=list(DEFAULT_SIZES),
+        help="Number of products of the synthetic pages (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--engine",
+        default="auto",
+        help="Parser engine to benchmark (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=10,
+        help="Maximum number of runs, the best one is reported (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help="Write the results as JSON to this file",
+    )
+
+    parser.add_argument(
+        "--debug-logging",
+        dest="debug_logging",
+        action="store_true",
+        help="Only compare read_menus with the parser logs at INFO and DEBUG",
+    )
+
+    parser.add_argument(
+        "--fetch",
+        action="store_true",
+        help="Only time the browser fetch of a local copy of a menu page",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    # The parser logs every page, keep the output to the results
+    logging.getLogger("mensabot.parser").setLevel(logging.WARNING)
+
+    if args.debug_logging:
+        file = args.data_dir / "menu_with_co2.html"
+        timings = bench_debug_logging(file, engine=args.engine, repeat=args.repeat)
+        print(f"read_menus({file.name}, engine={args.engine!r})")
+        for level, seconds in timings.items():
+            print(f"  logs at {level:<5}: {seconds * 1000:8.2f} ms")
+    elif args.fetch:
+        args.work_dir.mkdir(exist_ok=True, parents=True)
+        results = bench_fetch(
+            args.data_dir / "menu_default.html", args.work_dir, repeat=args.repeat
+        )
+        if args.output is not None:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+    else:
+        args.work_dir.mkdir(exist_ok=True, parents=True)
+        logger.info(f"{'benchmark':<20} {'case':<28} {'time':>13} {'peak memory':>14}")
+        results = run_benchmarks(
+            args.data_dir,
+            args.work_dir,
+            sizes=args.sizes,
+            engine=args.engine,
+            repeat=args.repeat,
+        )
+        if args.output is not None:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+            logger.info(f"Results written to {args.output}")
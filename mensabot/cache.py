@@ -0,0 +1,127 @@
+"""
+Cache of the parsed menus, keyed by the content of the html.
+
+A page that did not change since the last run (or that is read again with
+--no-download) is not parsed again. The cache lives in
+`<work_dir>/parse_cache` and the least recently used entries are removed
+when it grows over its size limit.
+"""
+
+import hashlib
+import logging
+import os
+import time
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+
+from .metrics import count
+from .parser import PARSER_VERSION, read_menus
+
+logger = logging.getLogger(__name__)
+
+# Maximum size of the cache directory, in bytes
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+
+
+def get_cache_dir(work_dir: Path) -> Path:
+    return Path(work_dir) / "parse_cache"
+
+
+def _touch(path: Path) -> None:
+    """Mark the entry as used now, its modification time orders the evictions."""
+    # The clock of the file system can be too coarse to order close accesses
+    now = time.time_ns()
+    os.utime(path, ns=(now, now))
+
+
+class ParseCache:
+    """
+    DataFrames returned by `read_menus`, stored as pickle files on disk.
+
+    Args:
+        cache_dir: Directory of the cache files.
+        max_bytes: When the files use more than this, the least recently
+            used ones are deleted.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(html_content: bytes, date: date) -> str:
+        """Key of the menus parsed from the html for the date."""
+        digest = hashlib.sha256()
+        digest.update(f"{PARSER_VERSION}\n{date.isoformat()}\n".encode())
+        digest.update(html_content)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.pkl"
+
+    def get(self, key: str) -> pd.DataFrame | None:
+        path = self._path(key)
+        try:
+            df = pd.read_pickle(path)
+        except FileNotFoundError:
+            self.misses += 1
+            count("parse_cache_misses")
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache file {path}: {e}")
+            self.misses += 1
+            count("parse_cache_misses")
+            return None
+        _touch(path)
+        self.hits += 1
+        count("parse_cache_hits")
+        return df
+
+    def put(self, key: str, df: pd.DataFrame) -> None:
+        self.cache_dir.mkdir(exist_ok=True, parents=True)
+        path = self._path(key)
+        # Write to a temporary file so readers never see a partial file
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        df.to_pickle(tmp_path)
+        tmp_path.replace(path)
+        _touch(path)
+        self.evict()
+
+    def evict(self) -> None:
+        """Delete the least recently used entries above the size limit."""
+        entries = []
+        for path in self.cache_dir.glob("*.pkl"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            logger.debug(f"Evicted {path} from the parse cache")
+
+
+def read_menus_cached(
+    file: Path, date: date, cache: ParseCache, engine: str = "auto"
+) -> pd.DataFrame:
+    """Same as `read_menus`, but reuse the result if the html was already parsed."""
+    with open(file, "rb") as f:
+        key = cache.make_key(f.read(), date)
+
+    df = cache.get(key)
+    if df is not None:
+        logger.info(f"Using cached menus of {file}")
+        return df
+
+    df = read_menus(file, date=date, engine=engine)
+    cache.put(key, df)
+    return df
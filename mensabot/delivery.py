@@ -0,0 +1,326 @@
+"""
+Delivery of the messages to Mattermost.
+"""
+
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
+
+from .fetcher import backoff_delay, make_session
+from .metrics import count, span
+
+if TYPE_CHECKING:
+    import requests
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of characters of a post, the default of the Mattermost server
+MAX_MESSAGE_LENGTH = 16383
+
+# Number of retries of a post rejected with 429 or 503, or failing to connect
+DELIVERY_RETRIES = 4
+
+# Timeout of a post, in seconds
+POST_TIMEOUT = 10
+
+# Longest wait asked by a Retry-After header that is honoured, in seconds
+MAX_RETRY_AFTER = 60
+
+# Number of webhooks posted to at the same time
+DEFAULT_DELIVERY_CONCURRENCY = 4
+
+_URL_SEPARATORS = re.compile(r"[\s,]+")
+
+
+class DeliveryError(Exception):
+    """A message could not be posted to a webhook."""
+
+
+@dataclass
+class DeliveryResult:
+    """Outcome of the delivery of a message to a webhook."""
+
+    url: str
+    parts: int = 0
+    error: Exception | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def get_mattermost_webhook_urls(url_file: Path) -> list[str]:
+    """
+    Get the Mattermost webhook URLs from environment variable or file.
+
+    Several webhooks, one per channel, are separated by whitespace or commas
+    in the variable and written one per line in the file.
+    """
+    text = os.environ.get("MATTERMOST_WEBHOOK_URL")
+    if text is None:
+        if not url_file.is_file():
+            raise ValueError(
+                f"Mattermost webhook URL not found in environment variable "
+                f"MATTERMOST_WEBHOOK_URL or file {url_file}"
+            )
+        text = url_file.read_text()
+    urls = [url for url in _URL_SEPARATORS.split(text) if url]
+    if not urls:
+        raise ValueError("No Mattermost webhook URL given")
+    return urls
+
+
+def get_mattermost_webhook_url(url_file: Path) -> str:
+    """
+    Get the Mattermost webhook URL, kept for the callers of a single webhook.
+
+    Only the first webhook is returned, see `get_mattermost_webhook_urls`.
+    """
+    urls = get_mattermost_webhook_urls(url_file)
+    if len(urls) > 1:
+        logger.warning(
+            f"{len(urls)} Mattermost webhooks given, only the first one is used"
+        )
+    return urls[0]
+
+
+def _redact(url: str) -> str:
+    """The url without the secret key of the webhook, for the logs."""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}/…"
+
+
+def _split_block(block: str, max_length: int) -> list[str]:
+    """Split a block longer than max_length at its lines."""
+    lines = block.split("\n")
+    # The rows of a table continue under its header
+    header = []
+    table_start = next(
+        (i for i, line in enumerate(lines) if line.startswith("|")), len(lines)
+    )
+    if table_start + 1 < len(lines) and lines[table_start + 1].startswith("|"):
+        header = lines[table_start : table_start + 2]
+
+    parts = []
+    current = []
+    for line in lines:
+        while len(line) > max_length:
+            # A line too long for a post on its own is cut
+            if current:
+                parts.append("\n".join(current))
+            current = []
+            parts.append(line[:max_length])
+            line = line[max_length:]
+        if current and len("\n".join(current + [line])) > max_length:
+            parts.append("\n".join(current))
+            current = []
+            if line.startswith("|") and len("\n".join(header + [line])) <= max_length:
+                current = header.copy()
+        current.append(line)
+    if current:
+        parts.append("\n".join(current))
+    return parts
+
+
+def split_message(text: str, max_length: int = MAX_MESSAGE_LENGTH) -> list[str]:
+    """
+    Split a message into posts of at most max_length characters.
+
+    The message is split between its paragraphs, then between the lines of
+    a paragraph too long, repeating the header of a table in each post.
+
+    Args:
+        text: Message, e.g. built by `format_message`.
+        max_length: Maximum number of characters of a post.
+
+    Returns:
+        The posts, in order.
+    """
+    if len(text) <= max_length:
+        return [text]
+
+    blocks = []
+    for block in text.split("\n\n"):
+        if len(block) > max_length:
+            blocks.extend(_split_block(block, max_length))
+        else:
+            blocks.append(block)
+
+    parts = []
+    current = ""
+    for block in blocks:
+        candidate = f"{current}\n\n{block}" if current else block
+        if len(candidate) > max_length:
+            parts.append(current)
+            candidate = block
+        current = candidate
+    parts.append(current)
+    return parts
+
+
+def _retry_after(response: "requests.Response") -> float | None:
+    """Delay asked by the Retry-After header, in seconds or as a date."""
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            delay = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(delay, 0.0), MAX_RETRY_AFTER)
+
+
+def _post(
+    session: "requests.Session", url: str, text: str, retries: int, timeout: float
+) -> None:
+    """
+    Post a message, retrying the requests that were surely not posted.
+
+    A post is not idempotent: a 5xx answer or a read timeout can come after
+    Mattermost accepted the post, retrying it would post it twice. Only the
+    connection errors, the rate limited requests (429) and the 503 with a
+    Retry-After are retried.
+    """
+    import requests
+
+    for attempt in range(retries + 1):
+        delay = None
+        try:
+            response = session.post(url, json={"text": text}, timeout=timeout)
+        except requests.ConnectionError as e:
+            error = e
+        else:
+            if response.status_code == 200:
+                return
+            error = DeliveryError(
+                f"Expected status code 200, got {response.status_code}"
+            )
+            delay = _retry_after(response)
+            if response.status_code != 429 and not (
+                response.status_code == 503 and delay is not None
+            ):
+                # The request is wrong (e.g. an unknown webhook) or may have
+                # been posted
+                raise error
+
+        if attempt < retries:
+            delay = backoff_delay(attempt) if delay is None else delay
+            count("post_retries")
+            logger.warning(
+                f"Error posting to {_redact(url)} (attempt {attempt + 1}/"
+                f"{retries + 1}): {error}, retrying in {delay:.1f} s"
+            )
+            time.sleep(delay)
+    raise error
+
+
+def _deliver(
+    session: "requests.Session",
+    url: str,
+    parts: list[str],
+    retries: int,
+    timeout: float,
+) -> DeliveryResult:
+    result = DeliveryResult(url)
+    # The parts of a message are posted in order
+    for part in parts:
+        try:
+            _post(session, url, part, retries, timeout)
+        except Exception as e:
+            logger.error(f"Error posting to {_redact(url)}: {e}")
+            result.error = e
+            break
+        result.parts += 1
+    count("posts", outcome="ok" if result.ok else "error")
+    return result
+
+
+def send_messages(
+    urls: list[str],
+    text: str,
+    concurrency: int = DEFAULT_DELIVERY_CONCURRENCY,
+    session: "requests.Session | None" = None,
+    retries: int = DELIVERY_RETRIES,
+    timeout: float = POST_TIMEOUT,
+    max_length: int = MAX_MESSAGE_LENGTH,
+) -> list[DeliveryResult]:
+    """
+    Post a message to several Mattermost webhooks at the same time.
+
+    A message too long for a post is split, see `split_message`. The posts
+    rejected with 429, or 503 with a Retry-After header, are retried after
+    the delay asked by the header, the connection errors with exponential
+    backoff. The other errors are not retried, see `_post`.
+
+    Args:
+        urls: Webhooks to post to.
+        text: Message to post.
+        concurrency: Maximum number of webhooks posted to at the same time.
+        session: Session to use, a new pooled one is created if not given.
+        retries: Number of retries of a failed post.
+        timeout: Timeout of a post, in seconds.
+        max_length: Maximum number of characters of a post.
+
+    Returns:
+        One result per webhook, in the same order as the urls.
+    """
+    if not urls:
+        return []
+
+    parts = split_message(text, max_length)
+    own_session = session is None
+    if own_session:
+        session = make_session(concurrency)
+    try:
+        with span("post"):
+            with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+                return list(
+                    executor.map(
+                        lambda url: _deliver(session, url, parts, retries, timeout),
+                        urls,
+                    )
+                )
+    finally:
+        if own_session:
+            session.close()
+
+
+def send_mattermost_message(
+    urls: str | list[str] | None = None,
+    text: str | None = None,
+    url: str | None = None,
+) -> None:
+    """
+    Post a message to one or several Mattermost webhooks.
+
+    Args:
+        urls: The webhook URL, or a list of them.
+        text: The message.
+        url: Former name of `urls`, still accepted.
+
+    Raises:
+        DeliveryError: If the message could not be posted to a webhook, once
+            it was posted to the others.
+    """
+    if url is not None:
+        urls = url
+    if urls is None or text is None:
+        raise TypeError("send_mattermost_message() needs the webhook urls and text")
+    if isinstance(urls, str):
+        urls = [urls]
+    failed = [result for result in send_messages(urls, text) if not result.ok]
+    if failed:
+        raise DeliveryError(
+            f"Could not post to {len(failed)} of {len(urls)} webhooks: "
+            f"{failed[0].error}"
+        )
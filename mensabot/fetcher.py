@@ -0,0 +1,572 @@
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import time
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
+
+from .metrics import count, span
+
+# requests and playwright are slow to import, they are only imported by the
+# functions using them
+if TYPE_CHECKING:
+    import requests
+
+logger = logging.getLogger(__name__)
+
+# Element that appears once the menu has been rendered by the page's JS
+MENU_SELECTOR = ".category-grid"
+
+# Products of the menu, in the old and the new format of the pages
+PRODUCT_SELECTOR = f"{MENU_SELECTOR} .product-wrapper, {MENU_SELECTOR} .product-card"
+
+# The menu is ready once its number of products did not change for this
+# time, in seconds
+STABLE_INTERVAL = 0.25
+
+# Maximum time of a page rendered in the browser, in seconds
+RENDER_TIMEOUT = 30
+
+# Requests of the browser that the menu does not need: the label icons,
+# fonts, media and analytics are not loaded
+BLOCKED_RESOURCE_TYPES = frozenset({"image", "media", "font"})
+
+# Domains (with their subdomains) the pages can load from, besides the
+# domain of the page itself. The menus are served by the qnips API.
+DEFAULT_ALLOWED_DOMAINS = ("sv-restaurant.ch", "qnips.com")
+
+# Number of pages fetched at the same time
+DEFAULT_CONCURRENCY = 4
+
+# Delay before the first retry of a failed page, doubled at each retry up to
+# BACKOFF_MAX, in seconds. The actual delay is drawn uniformly below it.
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 10.0
+
+# Maximum time of the fetch of all the pages of a run, in seconds
+DEFAULT_DEADLINE = 180
+
+# A restaurant whose fetch failed in this many runs in a row is skipped
+# until CIRCUIT_COOLDOWN seconds have passed
+CIRCUIT_THRESHOLD = 3
+CIRCUIT_COOLDOWN = 6 * 3600
+
+
+@dataclass(frozen=True)
+class FetchJob:
+    """
+    A menu page to fetch and the file where its html is saved.
+
+    `timeout` is the maximum time of one attempt of the fetch, in seconds,
+    RENDER_TIMEOUT by default.
+    """
+
+    restaurant: str
+    uri: str
+    file: Path
+    day: date | None = None
+    timeout: float | None = None
+
+
+@dataclass
+class FetchResult:
+    """
+    Outcome of a :class:`FetchJob`, with the error if the fetch failed.
+
+    `changed` is False when the page is the same as the last time it was
+    fetched, its file was then left untouched.
+    """
+
+    job: FetchJob
+    error: Exception | None = None
+    changed: bool = True
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class CircuitOpenError(Exception):
+    """The restaurant is skipped after failing in several runs in a row."""
+
+
+def backoff_delay(
+    attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_MAX
+) -> float:
+    """
+    Delay before retrying after the `attempt`-th failure (from 0), in seconds.
+
+    Exponential backoff with full jitter, so that the retries of several
+    pages failing together are spread out.
+    """
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def _expiry(deadline: float | None) -> float | None:
+    """Monotonic time at which a deadline in seconds from now expires."""
+    return None if deadline is None else time.monotonic() + deadline
+
+
+def _remaining(expires: float | None) -> float | None:
+    return None if expires is None else expires - time.monotonic()
+
+
+def _attempt_timeout(timeout: float, expires: float | None) -> float:
+    """Timeout of an attempt, shortened to the time left before `expires`."""
+    if expires is None:
+        return timeout
+    return min(timeout, expires - time.monotonic())
+
+
+class CircuitBreaker:
+    """
+    Failures of the restaurants over the runs, persisted in a json file.
+
+    A restaurant failing in `threshold` runs in a row is skipped for
+    `cooldown` seconds. After that it is tried again, a success closes the
+    circuit while a failure skips it for another `cooldown`.
+
+    Args:
+        path: File of the state of the circuits.
+        threshold: Number of failed runs in a row opening the circuit.
+        cooldown: Time during which an open circuit skips the restaurant.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        threshold: int = CIRCUIT_THRESHOLD,
+        cooldown: float = CIRCUIT_COOLDOWN,
+    ):
+        self.path = Path(path)
+        self.threshold = threshold
+        self.cooldown = cooldown
+        try:
+            self.state: dict[str, dict] = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            self.state = {}
+
+    def check(self, restaurant: str, now: float | None = None) -> None:
+        """
+        Raises:
+            CircuitOpenError: If the restaurant has to be skipped.
+        """
+        circuit = self.state.get(restaurant, {})
+        now = time.time() if now is None else now
+        if circuit.get("open_until", 0) > now:
+            raise CircuitOpenError(
+                f"{restaurant} skipped after {circuit['failures']} failed runs, "
+                f"tried again in {(circuit['open_until'] - now) / 60:.0f} min"
+            )
+
+    def record(self, restaurant: str, ok: bool, now: float | None = None) -> None:
+        """Record the outcome of the fetch of a restaurant in this run."""
+        if ok:
+            self.state.pop(restaurant, None)
+            return
+        now = time.time() if now is None else now
+        circuit = self.state.setdefault(restaurant, {"failures": 0})
+        circuit["failures"] += 1
+        if circuit["failures"] >= self.threshold:
+            circuit["open_until"] = now + self.cooldown
+            logger.warning(
+                f"{restaurant} failed in {circuit['failures']} runs in a row, "
+                f"skipping it for {self.cooldown / 3600:.1f} h"
+            )
+
+    def record_results(self, results: list["FetchResult"]) -> None:
+        """
+        Record the results of a run and save the state.
+
+        A restaurant fails the run if none of its pages could be fetched,
+        the skipped restaurants are not counted again.
+        """
+        outcomes = {}
+        for result in results:
+            if isinstance(result.error, CircuitOpenError):
+                continue
+            outcomes[result.job.restaurant] = (
+                outcomes.get(result.job.restaurant, False) or result.ok
+            )
+        for restaurant, ok in outcomes.items():
+            self.record(restaurant, ok)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self.path.write_text(json.dumps(self.state, indent=2))
+
+
+def get_validators_file(job: FetchJob) -> Path:
+    """File with the validators of the last fetch, next to the html file."""
+    return job.file.with_suffix(".validators.json")
+
+
+def load_validators(job: FetchJob) -> dict[str, str]:
+    """
+    Validators of the last fetch of the job.
+
+    This is the "sha256" of the saved html. It is only valid for the same
+    uri and while the html file exists, otherwise an empty dict is returned.
+    """
+    if not job.file.is_file():
+        return {}
+    try:
+        validators = json.loads(get_validators_file(job).read_text())
+    except (OSError, ValueError):
+        return {}
+    if validators.get("uri") != job.uri:
+        return {}
+    return validators
+
+
+def save_content(job: FetchJob, content: str) -> bool:
+    """
+    Save the fetched html of the job, unless it did not change.
+
+    Args:
+        job: The fetched job.
+        content: Html of the page.
+
+    Returns:
+        Whether the content differs from the last saved one.
+    """
+    data = content.encode("utf-8")
+    count("fetched_bytes", len(data), restaurant=job.restaurant)
+    digest = hashlib.sha256(data).hexdigest()
+    changed = load_validators(job).get("sha256") != digest
+
+    job.file.parent.mkdir(exist_ok=True, parents=True)
+    if changed:
+        with open(job.file, "w", encoding="utf-8") as f:
+            f.write(content)
+        logger.info(f"Downloaded content from {job.uri} to {job.file}")
+    else:
+        logger.info(f"The {job.restaurant} menu did not change since the last fetch")
+
+    get_validators_file(job).write_text(json.dumps({"uri": job.uri, "sha256": digest}))
+    return changed
+
+
+def _in_domain(host: str, domain: str) -> bool:
+    return host == domain or host.endswith(f".{domain}")
+
+
+@dataclass(frozen=True)
+class RoutePolicy:
+    """
+    Requests of the browser that are let through while a page is rendered.
+
+    Args:
+        blocked_types: Playwright resource types that are always blocked.
+        allowed_domains: Domains, with their subdomains, that the page can
+            load from. The domain of the page is always allowed, the
+            requests to any other domain are blocked.
+    """
+
+    blocked_types: frozenset[str] = BLOCKED_RESOURCE_TYPES
+    allowed_domains: tuple[str, ...] = DEFAULT_ALLOWED_DOMAINS
+
+    def allows(self, url: str, resource_type: str, page_url: str) -> bool:
+        """Whether a request of the page is let through."""
+        if resource_type in self.blocked_types:
+            return False
+        host = urlsplit(url).hostname
+        # data: and blob: urls do not go to the network
+        if host is None:
+            return True
+        page_host = urlsplit(page_url).hostname or ""
+        return _in_domain(host, page_host) or any(
+            _in_domain(host, domain) for domain in self.allowed_domains
+        )
+
+
+DEFAULT_ROUTE_POLICY = RoutePolicy()
+
+
+def make_route_policy(
+    allowed_domains: list[str] = [], load_all: bool = False
+) -> RoutePolicy | None:
+    """
+    Route policy of the command line options.
+
+    Args:
+        allowed_domains: Domains allowed besides :data:`DEFAULT_ALLOWED_DOMAINS`.
+        load_all: Do not block any request, returns None.
+    """
+    if load_all:
+        return None
+    return RoutePolicy(allowed_domains=(*DEFAULT_ALLOWED_DOMAINS, *allowed_domains))
+
+
+async def _wait_for_products(page, timeout: float) -> int:
+    """
+    Wait until the menu is rendered and its list of products is stable.
+
+    A menu whose number of products stays at 0 is ready as well, e.g. on a
+    holiday.
+
+    Returns:
+        The number of products of the menu.
+    """
+    await page.wait_for_selector(
+        MENU_SELECTOR, state="attached", timeout=timeout * 1000
+    )
+    products = page.locator(PRODUCT_SELECTOR)
+    n_products = await products.count()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        await asyncio.sleep(STABLE_INTERVAL)
+        previous, n_products = n_products, await products.count()
+        if n_products == previous:
+            break
+    return n_products
+
+
+async def _render_page(
+    browser, job: FetchJob, policy: RoutePolicy | None, timeout: float
+) -> str:
+    """Open the uri in a fresh browser context and return the rendered html."""
+    context = await browser.new_context()
+    try:
+        if policy is not None:
+
+            async def route(route):
+                request = route.request
+                if policy.allows(request.url, request.resource_type, job.uri):
+                    await route.continue_()
+                else:
+                    await route.abort()
+
+            await context.route("**/*", route)
+
+        page = await context.new_page()
+        logger.info(f"Acessing {job.uri}")
+        # The menu is rendered by the page's JS, the other resources of the
+        # page are not waited for
+        start = time.monotonic()
+        with span("goto", restaurant=job.restaurant):
+            await page.goto(
+                job.uri, wait_until="domcontentloaded", timeout=timeout * 1000
+            )
+
+        try:
+            with span("wait_for_menu", restaurant=job.restaurant):
+                products = await _wait_for_products(
+                    page, timeout - (time.monotonic() - start)
+                )
+            logger.debug(f"{products} products rendered on {job.uri}")
+        except Exception as e:
+            logger.warning(f"Menu not found on {job.uri}: {e}")
+            await page.screenshot(path=job.file.parent / "debug.png", full_page=True)
+        return await page.content()
+    finally:
+        await context.close()
+
+
+async def _fetch_job(
+    browser,
+    job: FetchJob,
+    semaphore: asyncio.Semaphore,
+    retries: int,
+    policy: RoutePolicy | None,
+    expires: float | None,
+) -> FetchResult:
+    for attempt in range(retries + 1):
+        try:
+            async with semaphore:
+                timeout = _attempt_timeout(job.timeout or RENDER_TIMEOUT, expires)
+                if timeout <= 0:
+                    return FetchResult(
+                        job, error=TimeoutError(f"Deadline reached before {job.uri}")
+                    )
+                content = await asyncio.wait_for(
+                    _render_page(browser, job, policy, timeout), timeout
+                )
+            break
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                e = TimeoutError(f"No menu from {job.uri} after {timeout:.0f} s")
+            logger.error(f"Error downloading {job.restaurant} menu: {e}")
+            if attempt == retries:
+                return FetchResult(job, error=e)
+            # Try again later, sometimes the connexion fails. The sleep ends by
+            # the deadline, the attempt after it then fails at once.
+            delay = backoff_delay(attempt)
+            remaining = _remaining(expires)
+            if remaining is not None:
+                delay = max(0.0, min(delay, remaining))
+            logger.info(f"Retrying {job.restaurant} menu in {delay:.1f} s")
+            await asyncio.sleep(delay)
+
+    # The server sends no validators, only the content tells if it changed
+    return FetchResult(job, changed=save_content(job, content))
+
+
+async def fetch_all_async(
+    jobs: list[FetchJob],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    retries: int = 1,
+    browser=None,
+    route_policy: RoutePolicy | None = DEFAULT_ROUTE_POLICY,
+    deadline: float | None = None,
+) -> list[FetchResult]:
+    """
+    Fetch all the jobs in a single headless browser.
+
+    Each job gets its own browser context, at most `concurrency` pages are
+    loaded at the same time.
+
+    Args:
+        jobs: The pages to fetch.
+        concurrency: Maximum number of pages open at the same time.
+        retries: Number of times a failed page is tried again.
+        browser: An already running browser to use. If not given, a browser
+            is launched for these jobs and closed at the end.
+        route_policy: Requests of the pages that are let through, None to
+            load all the resources of the pages.
+        deadline: Time in seconds after which no page is fetched or retried
+            anymore, the pages not fetched by then fail.
+
+    Returns:
+        One result per job, in the same order as the jobs.
+    """
+    if not jobs:
+        return []
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    expires = _expiry(deadline)
+
+    async def fetch_jobs(browser) -> list[FetchResult]:
+        results = await asyncio.gather(
+            *(
+                _fetch_job(browser, job, semaphore, retries, route_policy, expires)
+                for job in jobs
+            )
+        )
+        return list(results)
+
+    if browser is not None:
+        return await fetch_jobs(browser)
+
+    from playwright.async_api import async_playwright
+
+    async with async_playwright() as p:
+        with span("browser_launch"):
+            browser = await p.chromium.launch(headless=True)
+        try:
+            return await fetch_jobs(browser)
+        finally:
+            await browser.close()
+
+
+def make_session(pool_size: int = DEFAULT_CONCURRENCY) -> "requests.Session":
+    """Create a session keeping the connections to the hosts alive."""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+async def fetch_async(
+    jobs: list[FetchJob],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    retries: int = 1,
+    browser=None,
+    route_policy: RoutePolicy | None = DEFAULT_ROUTE_POLICY,
+    deadline: float | None = None,
+    breaker: CircuitBreaker | None = None,
+) -> list[FetchResult]:
+    """
+    Fetch all the jobs in the browser, from a running event loop.
+
+    The restaurants that are open in the circuit breaker are not fetched.
+
+    Args:
+        jobs: The pages to fetch.
+        concurrency: Maximum number of pages fetched at the same time.
+        retries: Number of times a page failing in the browser is tried again.
+        browser: A running browser, see `fetch_all_async`.
+        route_policy: Requests of the pages let through by the browser, see
+            `fetch_all_async`.
+        deadline: Time in seconds for the whole fetch, including the
+            retries.
+        breaker: Skips the restaurants failing run after run, and records
+            the results of this run.
+
+    Returns:
+        One result per job, in the same order as the jobs.
+    """
+    results: list[FetchResult | None] = [None] * len(jobs)
+    if breaker is not None:
+        for i, job in enumerate(jobs):
+            try:
+                breaker.check(job.restaurant)
+            except CircuitOpenError as e:
+                logger.warning(str(e))
+                results[i] = FetchResult(job, error=e)
+    todo = [i for i, result in enumerate(results) if result is None]
+
+    with span("fetch"):
+        fetched = await fetch_all_async(
+            [jobs[i] for i in todo],
+            concurrency=concurrency,
+            retries=retries,
+            browser=browser,
+            route_policy=route_policy,
+            deadline=deadline,
+        )
+    for i, result in zip(todo, fetched):
+        results[i] = result
+    for result in results:
+        outcome = "changed" if result.changed else "unchanged"
+        count(
+            "fetches",
+            restaurant=result.job.restaurant,
+            outcome=outcome if result.ok else "error",
+        )
+
+    if breaker is not None:
+        breaker.record_results(results)
+    return results
+
+
+def fetch_all(
+    jobs: list[FetchJob],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    retries: int = 1,
+    route_policy: RoutePolicy | None = DEFAULT_ROUTE_POLICY,
+    deadline: float | None = None,
+    breaker: CircuitBreaker | None = None,
+) -> list[FetchResult]:
+    """
+    Fetch all the jobs in a new browser, see `fetch_async`.
+
+    Returns:
+        One result per job, in the same order as the jobs.
+    """
+    return asyncio.run(
+        fetch_async(
+            jobs,
+            concurrency=concurrency,
+            retries=retries,
+            route_policy=route_policy,
+            deadline=deadline,
+            breaker=breaker,
+        )
+    )
+
+
+def download_html(uri: str, file: Path) -> Path:
+    """Download a single page, raising the error if the fetch failed."""
+    file = Path(file)
+    (result,) = fetch_all([FetchJob(restaurant=uri, uri=uri, file=file)], retries=0)
+    if not result.ok:
+        raise result.error
+    return file
@@ -0,0 +1,228 @@
+import logging
+import math
+import re
+from collections.abc import Iterator
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+try:
+    from wcwidth import wcswidth
+except ImportError:  # wcwidth is optional, the width is the number of characters
+    wcswidth = None
+
+from .metrics import span
+
+logger = logging.getLogger(__name__)
+
+# Columns of the menus shown in the message, with their header
+MARKDOWN_COLUMNS = {
+    "restaurant": "Restaurant",
+    "price": "Price",
+    "vegan": "Vegan",
+    "glutenfree": "Glutenfree",
+    "title": "Title",
+    "description": "Description",
+    "co2_footprint": "kg CO2eq",
+}
+
+YES = "✔️"
+NO = "❌"
+
+# Space around the headers, like the "github" format of tabulate
+_HEADER_PADDING = 2
+
+_WORD = re.compile(r"(\w+)")
+
+
+def parse_price(price_str: str | float | None) -> str:
+    """Depending on the price, return a formatted string."""
+    if isinstance(price_str, float):
+        # Prices parsed by read_menus, missing ones are NaN
+        return "N/A" if math.isnan(price_str) else f"*{price_str:.2f}*"
+
+    try:
+        price_str = str(price_str).strip()
+    except Exception as e:
+        logger.error(f"Error parsing price: {e}")
+        return "N/A"
+
+    try:
+        price_float = float(price_str)
+    except ValueError:
+        logger.error(f"Error converting price to float: {price_str}")
+        return "N/A"
+
+    # Format the price string
+    return f"*{price_float:.2f}*"
+
+
+def _format_co2(value: float) -> str:
+    """Round to 2 decimals, then drop the trailing zeros."""
+    return format(float(f"{value:.2f}"), "g") if pd.notnull(value) else ""
+
+
+def _decimals(text: str) -> int:
+    """Number of characters after the decimal point, -1 for integers."""
+    if not text or "." not in text and "e" not in text:
+        return -1
+    pos = text.rfind(".")
+    if pos < 0:
+        pos = text.rfind("e")
+    return len(text) - pos - 1
+
+
+def _map_unique(column: pd.Series, func) -> pd.Series:
+    """Apply `func` once per distinct value of the column."""
+    table = {value: func(value) for value in column.unique()}
+    return column.map(table)
+
+
+def _text_width(column: pd.Series) -> np.ndarray:
+    """Display width of each string of the column."""
+    widths = column.str.len().to_numpy(dtype=np.int64, copy=True)
+    if wcswidth is not None:
+        # Wide characters (e.g. emojis) use two columns of the terminal
+        wide = ~column.str.isascii().to_numpy(dtype=bool)
+        widths[wide] = [wcswidth(text) for text in column[wide]]
+    return widths
+
+
+def iter_markdown_table(
+    headers: list[str], columns: list[pd.Series], numeric: list[bool]
+) -> Iterator[str]:
+    """
+    Write a markdown table line by line.
+
+    The columns are padded to a common width, like the "github" format of
+    tabulate. Numeric columns are right aligned, with their decimal points
+    aligned, the others are left aligned.
+
+    Args:
+        headers: The header of each column.
+        columns: The cells of each column, as strings.
+        numeric: Whether each column is numeric.
+
+    Yields:
+        The lines of the table, without line breaks.
+    """
+    header_widths = _text_width(pd.Series(headers, dtype=object))
+
+    cells = []
+    widths = []
+    for header_width, column, is_numeric in zip(header_widths, columns, numeric):
+        column = column.astype(object).reset_index(drop=True)
+        if is_numeric:
+            decimals = _map_unique(column, _decimals).to_numpy()
+            column = column + pd.Series(
+                [" " * n for n in decimals.max(initial=-1) - decimals], dtype=object
+            )
+        cell_widths = _text_width(column)
+        width = max(cell_widths.max(initial=0), header_width + _HEADER_PADDING)
+        padding = pd.Series([" " * n for n in width - cell_widths], dtype=object)
+        cells.append(padding + column if is_numeric else column + padding)
+        widths.append(width)
+
+    header_cells = []
+    for header, header_width, width, is_numeric in zip(
+        headers, header_widths, widths, numeric
+    ):
+        padding = " " * (width - header_width)
+        header_cells.append(padding + header if is_numeric else header + padding)
+
+    yield "| " + " | ".join(header_cells) + " |"
+    yield "|" + "|".join("-" * (width + 2) for width in widths) + "|"
+    if cells:
+        rows = cells[0].str.cat(cells[1:], sep=" | ") if len(cells) > 1 else cells[0]
+        for row in rows:
+            yield f"| {row} |"
+
+
+def format_as_markdown(df: pd.DataFrame, uris: dict[str, str] = {}) -> str:
+    """
+    Format the menus as a markdown table for Mattermost.
+
+    Every column is transformed at once, the values that repeat (restaurants,
+    prices, CO2 values) are formatted once each.
+
+    Args:
+        df: Menus as returned by `read_menus`, with a restaurant column.
+        uris: Menu page of each restaurant, to link the restaurant names.
+
+    Returns:
+        The table, one row per menu item.
+    """
+    df = df.reset_index(drop=True)
+
+    def text(column: str) -> pd.Series:
+        # Python strings, so that \w also matches the non ASCII letters
+        return df[column].fillna("").astype(str).astype(object).str.strip()
+
+    # Link the restaurant to its menu page
+    links = {restaurant: f"[{restaurant}]({uri})" for restaurant, uri in uris.items()}
+    restaurant = text("restaurant")
+    restaurant = restaurant.map(links).fillna(restaurant)
+
+    co2 = _map_unique(df["co2_footprint"].astype(float), _format_co2)
+
+    columns = {
+        "restaurant": restaurant,
+        # Format price with 2 decimal places (enforce for the markdown transformation)
+        "price": _map_unique(df["price"], parse_price),
+        "vegan": pd.Series(np.where(df["vegan"].astype(bool), YES, NO), dtype=object),
+        "glutenfree": pd.Series(
+            np.where(df["glutenfree"].astype(bool), YES, NO), dtype=object
+        ),
+        # Put every word of the title in bold
+        "title": text("title").str.replace(_WORD, r"**\1**", regex=True),
+        "description": text("description"),
+        "co2_footprint": co2.astype(object),
+    }
+    numeric = [name == "co2_footprint" and (co2 != "").any() for name in columns]
+
+    lines = iter_markdown_table(
+        list(MARKDOWN_COLUMNS.values()), list(columns.values()), numeric
+    )
+    return "\n".join(lines)
+
+
+def format_sections(
+    menus: list[pd.DataFrame], days: list[date], uris: dict[str, str] = {}
+) -> list[str]:
+    """
+    Format the vegetarian and vegan menus as one markdown section per day.
+
+    Args:
+        menus: Menus as returned by `read_menus`, with a restaurant column.
+        days: Days of the sections. With several days, the days without
+            menus are skipped.
+        uris: Menu page of each restaurant, to link the restaurant names.
+
+    Returns:
+        The sections, with the day as title.
+    """
+    # Combine the dataframes, they are kept in memory with their dtypes
+    df = pd.concat(menus)
+
+    # Select only the vegetarian and vegan options
+    df_veg = df[(df["vegetarian"] == True) | (df["vegan"] == True)].copy(deep=True)
+
+    # One table per day
+    sections = []
+    for day in days:
+        df_day = df_veg[df_veg["date"] == day.strftime("%Y-%m-%d")]
+        if len(days) > 1 and df_day.empty:
+            continue
+        with span("format"):
+            df_md = format_as_markdown(df_day, uris=uris)
+        sections.append(f"# {day.strftime('%A %d %B')} \n\n{df_md}")
+    return sections
+
+
+def format_message(sections: list[str], errors: list[str] = []) -> str:
+    """Join the sections and the errors of the run into the message."""
+    error_md = (
+        "\n\n ## Errors when processing data" + "\n".join(errors) if errors else ""
+    )
+    return "\n\n".join(sections) + error_md
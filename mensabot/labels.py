@@ -0,0 +1,110 @@
+"""
+Classification of the label icons of the menu items.
+
+The labels are given by the alt and title attributes of the icons. Each
+label is matched by its precompiled regex, and as the same icons are on
+every page the result is memoized per (alt, title).
+
+New labels are added with `register_label`::
+
+    register_label("organic", "bio", "organic")
+"""
+
+import re
+from functools import lru_cache
+
+# Substrings of the normalized alt/title identifying each label, in priority
+# order: an icon matching several labels is classified as the first one
+LABEL_PATTERNS = {
+    "vegan": ("vegan",),
+    "vegetarian": ("vegetar",),
+    "glutenfree": ("glutenfrei", "gluten-free"),
+    "lactosefree": ("laktosefrei", "lactose-free"),
+    "co2": ("co2",),
+}
+
+# Distinct (alt, title) pairs remembered, a page uses a handful of icons
+MEMO_SIZE = 1024
+
+_CO2_VALUE = re.compile(r"([\d]+(?:\.[\d]+)?)\s*(?:kg|g)?\s*co2e?")
+_CO2_VALUE_AFTER = re.compile(r"co2[^\d]*([\d]+(?:\.[\d]+)?)")
+
+
+def normalize(text: str) -> str:
+    """Lower case, with the subscript of CO₂ as a plain digit."""
+    return text.lower().replace("₂", "2")
+
+
+class LabelClassifier:
+    """
+    Match the labels of an icon, memoized per (alt, title).
+
+    The labels are searched separately, so patterns overlapping in the text
+    (e.g. "frei" and "laktosefrei") are all found.
+
+    Args:
+        patterns: Substrings identifying each label, in priority order.
+    """
+
+    def __init__(self, patterns: dict[str, tuple[str, ...]] = LABEL_PATTERNS):
+        self.patterns = {label: tuple(p) for label, p in patterns.items()}
+        self._compile()
+
+    def _compile(self) -> None:
+        self._regexes = {
+            label: re.compile("|".join(map(re.escape, patterns)))
+            for label, patterns in self.patterns.items()
+            if patterns
+        }
+        self.classify = lru_cache(maxsize=MEMO_SIZE)(self._classify)
+
+    def register(self, label: str, *patterns: str) -> None:
+        """Add a label, or more patterns to an existing one."""
+        self.patterns[label] = self.patterns.get(label, ()) + tuple(
+            normalize(p) for p in patterns
+        )
+        self._compile()
+
+    def _classify(self, alt: str, title: str) -> tuple[str, ...]:
+        text = f"{normalize(alt)}\n{normalize(title)}"
+        return tuple(
+            label for label, regex in self._regexes.items() if regex.search(text)
+        )
+
+
+_classifier = LabelClassifier()
+
+
+def classify_icon(alt: str, title: str) -> tuple[str, ...]:
+    """
+    All the labels of an icon, in priority order.
+
+    Args:
+        alt: The alt attribute of the icon.
+        title: The title attribute of the icon.
+
+    Returns:
+        The labels of :data:`LABEL_PATTERNS` and the registered ones.
+    """
+    return _classifier.classify(alt, title)
+
+
+def register_label(label: str, *patterns: str) -> None:
+    """Recognize a new label from substrings of the icon alt/title."""
+    _classifier.register(label, *patterns)
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def extract_co2_value(text: str) -> str | None:
+    """Read the CO2 value from the title or tooltip of a CO2 icon."""
+    normalized = normalize(text).replace(",", ".")
+
+    match = _CO2_VALUE.search(normalized)
+    if match:
+        return match.group(1)
+
+    match = _CO2_VALUE_AFTER.search(normalized)
+    if match:
+        return match.group(1)
+
+    return None
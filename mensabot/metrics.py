@@ -0,0 +1,266 @@
+"""
+Timing of the stages of the pipeline and counters of the runs.
+
+The stages are timed with spans, by stage and restaurant::
+
+    with span("parse", restaurant="Empa"):
+        df = read_menus(file)
+    count("items_parsed", len(df), restaurant="Empa")
+
+Each span is logged at debug level with its values as structured fields
+(see `JsonFormatter`), and the totals are exported in the Prometheus text
+format, to a file after a run (``--metrics-file``) or on ``/metrics`` of the
+HTTP API of the daemon.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Prefix of the names of the exported metrics
+NAMESPACE = "mensabot"
+
+# Descriptions of the exported metrics, the others are described by their name
+_HELP = {
+    "stage_seconds": "Time spent in the stages of the pipeline",
+    "stage_errors_total": "Number of stages that failed",
+    "fetches_total": "Number of fetched pages, by outcome",
+    "fetched_bytes_total": "Size of the fetched html",
+    "items_parsed_total": "Number of menu items parsed",
+    "parse_cache_hits_total": "Number of pages read from the parse cache",
+    "parse_cache_misses_total": "Number of pages missing from the parse cache",
+    "posts_total": "Number of messages posted to a webhook, by outcome",
+    "post_retries_total": "Number of posts retried",
+    "last_run_timestamp_seconds": "Time of the end of the last run",
+}
+
+_Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: dict) -> _Labels:
+    """Hashable labels, without the ones that are not set."""
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: _Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metrics:
+    """
+    Durations of the spans, counters and gauges, safe to use from threads.
+
+    The state of a worker process is sent back with `state` and added to
+    the main process with `merge`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            # Count and total seconds of the spans, by stage and labels
+            self.durations: dict[tuple[str, _Labels], list[float]] = {}
+            self.counters: dict[tuple[str, _Labels], float] = {}
+            self.gauges: dict[tuple[str, _Labels], float] = {}
+
+    def observe(self, stage: str, seconds: float, **labels) -> None:
+        """Record a duration of a stage."""
+        key = (stage, _labels(labels))
+        with self._lock:
+            total = self.durations.setdefault(key, [0, 0.0])
+            total[0] += 1
+            total[1] += seconds
+
+    def count(self, name: str, value: float = 1, **labels) -> None:
+        """Increase a counter."""
+        key = (name, _labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        """Set a gauge to its current value."""
+        with self._lock:
+            self.gauges[(name, _labels(labels))] = value
+
+    @contextmanager
+    def span(self, stage: str, **labels):
+        """
+        Time the code of the block as a stage, also when it fails.
+
+        Args:
+            stage: Name of the stage, e.g. "goto" or "parse".
+            **labels: Labels of the duration, e.g. the restaurant. The labels
+                set to None are left out.
+        """
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe(stage, seconds, **labels)
+            if failed:
+                self.count("stage_errors", stage=stage, **labels)
+            # Most runs do not log at debug level, the fields are not built
+            if logger.isEnabledFor(logging.DEBUG):
+                fields = {"stage": stage, "seconds": round(seconds, 6)}
+                fields.update(_labels(labels), failed=failed)
+                text = ", ".join(f"{k}={v}" for k, v in _labels(labels))
+                logger.debug(
+                    f"Stage {stage}{f' ({text})' if text else ''} took "
+                    f"{seconds:.3f} s{' and failed' if failed else ''}",
+                    extra={"metrics": fields},
+                )
+
+    def state(self) -> dict:
+        """Copy of the recorded values, picklable."""
+        with self._lock:
+            return {
+                "durations": {k: list(v) for k, v in self.durations.items()},
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+            }
+
+    def merge(self, state: dict) -> None:
+        """Add the values of another process, see `state`."""
+        with self._lock:
+            for key, (n, seconds) in state["durations"].items():
+                total = self.durations.setdefault(key, [0, 0.0])
+                total[0] += n
+                total[1] += seconds
+            for key, value in state["counters"].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            self.gauges.update(state["gauges"])
+
+    def summary(self) -> dict:
+        """The recorded values as JSON friendly nested dicts, for the logs."""
+        state = self.state()
+        return {
+            "stages": [
+                {"stage": stage, **dict(labels), "count": n, "seconds": round(s, 6)}
+                for (stage, labels), (n, s) in sorted(state["durations"].items())
+            ],
+            "counters": [
+                {"name": name, **dict(labels), "value": value}
+                for (name, labels), value in sorted(state["counters"].items())
+            ],
+        }
+
+    def to_prometheus(self) -> str:
+        """The recorded values in the Prometheus text exposition format."""
+        state = self.state()
+        families: dict[str, tuple[str, list[str]]] = {}
+
+        def add(name: str, kind: str, labels: _Labels, value: float, suffix=""):
+            family = families.setdefault(name, (kind, []))
+            family[1].append(
+                f"{NAMESPACE}_{name}{suffix}{_format_labels(labels)} "
+                f"{_format_value(value)}"
+            )
+
+        for (stage, labels), (n, seconds) in sorted(state["durations"].items()):
+            labels = (("stage", stage), *labels)
+            add("stage_seconds", "summary", labels, n, "_count")
+            add("stage_seconds", "summary", labels, seconds, "_sum")
+        for (name, labels), value in sorted(state["counters"].items()):
+            add(f"{name}_total", "counter", labels, value)
+        for (name, labels), value in sorted(state["gauges"].items()):
+            add(name, "gauge", labels, value)
+
+        lines = []
+        for name, (kind, samples) in families.items():
+            lines.append(f"# HELP {NAMESPACE}_{name} {_HELP.get(name, name)}")
+            lines.append(f"# TYPE {NAMESPACE}_{name} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: Path) -> None:
+        """
+        Write the values to a file, e.g. for the textfile collector of the
+        Prometheus node exporter.
+        """
+        path = Path(path)
+        path.parent.mkdir(exist_ok=True, parents=True)
+        # The collector never reads a partial file
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(self.to_prometheus())
+        tmp_path.replace(path)
+
+
+# Metrics of this process, used by the functions below
+METRICS = Metrics()
+
+
+def span(stage: str, **labels):
+    """Time a stage in the metrics of the process, see `Metrics.span`."""
+    return METRICS.span(stage, **labels)
+
+
+def count(name: str, value: float = 1, **labels) -> None:
+    """Increase a counter of the metrics of the process."""
+    METRICS.count(name, value, **labels)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format the log records as one JSON object per line.
+
+    The fields passed as ``extra={"metrics": {...}}``, e.g. by the spans, are
+    added to the object.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "metrics", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(level: str = "INFO", format: str = "text") -> None:
+    """
+    Configure the logs of a command.
+
+    Args:
+        level: Name of the logging level.
+        format: "text" for the usual lines, "json" for one JSON object per
+            line, see `JsonFormatter`.
+    """
+    if format == "json":
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonFormatter())
+        logging.basicConfig(level=getattr(logging, level), handlers=[handler])
+    else:
+        logging.basicConfig(
+            level=getattr(logging, level),
+            format="%(asctime)s - %(levelname)s - %(message)s",
+        )
@@ -1,208 +1,751 @@
 import logging
 import re
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from dataclasses import dataclass, fields
 from datetime import date
+from functools import lru_cache, partial
+from operator import attrgetter
+from typing import BinaryIO, NamedTuple
 
-from bs4 import BeautifulSoup
 import pandas as pd
 
 from pathlib import Path
 
+from .labels import classify_icon, extract_co2_value
+
+try:
+    from lxml import etree
+except ImportError:  # lxml is optional, the "bs4" engine is used instead
+    etree = None
+
 logger = logging.getLogger(__name__)
 
+# Available parser engines:
+# * "lxml": parse incrementally with lxml, extract each item with the
+#   compiled layout and free it once parsed (fast, memory does not grow with
+#   the page)
+# * "bs4": parse with BeautifulSoup and the pure python html.parser
+# * "auto": "lxml" if it is installed, "bs4" otherwise
+ENGINES = ("auto", "lxml", "bs4")
+
+
+# Version of the parsing logic, to change whenever read_menus gives different
+# results for the same html, so that cached results are not reused
+PARSER_VERSION = "3"
+
+
+@dataclass(slots=True)
+class MenuItem:
+    """A menu item, with its values parsed once at extraction."""
+
+    day: str
+    date: str
+    title: str
+    description: str
+    price: float | None
+    provenance: str | None
+    vegan: bool
+    vegetarian: bool
+    glutenfree: bool
+    co2_footprint: float | None
+
+
+# Columns of the DataFrame returned by read_menus
+MENU_COLUMNS = [field.name for field in fields(MenuItem)]
+
+# Dtypes of the columns of the menus that are not strings
+MENU_DTYPES = {
+    "price": float,
+    "vegan": bool,
+    "vegetarian": bool,
+    "glutenfree": bool,
+    "co2_footprint": float,
+}
+
+
+_PRICE = re.compile(r"CHF\s*([\d.,]+)")
+
+
+class _RawItem(NamedTuple):
+    """Fields of a menu item as found in the html, before interpretation."""
+
+    title: str
+    description: str
+    prices: list[str]
+    provenance: str | None
+    images: list
+
+
+class _TooltipIndex:
+    """
+    Lazy index of the text of the elements of a document by their id.
+
+    The document is walked once, on the first lookup, so pages without CO2
+    labels never pay for it.
+    """
+
+    def __init__(self, find_elements_with_id, get_text):
+        self._find_elements_with_id = find_elements_with_id
+        self._get_text = get_text
+        self._elements = None
+        self._texts = {}
+
+    def get(self, element_id: str, default: str = "") -> str:
+        if self._elements is None:
+            self._elements = {}
+            for element in self._find_elements_with_id():
+                # Keep the first element, like a search in the document would
+                self._elements.setdefault(element.get("id"), element)
+        if element_id not in self._texts:
+            element = self._elements.get(element_id)
+            if element is None:
+                return default
+            self._texts[element_id] = self._get_text(element)
+        return self._texts[element_id]
+
+
+def find_all_labels(img, tooltips=None) -> list[str]:
+    """Find all the labels (vegan, vegetarian, ...) of an image of a label list.
+
+    `img` can come from either a BeautifulSoup or an lxml tree. `tooltips`
+    maps element ids to their text (a dict or a `_TooltipIndex`), it is used
+    to read the CO2 value described by the image, returned as "co2_<value>".
+    """
+    title = img.get("title", "")
+    labels = list(classify_icon(img.get("alt", ""), title))
+    if "co2" in labels:
+        tooltip_text = ""
+        described_by = img.get("aria-describedby", "")
+        if described_by and tooltips is not None:
+            tooltip_text = tooltips.get(described_by, "")
 
-def _extract_co2_value(text: str) -> str | None:
-    normalized = text.lower().replace("₂", "2").replace(",", ".")
+        co2_value = extract_co2_value(" ".join([title.lower(), tooltip_text]))
+        co2_index = labels.index("co2")
+        if co2_value:
+            labels[co2_index] = f"co2_{co2_value}"
+        else:
+            del labels[co2_index]
+    return labels
+
+
+def find_labels(img, tooltips=None) -> str | None:
+    """Find the label of an image of a label list, see `find_all_labels`.
+
+    If the image has several labels, the first one of
+    :data:`mensabot.labels.LABEL_PATTERNS` is returned.
+    """
+    labels = find_all_labels(img, tooltips)
+    return labels[0] if labels else None
+
+
+class _Step(NamedTuple):
+    """A step of a selector: an element with this tag and these classes."""
+
+    tag: str | None
+    classes: frozenset[str]
+
+    def matches(self, tag: str, classes) -> bool:
+        return (self.tag is None or self.tag == tag) and self.classes.issubset(classes)
+
+
+def _compile_selector(selector: str) -> tuple[_Step, ...]:
+    """Compile a selector like "div.product-title button" into its steps."""
+    steps = []
+    for part in selector.split():
+        tag, *classes = part.split(".")
+        if not tag and not classes or "" in classes:
+            raise ValueError(f"Invalid selector '{selector}'")
+        steps.append(_Step(tag or None, frozenset(classes)))
+    if not steps:
+        raise ValueError("Empty selector")
+    return tuple(steps)
+
+
+# Fields of _RawItem found by the selectors of the layouts, with whether all
+# the matching elements are kept (else the first one)
+_FIELDS = {
+    "title": False,
+    "description": False,
+    "prices": True,
+    "provenance": False,
+    "images": True,
+}
+
+
+class _Accessors(NamedTuple):
+    """How the tag, the classes and the parent of an element are read."""
+
+    tag: Callable
+    classes: Callable
+    parent: Callable
+
+
+class _ItemPlan:
+    """
+    Selectors of a layout compiled to find all the fields of an item in a
+    single traversal of its elements.
+
+    The elements are looked up by their tag and classes, only the fields
+    whose last step can match are checked.
+    """
+
+    def __init__(self, layout: "ItemLayout"):
+        self.layout = layout
+        item = _compile_selector(layout.item)
+        if len(item) != 1:
+            raise ValueError(f"The item selector '{layout.item}' must be one step")
+        self.item = item[0]
+        # The fields by a class of their last step, or else by its tag
+        self._by_class = {}
+        self._by_tag = {}
+        for name in _FIELDS:
+            *ancestors, last = _compile_selector(getattr(layout, name))
+            entry = (name, last, tuple(ancestors))
+            if last.classes:
+                self._by_class.setdefault(min(last.classes), []).append(entry)
+            else:
+                self._by_tag.setdefault(last.tag, []).append(entry)
+
+    def match(
+        self, element, tag: str, classes, item, found: dict, access: _Accessors
+    ) -> None:
+        """Add an element of the item to the fields it is an element of."""
+        entries = self._by_tag.get(tag, ())
+        for class_name in classes:
+            if class_name in self._by_class:
+                entries = [*entries, *self._by_class[class_name]]
+        for name, last, ancestors in entries:
+            if (
+                # Once per element, even if its class is repeated
+                (not found[name] or _FIELDS[name] and found[name][-1] is not element)
+                and last.matches(tag, classes)
+                and (not ancestors or _has_ancestors(element, ancestors, item, access))
+            ):
+                found[name].append(element)
+
+    def extract(self, item, elements, access: _Accessors) -> dict:
+        """
+        Find the elements of the fields among the elements of an item.
+
+        Args:
+            item: The item element.
+            elements: Its descendant elements, in document order.
+            access: Accessors of the elements of the engine.
+
+        Returns:
+            The elements of each field, see `new_fields`.
+        """
+        found = self.new_fields()
+        for element in elements:
+            self.match(
+                element,
+                access.tag(element),
+                access.classes(element),
+                item,
+                found,
+                access,
+            )
+        return found
+
+    @staticmethod
+    def new_fields() -> dict[str, list]:
+        """Elements of each field of :data:`_FIELDS`, in document order."""
+        return {name: [] for name in _FIELDS}
+
+
+def _has_ancestors(element, steps: tuple[_Step, ...], item, access: _Accessors) -> bool:
+    """Whether the ancestors of the element inside the item match the steps."""
+    parent = access.parent(element)
+    for step in reversed(steps):
+        while parent is not None and parent is not item:
+            matched = step.matches(access.tag(parent), access.classes(parent))
+            parent = access.parent(parent)
+            if matched:
+                break
+        else:
+            return False
+    return True
 
-    match = re.search(r"([\d]+(?:\.[\d]+)?)\s*(?:kg|g)?\s*co2e?", normalized)
-    if match:
-        return match.group(1)
 
-    match = re.search(r"co2[^\d]*([\d]+(?:\.[\d]+)?)", normalized)
-    if match:
-        return match.group(1)
+def _first(elements: list):
+    return elements[0] if elements else None
 
-    return None
 
+@dataclass(frozen=True)
+class ItemLayout:
+    """
+    Where the menu items and their fields are in a layout of the menu pages.
 
-def find_labels(img: BeautifulSoup, soup: BeautifulSoup | None = None) -> str | None:
-    """Find all vegan/vegetarian in the labels-list div."""
-    alt = img.get("alt", "").lower()
-    title = img.get("title", "").lower()
-    alt_normalized = alt.replace("₂", "2")
-    title_normalized = title.replace("₂", "2")
-
-    if "vegan" in alt or "vegan" in title:
-        return "vegan"
-    elif "vegetar" in alt or "vegetar" in title:
-        return "vegetarian"
-    elif "glutenfrei" in alt or "glutenfrei" in title:
-        return "glutenfree"
-    elif "gluten-free" in alt or "gluten-free" in title:
-        return "glutenfree"
-    elif "co2" in alt_normalized or "co2" in title_normalized:
-        tooltip_text = ""
-        described_by = img.get("aria-describedby", "")
-        if described_by and soup is not None:
-            tooltip = soup.find(id=described_by)
-            if tooltip:
-                tooltip_text = tooltip.get_text(separator=" ", strip=True)
+    The selectors are simple CSS selectors: a tag and/or classes such as
+    "div.label-list", separated by spaces for descendants. The fields are
+    searched inside the item, the first element found is used, except for
+    the prices and the label images that are all kept.
 
-        co2_value = _extract_co2_value(" ".join([title, tooltip_text]))
-        if co2_value:
-            return f"co2_{co2_value}"
-    else:
-        return None
+    Args:
+        name: Name of the layout, in the logs.
+        item: Selector of the element of an item, one step.
+        title: Element whose text is the title.
+        description: Element whose text is the description.
+        prices: Elements whose texts are the prices.
+        provenance: Element whose text is the provenance.
+        images: Images of the labels (vegan, CO2, ...).
+    """
 
+    name: str
+    item: str
+    title: str
+    description: str
+    prices: str = ".price"
+    provenance: str = ".menu-provenance"
+    images: str = "div.label-list img"
 
-def read_menus(file: Path, date: date) -> pd.DataFrame:
 
-    file = Path(file)
+# Layouts of the menu pages. The layout of a page is the one of the first
+# item element closed in it, in this order if an element is an item of
+# several layouts. A new layout of the site only needs an entry here.
+LAYOUTS = (
+    ItemLayout(
+        name="old",
+        item=".product-wrapper",
+        title=".pre-wrap",
+        description=".product-teaser",
+    ),
+    ItemLayout(
+        name="new",
+        item=".product-card",
+        title="div.product-title button",
+        description="div.push-bottom-xs",
+    ),
+)
 
-    with open(file, "r") as f:
-        html_content = f.read()
 
-    logger.debug(f"HTML content from {file}")
+@lru_cache(maxsize=16)
+def _compile_layouts(layouts: tuple[ItemLayout, ...]) -> tuple[_ItemPlan, ...]:
+    return tuple(_ItemPlan(layout) for layout in layouts)
+
+
+def _detect_plan(plans: tuple[_ItemPlan, ...], tag: str, classes) -> _ItemPlan | None:
+    """The first plan of which the element is an item, None if none."""
+    return next((plan for plan in plans if plan.item.matches(tag, classes)), None)
+
+
+def _bs4_classes(element) -> list[str]:
+    return element.get("class", [])
+
+
+_BS4_ACCESSORS = _Accessors(
+    tag=attrgetter("name"), classes=_bs4_classes, parent=attrgetter("parent")
+)
+
+
+def _bs4_text(element) -> str:
+    return element.get_text(separator=" ", strip=True)
+
+
+def _parse_bs4(
+    html_content: str, plans: tuple[_ItemPlan, ...]
+) -> tuple[_TooltipIndex, list[_RawItem]]:
+    # Only imported when used, the lxml engine does not need it
+    from bs4 import BeautifulSoup
 
-    # <div class="category-grid ng-star-inserted"><app-category _nghost-ng-c4143720142="" class="grid-row ng-star-inserted"><!----><h3 _ngcontent-ng-c4143720142="" class="h3 category-header ng-star-inserted"> Local to Global </h3><!----><app-product-list _ngcontent-ng-c4143720142="" _nghost-ng-c1967480023="" class="ng-star-inserted"><div _ngcontent-ng-c1967480023="" appclickablearea="" class="product-wrapper ng-star-inserted"><div _ngcontent-ng-c1967480023="" layout="row"><div _ngcontent-ng-c1967480023="" flex=""><div _ngcontent-ng-c1967480023="" layout-gt-sm="row"><div _ngcontent-ng-c1967480023="" class="name-column pad-right-sm pad-bottom-sm"><button _ngcontent-ng-c1967480023="" appclickableareatarget="" class="button-reset link-reset"><span _ngcontent-ng-c1967480023="" class="pre-wrap legacy-text-xxl">Buddha Bowl</span></button><div _ngcontent-ng-c1967480023="" class="product-teaser push-top-xs ng-star-inserted"> mit Quinoa, Randen Falafel, Zucchetti, Sesam  Rettich Pickles, Lattich, Cherrytomaten und Olivenöl-Zitronen Dressing | Tagessalat und 1dl Saft </div><!----><!----></div><div _ngcontent-ng-c1967480023="" class="allergen-column ng-star-inserted"><app-product-label-list _ngcontent-ng-c1967480023=""><!----><!----><div class="label-list customtag-list ng-star-inserted"><app-product-custom-tag _nghost-ng-c1604586910="" class="ng-star-inserted"><img _ngcontent-ng-c1604586910="" src="https://files.qnips.com/releaseicons/20230405sviconsvegan_2024.07.02_09.01.13.png" title="Vegan" alt="Vegan" class="ng-star-inserted"><!----><!----></app-product-custom-tag><app-product-custom-tag _nghost-ng-c1604586910="" class="ng-star-inserted"><img _ngcontent-ng-c1604586910="" src="https://files.qnips.com/releaseicons/20230405sviconsglutenfrei_2024.07.02_09.01.40.png" title="Glutenfrei" alt="Glutenfrei" class="ng-star-inserted"><!----><!----></app-product-custom-tag><app-product-custom-tag _nghost-ng-c1604586910="" class="ng-star-inserted"><img _ngcontent-ng-c1604586910="" src="https://files.qnips.com/releaseicons/20230405sviconslaktosefrei_2024.07.02_09.01.51.png" title="Laktosefrei" alt="Laktosefrei" class="ng-star-inserted"><!----><!----></app-product-custom-tag><!----><!----></div><!----></app-product-label-list></div><!----><div _ngcontent-ng-c1967480023="" class="price-column legacy-text-lg text-right pad-left-sm ng-star-inserted"><div _ngcontent-ng-c1967480023="" class="price ng-star-inserted">   <!----> &nbsp;CHF&nbsp;11.50 <!----></div><!----></div><!----><div _ngcontent-ng-c1967480023="" layout="row" layout-gt-sm="column" layout-align="start end"><!----><!----></div></div></div></div><!----></div><!----></app-product-list><!----><!----><!----><!----><!----></app-category><app-category _nghost-ng-c4143720142="" class="grid-row ng-star-inserted"><!----><h3 _ngcontent-ng-c4143720142="" class="h3 category-header ng-star-inserted"> Twist and Trend </h3><!----><app-product-list _ngcontent-ng-c4143720142="" _nghost-ng-c1967480023="" class="ng-star-inserted"><div _ngcontent-ng-c1967480023="" appclickablearea="" class="product-wrapper ng-star-inserted"><div _ngcontent-ng-c1967480023="" layout="row"><div _ngcontent-ng-c1967480023="" flex=""><div _ngcontent-ng-c1967480023="" layout-gt-sm="row"><div _ngcontent-ng-c1967480023="" class="name-column pad-right-sm pad-bottom-sm"><button _ngcontent-ng-c1967480023="" appclickableareatarget="" class="button-reset link-reset"><span _ngcontent-ng-c1967480023="" class="pre-wrap legacy-text-xxl">Berliner Currywurst</span></button><div _ngcontent-ng-c1967480023="" class="product-teaser push-top-xs ng-star-inserted"> mit Pommes Frites | Tagessalat und 1 dl Saft </div><!----><!----></div><div _ngcontent-ng-c1967480023="" class="allergen-column ng-star-inserted"><app-product-label-list _ngcontent-ng-c1967480023=""><!----><!----><div class="label-list customtag-list ng-star-inserted"><app-product-custom-tag _nghost-ng-c1604586910="" class="ng-star-inserted"><img _ngcontent-ng-c1604586910="" src="https://files.qnips.com/releaseicons/20230405sviconsglutenfrei_2024.07.02_09.01.40.png" title="Glutenfrei" alt="Glutenfrei" class="ng-star-inserted"><!----><!----></app-product-custom-tag><app-product-custom-tag _nghost-ng-c1604586910="" class="ng-star-inserted"><img _ngcontent-ng-c1604586910="" src="https://files.qnips.com/releaseicons/20230405sviconslaktosefrei_2024.07.02_09.01.51.png" title="Laktosefrei" alt="Laktosefrei" class="ng-star-inserted"><!----><!----></app-product-custom-tag><!----><!----></div><!----></app-product-label-list></div><!----><div _ngcontent-ng-c1967480023="" class="price-column legacy-text-lg text-right pad-left-sm ng-star-inserted"><div _ngcontent-ng-c1967480023="" class="price ng-star-inserted">   <!----> &nbsp;CHF&nbsp;13.50 <!----></div><!----></div><!----><div _ngcontent-ng-c1967480023="" layout="row" layout-gt-sm="column" layout-align="start end"><!----><!----></div></div></div></div><!----></div><!----></app-product-list><!----><!----><!----><!----><!----></app-category><app-category _nghost-ng-c4143720142="" class="grid-row ng-star-inserted"><!----><h3 _ngcontent-ng-c4143720142="" class="h3 category-header ng-star-inserted"> Grill n’ Bun </h3><!----><app-product-list _ngcontent-ng-c4143720142="" _nghost-ng-c1967480023="" class="ng-star-inserted"><div _ngcontent-ng-c1967480023="" appclickablearea="" class="product-wrapper ng-star-inserted"><div _ngcontent-ng-c1967480023="" layout="row"><div _ngcontent-ng-c1967480023="" flex=""><div _ngcontent-ng-c1967480023="" layout-gt-sm="row"><div _ngcontent-ng-c1967480023="" class="name-column pad-right-sm pad-bottom-sm"><button _ngcontent-ng-c1967480023="" appclickableareatarget="" class="button-reset link-reset"><span _ngcontent-ng-c1967480023="" class="pre-wrap legacy-text-xxl">Empa Fitnessteller</span></button><div _ngcontent-ng-c1967480023="" class="product-teaser push-top-xs ng-star-inserted"> mit Schweins Pfefferspies, Ayvar und Salat nach Wahl vom Buffet | Tagessuppe oder 1dl Saft </div><!----><!----></div><div _ngcontent-ng-c1967480023="" class="allergen-column ng-star-inserted"><app-product-label-list _ngcontent-ng-c1967480023=""><!----><!----><div class="label-list customtag-list ng-star-inserted"><app-product-custom-tag _nghost-ng-c1604586910="" class="ng-star-inserted"><img _ngcontent-ng-c1604586910="" src="https://files.qnips.com/releaseicons/20230405sviconsglutenfrei_2024.07.02_09.01.40.png" title="Glutenfrei" alt="Glutenfrei" class="ng-star-inserted"><!----><!----></app-product-custom-tag><!----><!----></div><!----></app-product-label-list></div><!----><div _ngcontent-ng-c1967480023="" class="price-column legacy-text-lg text-right pad-left-sm ng-star-inserted"><div _ngcontent-ng-c1967480023="" class="price ng-star-inserted">   <!----> &nbsp;CHF&nbsp;16.80 <!----></div><!----></div><!----><div _ngcontent-ng-c1967480023="" layout="row" layout-gt-sm="column" layout-align="start end"><!----><!----></div></div></div></div><!----></div><!----></app-product-list><!----><!----><!----><!----><!----></app-category><app-category _nghost-ng-c4143720142="" class="grid-row ng-star-inserted"><!----><h3 _ngcontent-ng-c4143720142="" class="h3 category-header ng-star-inserted"> Hot &amp; Cold </h3><!----><app-product-list _ngcontent-ng-c4143720142="" _nghost-ng-c1967480023="" class="ng-star-inserted"><div _ngcontent-ng-c1967480023="" appclickablearea="" class="product-wrapper ng-star-inserted"><div _ngcontent-ng-c1967480023="" layout="row"><div _ngcontent-ng-c1967480023="" flex=""><div _ngcontent-ng-c1967480023="" layout-gt-sm="row"><div _ngcontent-ng-c1967480023="" class="name-column pad-right-sm pad-bottom-sm"><button _ngcontent-ng-c1967480023="" appclickableareatarget="" class="button-reset link-reset"><span _ngcontent-ng-c1967480023="" class="pre-wrap legacy-text-xxl">Öffnungszeiten Sommerferien</span></button><div _ngcontent-ng-c1967480023="" class="product-teaser push-top-xs ng-star-inserted"> Das Restaurant Fire ist von  06.30 - 13.30 Uhr geöffnet Mittagsservice ist von 11.15 - 13.00 Uhr </div><!----><!----></div><div _ngcontent-ng-c1967480023="" class="allergen-column ng-star-inserted"><app-product-label-list _ngcontent-ng-c1967480023=""><!----><!----><!----></app-product-label-list></div><!----><div _ngcontent-ng-c1967480023="" class="price-column legacy-text-lg text-right pad-left-sm ng-star-inserted"><!----></div><!----><div _ngcontent-ng-c1967480023="" layout="row" layout-gt-sm="column" layout-align="start end"><!----><!----></div></div></div></div><!----></div><!----></app-product-list><!----><!----><!----><!----><!----></app-category><!----></div>
     # Parse the HTML
     soup = BeautifulSoup(html_content, "html.parser")
 
     # Find all menu items
     daily_menus = soup.find_all(class_="category-grid")
 
+    # Serializing the html for the debug logs is expensive, only do it when
+    # it will be shown
+    trace = logger.isEnabledFor(logging.DEBUG)
+
     logger.debug(f"Found {len(daily_menus)} daily menus")
 
-    logger.debug(
-        f"Daily menu: {daily_menus[0].prettify() if daily_menus else 'No daily menus found'}"
-    )
+    if trace:
+        logger.debug(
+            f"Daily menu: {daily_menus[0].prettify() if daily_menus else 'No daily menus found'}"
+        )
 
-    menus = {
-        field: []
-        for field in [
-            "day",
-            "date",
-            "title",
-            "description",
-            "price",
-            "provenance",
-            "vegan",
-            "vegetarian",
-            "glutenfree",
-            "co2_footprint",
+    # The elements that are an item of a layout, by daily menu
+    candidates = [
+        [
+            element
+            for element in daily_menu.find_all(True)
+            if _detect_plan(plans, element.name, _bs4_classes(element))
+        ]
+        for daily_menu in daily_menus
+    ]
+
+    # The layout is detected once, on the first item element closed in the
+    # page: the first one without item elements inside
+    ordered = [element for elements in candidates for element in elements]
+    plan = None
+    for element, following in zip(ordered, [*ordered[1:], None]):
+        if following is None or element not in following.parents:
+            plan = _detect_plan(plans, element.name, _bs4_classes(element))
+            break
+
+    raw_items = []
+    for elements in candidates if plan is not None else []:
+        menu_items = [
+            item
+            for item in elements
+            if plan.item.matches(item.name, _bs4_classes(item))
         ]
+        logger.info(f"Found {len(menu_items)} menu items (format: {plan.layout.name})")
+
+        # Iterate over each menu item and extract relevant information
+        for item in menu_items:
+            if trace:
+                logger.debug(f"Processing {item.prettify()}")
+            extracted = plan.extract(item, item.find_all(True), _BS4_ACCESSORS)
+
+            def text(name: str, default):
+                element = _first(extracted[name])
+                return element.text.strip() if element is not None else default
+
+            raw_items.append(
+                _RawItem(
+                    title=text("title", ""),
+                    description=text("description", ""),
+                    prices=[_bs4_text(price) for price in extracted["prices"]],
+                    provenance=text("provenance", None),
+                    images=extracted["images"],
+                )
+            )
+
+    tooltips = _TooltipIndex(lambda: soup.find_all(id=True), _bs4_text)
+    return tooltips, raw_items
+
+
+if etree is not None:
+    _XPATHS = {
+        "text": etree.XPath(".//text()"),
+        "string": etree.XPath("string()"),
     }
 
-    day = date.strftime("%A")
-    date = date.strftime("%Y-%m-%d")
-    for i, daily_menu in enumerate(daily_menus):
-        # Read the menu items - try both old and new HTML structures
-        menu_items = daily_menu.find_all(class_="product-wrapper")
-
-        # If old structure not found, try new structure (mat-card)
-        if not menu_items:
-            menu_items = daily_menu.find_all(class_="product-card")
-            is_new_format = True
-        else:
-            is_new_format = False
 
-        logger.info(
-            f"Found {len(menu_items)} menu items (format: {'new' if is_new_format else 'old'})"
-        )
+def _lxml_text(element) -> str:
+    """Equivalent of bs4 `get_text(separator=" ", strip=True)` for lxml."""
+    return " ".join(text.strip() for text in _XPATHS["text"](element) if text.strip())
 
-        # Iterate over each menu item and extract relevant information
-        for index, item in enumerate(menu_items):
-            logger.debug(f"Processing {item.prettify()}")
-
-            # Extract title - handle both old and new formats
-            if is_new_format:
-                # New format: div.product-title > button
-                title_elem = item.find("div", class_="product-title")
-                if title_elem and title_elem.find("button"):
-                    title_menu = title_elem.find("button").text.strip()
+
+def _lxml_text_content(element) -> str:
+    """Equivalent of `text_content()` of lxml.html elements."""
+    return _XPATHS["string"](element)
+
+
+def _lxml_classes(element) -> list[str]:
+    return element.get("class", "").split()
+
+
+def _lxml_parent(element):
+    return element.getparent()
+
+
+_LXML_ACCESSORS = _Accessors(
+    tag=attrgetter("tag"), classes=_lxml_classes, parent=_lxml_parent
+)
+
+
+def _lxml_pretty(element) -> str:
+    return etree.tostring(element, pretty_print=True, encoding="unicode")
+
+
+def _lxml_raw_item(extracted: dict[str, list]) -> _RawItem:
+    """Read the fields of a complete lxml item, see `_ItemPlan.match`."""
+
+    def text(name: str, default):
+        element = _first(extracted[name])
+        return _lxml_text_content(element).strip() if element is not None else default
+
+    # Only the attributes of the images are kept, the item is freed once parsed
+    return _RawItem(
+        title=text("title", ""),
+        description=text("description", ""),
+        prices=[_lxml_text(price) for price in extracted["prices"]],
+        provenance=text("provenance", None),
+        images=[dict(img.attrib) for img in extracted["images"]],
+    )
+
+
+def _iter_lxml(
+    file: Path | BinaryIO, plans: tuple[_ItemPlan, ...]
+) -> Iterator[tuple[_RawItem, dict[str, str]]]:
+    """
+    Parse the page incrementally and yield each item as soon as it is parsed.
+
+    The parsed elements are freed as the parsing goes, so the memory does not
+    grow with the page. The tooltips giving the CO2 values are usually at the
+    end of the page: an item referring to a tooltip that is not parsed yet is
+    held back, with the items after it to keep the order, until the tooltip is
+    found. Like with bs4, any element with an id can be a tooltip: the text
+    of all of them is kept, except the ones around a menu grid.
+
+    The layout is detected once, on the first item element closed in the
+    page, see :data:`LAYOUTS`. The item elements of the other layouts are
+    not items, e.g. a product-card around product-wrapper items.
+    """
+    # Serializing the html for the debug logs is expensive, only do it when
+    # it will be shown
+    trace = logger.isEnabledFor(logging.DEBUG)
+
+    # Text of the tooltips found so far, by id
+    tooltips = {}
+    # Items waiting for tooltips, with the ids they refer to
+    pending = deque()
+    # Open elements whose content is needed, not freed until they are parsed.
+    # The items are open with their plan and the elements of their fields.
+    open_grids = []
+    open_items = []
+    open_tooltips = []
+    # Layout of the page, once detected
+    plan = None
+    # Number of items found in the current daily menu
+    n_items = 0
+    n_daily_menus = 0
+
+    def ready_items():
+        while pending and all(i in tooltips for i in pending[0][1]):
+            yield pending.popleft()[0], tooltips
+
+    # A file object is read as it is parsed, e.g. from a decompressor
+    source = file if hasattr(file, "read") else str(file)
+    events = etree.iterparse(
+        source, events=("start", "end"), html=True, encoding="utf-8"
+    )
+    for event, element in events:
+        if event == "start":
+            classes = element.get("class", "").split()
+            # The fields are found as the elements of the items are parsed
+            for item, item_plan, extracted in open_items:
+                item_plan.match(
+                    element, element.tag, classes, item, extracted, _LXML_ACCESSORS
+                )
+
+            if "category-grid" in classes:
+                # The elements around a grid are not tooltips, and are freed
+                open_tooltips.clear()
+                open_grids.append(element)
+            elif open_grids:
+                if plan is None:
+                    item_plan = _detect_plan(plans, element.tag, classes)
                 else:
-                    title_menu = ""
-            else:
-                # Old format: pre-wrap class
-                title_elem = item.find(class_="pre-wrap")
-                title_menu = title_elem.text.strip() if title_elem else ""
-
-            # Extract description - handle both formats
-            if is_new_format:
-                # New format: div.push-bottom-xs
-                desc_elem = item.find("div", class_="push-bottom-xs")
-                description = desc_elem.text.strip() if desc_elem else ""
-            else:
-                # Old format: product-teaser class
-                desc_elem = item.find(class_="product-teaser")
-                description = desc_elem.text.strip() if desc_elem else ""
-
-            # Extract price - handle both formats
-            price_elems = item.find_all(class_="price")
-            price = None
-            for pe in price_elems:
-                text = pe.get_text(separator=" ", strip=True)
-                if text.startswith("EXT"):
-                    # Extract the price after 'CHF'
-                    match = re.search(r"CHF\s*([\d.,]+)", text)
-                    if match:
-                        price = match.group(1).replace(",", ".")
-                    break
-            # Fallback: if no EXT price found, use the first price if available
-            if price is None and price_elems:
-                text = price_elems[0].get_text(separator=" ", strip=True)
-                match = re.search(r"CHF\s*([\d.,]+)", text)
-                if match:
-                    price = match.group(1).replace(",", ".")
-
-            provenance = item.find(class_="menu-provenance")
-            provenance = provenance.text.strip() if provenance else None
-
-            # Detect vegan/vegetarian by <img> alt or title attributes in label-list
-            is_vegan = False
-            is_vegetarian = False
-            co2_footprint = None
-            glutenfree = False
-            label_lists = item.find_all("div", class_="label-list")
-
-            if label_lists:
-                # Put all the ResultSet together
-                for label_list in label_lists:
-                    logger.debug(f"Processing label list: {label_list.prettify()}")
-                    for img in label_list.find_all("img"):
-                        label = find_labels(img, soup)
-                        if label is None:
-                            continue
-                        elif label == "vegan":
-                            is_vegan = True
-                        elif label == "vegetarian":
-                            is_vegetarian = True
-                        elif label == "glutenfree":
-                            glutenfree = True
-                        elif label.startswith("co2_"):
-                            co2_footprint = label[4:]
-                        else:
-                            logger.warning(f"Unknown label: {label}")
-
-            # If vegetatrische alternative is possible, mark as vegetarian
-            if "vegetarische alternative" in description.lower():
-                is_vegetarian = True
-            # If vegan, also mark as vegetarian
-            if is_vegan:
+                    item_plan = (
+                        plan if plan.item.matches(element.tag, classes) else None
+                    )
+                if item_plan is not None:
+                    open_items.append((element, item_plan, item_plan.new_fields()))
+            if element.get("id") is not None or element.get("role") == "tooltip":
+                open_tooltips.append(element)
+            continue
+
+        if open_tooltips and open_tooltips[-1] is element:
+            open_tooltips.pop()
+            tooltips.setdefault(element.get("id"), _lxml_text(element))
+            yield from ready_items()
+
+        if open_items and open_items[-1][0] is element:
+            _, item_plan, extracted = open_items.pop()
+            if plan is None:
+                plan = item_plan
+            if item_plan is plan:
+                if trace:
+                    logger.debug(f"Processing {_lxml_pretty(element)}")
+                raw_item = _lxml_raw_item(extracted)
+                n_items += 1
+                needed = {
+                    img["aria-describedby"]
+                    for img in raw_item.images
+                    if img.get("aria-describedby")
+                }
+                pending.append((raw_item, needed))
+                yield from ready_items()
+
+        if open_grids and open_grids[-1] is element:
+            open_grids.pop()
+            n_daily_menus += 1
+            if n_items:
+                logger.info(f"Found {n_items} menu items (format: {plan.layout.name})")
+            n_items = 0
+
+        if not open_items and not open_tooltips:
+            # Free the element and the already parsed elements before it
+            element.clear(keep_tail=True)
+            parent = element.getparent()
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
+
+    logger.debug(f"Found {n_daily_menus} daily menus")
+
+    # Items referring to tooltips that are not in the page
+    for raw_item, _ in pending:
+        yield raw_item, tooltips
+
+
+def _iter_bs4(
+    file: Path | BinaryIO, plans: tuple[_ItemPlan, ...]
+) -> Iterator[tuple[_RawItem, _TooltipIndex]]:
+    """Parse the whole page with BeautifulSoup, then yield its items."""
+    if hasattr(file, "read"):
+        html_content = file.read().decode("utf-8")
+    else:
+        with open(file, "r", encoding="utf-8") as f:
+            html_content = f.read()
+    tooltips, raw_items = _parse_bs4(html_content, plans)
+    for raw_item in raw_items:
+        yield raw_item, tooltips
+
+
+def _extract_price(prices: list[str]) -> str | None:
+    """Select the external price (EXT) or else the first price."""
+    for text in prices:
+        if text.startswith("EXT"):
+            # Extract the price after 'CHF'
+            match = _PRICE.search(text)
+            if match:
+                return match.group(1).replace(",", ".")
+            return None
+    # Fallback: if no EXT price found, use the first price if available
+    if prices:
+        match = _PRICE.search(prices[0])
+        if match:
+            return match.group(1).replace(",", ".")
+    return None
+
+
+def _get_parser(engine: str, layouts: Sequence[ItemLayout] = LAYOUTS):
+    """
+    Return the function parsing a page with the engine and the layouts.
+
+    The function takes the html file and yields each raw item with the
+    tooltips of the page, by id.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown parser engine {engine}, expected one of {ENGINES}")
+    if engine == "auto":
+        engine = "lxml" if etree is not None else "bs4"
+    elif engine == "lxml" and etree is None:
+        raise ImportError("The lxml engine requires lxml to be installed")
+    plans = _compile_layouts(tuple(layouts))
+    return partial(_iter_lxml if engine == "lxml" else _iter_bs4, plans=plans)
+
+
+def _make_item(raw_item: _RawItem, tooltips, day: str, date: str) -> MenuItem:
+    """Interpret a raw item as a menu item."""
+    description = raw_item.description
+
+    # Detect vegan/vegetarian by <img> alt or title attributes in label-list
+    is_vegan = False
+    is_vegetarian = False
+    co2_footprint = None
+    glutenfree = False
+    for img in raw_item.images:
+        for label in find_all_labels(img, tooltips):
+            if label == "vegan":
+                is_vegan = True
+            elif label == "vegetarian":
                 is_vegetarian = True
+            elif label == "glutenfree":
+                glutenfree = True
+            elif label.startswith("co2_"):
+                co2_footprint = float(label[4:])
+            # The other labels (e.g. lactosefree) are not in the menus
+
+    # If vegetatrische alternative is possible, mark as vegetarian
+    if "vegetarische alternative" in description.lower():
+        is_vegetarian = True
+    # If vegan, also mark as vegetarian
+    if is_vegan:
+        is_vegetarian = True
+
+    price = _extract_price(raw_item.prices)
+
+    return MenuItem(
+        day=day,
+        date=date,
+        title=raw_item.title,
+        description=description.replace("\n", " ").replace("|", ","),
+        price=float(price) if price is not None else None,
+        provenance=raw_item.provenance,
+        vegan=is_vegan,
+        vegetarian=is_vegetarian,
+        glutenfree=glutenfree,
+        co2_footprint=co2_footprint,
+    )
 
-            menus["day"].append(day)
-            menus["date"].append(date)
-            menus["title"].append(title_menu)
-            menus["description"].append(
-                description.replace("\n", " ").replace("|", ",")
-            )
-            menus["price"].append(price)
-            menus["provenance"].append(provenance)
-            menus["vegan"].append(is_vegan)
-            menus["vegetarian"].append(is_vegetarian)
-            menus["glutenfree"].append(glutenfree)
-            menus["co2_footprint"].append(co2_footprint)
 
-    df_menus = pd.DataFrame(menus)
+def iter_menu_items(
+    file: Path | BinaryIO,
+    date: date,
+    engine: str = "auto",
+    layouts: Sequence[ItemLayout] = LAYOUTS,
+) -> Iterator[MenuItem]:
+    """
+    Read the menu items from a downloaded html page, one at a time.
+
+    With the lxml engine, the items are yielded while the page is parsed and
+    the memory does not grow with the size of the page.
 
-    return df_menus
+    Args:
+        file: The html file of the menu page, or a binary file object
+            of the html, e.g. a stored page from `open_snapshot`.
+        date: The date of the menu.
+        engine: The parser engine to use, one of :data:`ENGINES`.
+        layouts: Layouts of the menu items, see :data:`LAYOUTS`.
+
+    Yields:
+        One :class:`MenuItem` per menu item.
+    """
+    parse = _get_parser(engine, layouts)
+
+    if not hasattr(file, "read"):
+        file = Path(file)
+
+    logger.debug(f"HTML content from {file}")
+
+    day = date.strftime("%A")
+    date = date.strftime("%Y-%m-%d")
+    for raw_item, tooltips in parse(file):
+        yield _make_item(raw_item, tooltips, day, date)
+
+
+def menu_items_to_frame(items: Iterable[MenuItem]) -> pd.DataFrame:
+    """
+    Convert menu items to a DataFrame with the columns of `read_menus`.
+
+    The values are gathered column by column, each column is converted once
+    to its dtype.
+    """
+    rows = list(map(attrgetter(*MENU_COLUMNS), items))
+    columns = zip(*rows) if rows else [()] * len(MENU_COLUMNS)
+    return pd.DataFrame(
+        {name: list(values) for name, values in zip(MENU_COLUMNS, columns)}
+    ).astype(MENU_DTYPES)
+
+
+def read_menus(
+    file: Path | BinaryIO,
+    date: date,
+    engine: str = "auto",
+    layouts: Sequence[ItemLayout] = LAYOUTS,
+) -> pd.DataFrame:
+    """
+    Read the menus from a downloaded html page.
+
+    Args:
+        file: The html file of the menu page, or a binary file object
+            of the html, e.g. a stored page from `open_snapshot`.
+        date: The date of the menu.
+        engine: The parser engine to use, one of :data:`ENGINES`. All engines
+            give the same DataFrame.
+        layouts: Layouts of the menu items, see :data:`LAYOUTS`.
+
+    Returns:
+        One row per menu item.
+    """
+    # <div class="category-grid ng-star-inserted"><app-category _nghost-ng-c4143720142="" class="grid-row ng-star-inserted"><!----><h3 _ngcontent-ng-c4143720142="" class="h3 category-header ng-star-inserted"> Local to Global </h3><!----><app-product-list _ngcontent-ng-c4143720142="" _nghost-ng-c1967480023="" class="ng-star-inserted"><div _ngcontent-ng-c1967480023="" appclickablearea="" class="product-wrapper ng-star-inserted"><div _ngcontent-ng-c1967480023="" layout="row"><div _ngcontent-ng-c1967480023="" flex=""><div _ngcontent-ng-c1967480023="" layout-gt-sm="row"><div _ngcontent-ng-c1967480023="" class="name-column pad-right-sm pad-bottom-sm"><button _ngcontent-ng-c1967480023="" appclickableareatarget="" class="button-reset link-reset"><span _ngcontent-ng-c1967480023="" class="pre-wrap legacy-text-xxl">Buddha Bowl</span></button><div _ngcontent-ng-c1967480023="" class="product-teaser push-top-xs ng-star-inserted"> mit Quinoa, Randen Falafel, Zucchetti, Sesam  Rettich Pickles, Lattich, Cherrytomaten und Olivenöl-Zitronen Dressing | Tagessalat und 1dl Saft </div><!----><!----></div><div _ngcontent-ng-c1967480023="" class="allergen-column ng-star-inserted"><app-product-label-list _ngcontent-ng-c1967480023=""><!----><!----><div class="label-list customtag-list ng-star-inserted"><app-product-custom-tag _nghost-ng-c1604586910="" class="ng-star-inserted"><img _ngcontent-ng-c1604586910="" src="https://files.qnips.com/releaseicons/20230405sviconsvegan_2024.07.02_09.01.13.png" title="Vegan" alt="Vegan" class="ng-star-inserted"><!----><!----></app-product-custom-tag><app-product-custom-tag _nghost-ng-c1604586910="" class="ng-star-inserted"><img _ngcontent-ng-c1604586910="" src="https://files.qnips.com/releaseicons/20230405sviconsglutenfrei_2024.07.02_09.01.40.png" title="Glutenfrei" alt="Glutenfrei" class="ng-star-inserted"><!----><!----></app-product-custom-tag><app-product-custom-tag _nghost-ng-c1604586910="" class="ng-star-inserted"><img _ngcontent-ng-c1604586910="" src="https://files.qnips.com/releaseicons/20230405sviconslaktosefrei_2024.07.02_09.01.51.png" title="Laktosefrei" alt="Laktosefrei" class="ng-star-inserted"><!----><!----></app-product-custom-tag><!----><!----></div><!----></app-product-label-list></div><!----><div _ngcontent-ng-c1967480023="" class="price-column legacy-text-lg text-right pad-left-sm ng-star-inserted"><div _ngcontent-ng-c1967480023="" class="price ng-star-inserted">   <!----> &nbsp;CHF&nbsp;11.50 <!----></div><!----></div><!----><div _ngcontent-ng-c1967480023="" layout="row" layout-gt-sm="column" layout-align="start end"><!----><!----></div></div></div></div><!----></div><!----></app-product-list><!----><!----><!----><!----><!----></app-category><app-category _nghost-ng-c4143720142="" class="grid-row ng-star-inserted"><!----><h3 _ngcontent-ng-c4143720142="" class="h3 category-header ng-star-inserted"> Twist and Trend </h3><!----><app-product-list _ngcontent-ng-c4143720142="" _nghost-ng-c1967480023="" class="ng-star-inserted"><div _ngcontent-ng-c1967480023="" appclickablearea="" class="product-wrapper ng-star-inserted"><div _ngcontent-ng-c1967480023="" layout="row"><div _ngcontent-ng-c1967480023="" flex=""><div _ngcontent-ng-c1967480023="" layout-gt-sm="row"><div _ngcontent-ng-c1967480023="" class="name-column pad-right-sm pad-bottom-sm"><button _ngcontent-ng-c1967480023="" appclickableareatarget="" class="button-reset link-reset"><span _ngcontent-ng-c1967480023="" class="pre-wrap legacy-text-xxl">Berliner Currywurst</span></button><div _ngcontent-ng-c1967480023="" class="product-teaser push-top-xs ng-star-inserted"> mit Pommes Frites | Tagessalat und 1 dl Saft </div><!----><!----></div><div _ngcontent-ng-c1967480023="" class="allergen-column ng-star-inserted"><app-product-label-list _ngcontent-ng-c1967480023=""><!----><!----><div class="label-list customtag-list ng-star-inserted"><app-product-custom-tag _nghost-ng-c1604586910="" class="ng-star-inserted"><img _ngcontent-ng-c1604586910="" src="https://files.qnips.com/releaseicons/20230405sviconsglutenfrei_2024.07.02_09.01.40.png" title="Glutenfrei" alt="Glutenfrei" class="ng-star-inserted"><!----><!----></app-product-custom-tag><app-product-custom-tag _nghost-ng-c1604586910="" class="ng-star-inserted"><img _ngcontent-ng-c1604586910="" src="https://files.qnips.com/releaseicons/20230405sviconslaktosefrei_2024.07.02_09.01.51.png" title="Laktosefrei" alt="Laktosefrei" class="ng-star-inserted"><!----><!----></app-product-custom-tag><!----><!----></div><!----></app-product-label-list></div><!----><div _ngcontent-ng-c1967480023="" class="price-column legacy-text-lg text-right pad-left-sm ng-star-inserted"><div _ngcontent-ng-c1967480023="" class="price ng-star-inserted">   <!----> &nbsp;CHF&nbsp;13.50 <!----></div><!----></div><!----><div _ngcontent-ng-c1967480023="" layout="row" layout-gt-sm="column" layout-align="start end"><!----><!----></div></div></div></div><!----></div><!----></app-product-list><!----><!----><!----><!----><!----></app-category><app-category _nghost-ng-c4143720142="" class="grid-row ng-star-inserted"><!----><h3 _ngcontent-ng-c4143720142="" class="h3 category-header ng-star-inserted"> Grill n’ Bun </h3><!----><app-product-list _ngcontent-ng-c4143720142="" _nghost-ng-c1967480023="" class="ng-star-inserted"><div _ngcontent-ng-c1967480023="" appclickablearea="" class="product-wrapper ng-star-inserted"><div _ngcontent-ng-c1967480023="" layout="row"><div _ngcontent-ng-c1967480023="" flex=""><div _ngcontent-ng-c1967480023="" layout-gt-sm="row"><div _ngcontent-ng-c1967480023="" class="name-column pad-right-sm pad-bottom-sm"><button _ngcontent-ng-c1967480023="" appclickableareatarget="" class="button-reset link-reset"><span _ngcontent-ng-c1967480023="" class="pre-wrap legacy-text-xxl">Empa Fitnessteller</span></button><div _ngcontent-ng-c1967480023="" class="product-teaser push-top-xs ng-star-inserted"> mit Schweins Pfefferspies, Ayvar und Salat nach Wahl vom Buffet | Tagessuppe oder 1dl Saft </div><!----><!----></div><div _ngcontent-ng-c1967480023="" class="allergen-column ng-star-inserted"><app-product-label-list _ngcontent-ng-c1967480023=""><!----><!----><div class="label-list customtag-list ng-star-inserted"><app-product-custom-tag _nghost-ng-c1604586910="" class="ng-star-inserted"><img _ngcontent-ng-c1604586910="" src="https://files.qnips.com/releaseicons/20230405sviconsglutenfrei_2024.07.02_09.01.40.png" title="Glutenfrei" alt="Glutenfrei" class="ng-star-inserted"><!----><!----></app-product-custom-tag><!----><!----></div><!----></app-product-label-list></div><!----><div _ngcontent-ng-c1967480023="" class="price-column legacy-text-lg text-right pad-left-sm ng-star-inserted"><div _ngcontent-ng-c1967480023="" class="price ng-star-inserted">   <!----> &nbsp;CHF&nbsp;16.80 <!----></div><!----></div><!----><div _ngcontent-ng-c1967480023="" layout="row" layout-gt-sm="column" layout-align="start end"><!----><!----></div></div></div></div><!----></div><!----></app-product-list><!----><!----><!----><!----><!----></app-category><app-category _nghost-ng-c4143720142="" class="grid-row ng-star-inserted"><!----><h3 _ngcontent-ng-c4143720142="" class="h3 category-header ng-star-inserted"> Hot &amp; Cold </h3><!----><app-product-list _ngcontent-ng-c4143720142="" _nghost-ng-c1967480023="" class="ng-star-inserted"><div _ngcontent-ng-c1967480023="" appclickablearea="" class="product-wrapper ng-star-inserted"><div _ngcontent-ng-c1967480023="" layout="row"><div _ngcontent-ng-c1967480023="" flex=""><div _ngcontent-ng-c1967480023="" layout-gt-sm="row"><div _ngcontent-ng-c1967480023="" class="name-column pad-right-sm pad-bottom-sm"><button _ngcontent-ng-c1967480023="" appclickableareatarget="" class="button-reset link-reset"><span _ngcontent-ng-c1967480023="" class="pre-wrap legacy-text-xxl">Öffnungszeiten Sommerferien</span></button><div _ngcontent-ng-c1967480023="" class="product-teaser push-top-xs ng-star-inserted"> Das Restaurant Fire ist von  06.30 - 13.30 Uhr geöffnet Mittagsservice ist von 11.15 - 13.00 Uhr </div><!----><!----></div><div _ngcontent-ng-c1967480023="" class="allergen-column ng-star-inserted"><app-product-label-list _ngcontent-ng-c1967480023=""><!----><!----><!----></app-product-label-list></div><!----><div _ngcontent-ng-c1967480023="" class="price-column legacy-text-lg text-right pad-left-sm ng-star-inserted"><!----></div><!----><div _ngcontent-ng-c1967480023="" layout="row" layout-gt-sm="column" layout-align="start end"><!----><!----></div></div></div></div><!----></div><!----></app-product-list><!----><!----><!----><!----><!----></app-category><!----></div>
+    return menu_items_to_frame(
+        iter_menu_items(file, date=date, engine=engine, layouts=layouts)
+    )
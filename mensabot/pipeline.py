@@ -0,0 +1,314 @@
+"""
+Steps of a mensabot run shared by the command line and the other entry
+points: which pages to fetch for which days, and parsing them.
+"""
+
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+from .cache import ParseCache, read_menus_cached
+from .fetcher import FetchJob
+from .metrics import METRICS, count, span
+from .parser import MENU_COLUMNS, MENU_DTYPES, read_menus
+
+logger = logging.getLogger(__name__)
+
+RESTAURANT_URIS = {
+    "Empa": "https://sv-restaurant.ch/menu/Empa-EAWAG,%20D%C3%BCbendorf/Mittagsmen%C3%BC%20Fire",
+    "Eawag": "https://sv-restaurant.ch/menu/Empa-EAWAG,%20D%C3%BCbendorf/Lunch%20Aqa",
+    "Amag": "https://sv-restaurant.ch/menu/AMAG,%20D%C3%BCbendorf/Mittagsmen%C3%BC",
+    "Memphis": "https://sv-restaurant.ch/menu/Memphis,%20D%C3%BCbendorf/Lunch",
+}
+
+# Up to this number of pages, parsing in the main process is faster than
+# starting worker processes
+SEQUENTIAL_PARSE_LIMIT = 8
+
+
+@dataclass
+class ParseResult:
+    """Menus parsed from the html of a :class:`FetchJob`, or the error."""
+
+    job: FetchJob
+    menus: pd.DataFrame | None = None
+    error: Exception | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def determine_target_date(custom_date_str: str = None, use_today: bool = False) -> date:
+    """
+    Determine the target date for fetching the menu.
+
+    Args:
+        custom_date_str: Custom date in YYYY-MM-DD format. Takes precedence over use_today.
+        use_today: If True, use today's date. Otherwise, use next workday.
+
+    Returns:
+        The date to fetch the menu for.
+
+    Raises:
+        ValueError: If custom_date_str is provided but invalid format.
+    """
+    if custom_date_str:
+        # Custom date provided
+        try:
+            return datetime.strptime(custom_date_str, "%Y-%m-%d").date()
+        except ValueError:
+            logger.error(f"Invalid date format: {custom_date_str}. Expected YYYY-MM-DD")
+            raise ValueError(
+                f"Invalid date format: {custom_date_str}. Expected YYYY-MM-DD"
+            )
+
+    # Use --today flag or default to next workday
+    today = date.today()
+    if use_today:
+        return today
+
+    # Calculate next workday (skip to Monday if Friday)
+    return today + timedelta(days=1 if today.weekday() != 4 else 3)
+
+
+def determine_target_days(
+    target_date: date, date_range: list[str] | None = None, week: bool = False
+) -> list[date]:
+    """
+    Determine all the days for fetching the menus.
+
+    Args:
+        target_date: The day given by `determine_target_date`.
+        date_range: First and last date in YYYY-MM-DD format. Takes precedence
+            over week.
+        week: If True, use the Monday to Friday week of target_date.
+
+    Returns:
+        The workdays (Monday to Friday) of the range, or only target_date.
+
+    Raises:
+        ValueError: If the dates of date_range are invalid.
+    """
+    if date_range:
+        start, end = (determine_target_date(custom_date_str=d) for d in date_range)
+        if end < start:
+            raise ValueError(f"End of the range {end} is before its start {start}")
+    elif week:
+        start = target_date - timedelta(days=target_date.weekday())
+        end = start + timedelta(days=4)
+    else:
+        return [target_date]
+
+    days = (start + timedelta(days=i) for i in range((end - start).days + 1))
+    return [day for day in days if day.weekday() < 5]
+
+
+def get_html_file(work_dir: Path, restaurant: str, day: date) -> Path:
+    return Path(work_dir) / restaurant / "raw_html" / f"menu_{day:%Y-%m-%d}.html"
+
+
+def make_fetch_jobs(
+    work_dir: Path,
+    days: list[date],
+    uris: dict[str, str] = RESTAURANT_URIS,
+    append_date_to_uri: bool = True,
+    timeouts: dict[str, float] = {},
+) -> list[FetchJob]:
+    """
+    Create the jobs fetching the menu of every restaurant for every day.
+
+    Args:
+        work_dir: Working directory, the html is saved in its raw_html dirs.
+        days: Days of the menus.
+        uris: Menu page of each restaurant.
+        append_date_to_uri: Whether to ask for the day in the uri, otherwise
+            the page of the current day is fetched.
+        timeouts: Timeout of the fetch of each restaurant, in seconds, see
+            `FetchJob`. The other restaurants use the default timeouts.
+
+    Returns:
+        The jobs, grouped by day.
+    """
+    jobs = []
+    for day in days:
+        for restaurant, uri in uris.items():
+            if append_date_to_uri:
+                uri = uri + "/date/" + day.strftime("%Y-%m-%d")
+            file = get_html_file(work_dir, restaurant, day)
+            file.parent.mkdir(exist_ok=True, parents=True)
+            jobs.append(
+                FetchJob(
+                    restaurant=restaurant,
+                    uri=uri,
+                    file=file,
+                    day=day,
+                    timeout=timeouts.get(restaurant),
+                )
+            )
+    return jobs
+
+
+def parse_timeouts(specs: list[str], restaurants: list[str]) -> dict[str, float]:
+    """
+    Read the fetch timeouts of the command line.
+
+    Args:
+        specs: Timeouts as "SECONDS" for all the restaurants or
+            "RESTAURANT=SECONDS", the later ones override the earlier ones.
+        restaurants: Known restaurants.
+
+    Returns:
+        The timeout of each restaurant having one.
+
+    Raises:
+        ValueError: If a restaurant is unknown or a timeout is not positive.
+    """
+    timeouts = {}
+    for spec in specs:
+        restaurant, _, seconds = spec.rpartition("=")
+        if restaurant and restaurant not in restaurants:
+            raise ValueError(
+                f"Unknown restaurant {restaurant}, expected one of {restaurants}"
+            )
+        timeout = float(seconds)
+        if timeout <= 0:
+            raise ValueError(f"Invalid timeout {spec}, it must be positive")
+        for name in [restaurant] if restaurant else restaurants:
+            timeouts[name] = timeout
+    return timeouts
+
+
+def _parse_job(job: FetchJob, cache: ParseCache | None, engine: str) -> pd.DataFrame:
+    with span("parse", restaurant=job.restaurant):
+        if cache is not None:
+            df = read_menus_cached(job.file, date=job.day, cache=cache, engine=engine)
+        else:
+            df = read_menus(job.file, date=job.day, engine=engine)
+    count("items_parsed", len(df), restaurant=job.restaurant)
+    df["restaurant"] = job.restaurant
+    return df
+
+
+def _parse_job_in_worker(
+    job: FetchJob, cache: ParseCache | None, engine: str
+) -> tuple[pd.DataFrame, dict]:
+    # The metrics of the worker are sent back with the menus
+    METRICS.reset()
+    df = _parse_job(job, cache, engine)
+    return df, METRICS.state()
+
+
+def parse_jobs(
+    jobs: list[FetchJob],
+    cache: ParseCache | None = None,
+    engine: str = "auto",
+    workers: int | None = None,
+) -> list[ParseResult]:
+    """
+    Parse the html saved by the jobs, in parallel processes if many.
+
+    Args:
+        jobs: The fetched jobs.
+        cache: Cache of the parsed menus, not used if not given.
+        engine: Parser engine, see `read_menus`.
+        workers: Number of processes. By default, the pages are parsed in
+            this process if there are few of them, else one per cpu.
+
+    Returns:
+        One result per job, in the same order as the jobs. The menus have a
+        restaurant column.
+    """
+    if workers is None:
+        workers = 1 if len(jobs) <= SEQUENTIAL_PARSE_LIMIT else os.cpu_count() or 1
+
+    results = []
+    if workers <= 1:
+        for job in jobs:
+            try:
+                results.append(ParseResult(job, menus=_parse_job(job, cache, engine)))
+            except Exception as e:
+                results.append(ParseResult(job, error=e))
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_parse_job_in_worker, job, cache, engine) for job in jobs
+        ]
+        for job, future in zip(jobs, futures):
+            try:
+                menus, metrics = future.result()
+                METRICS.merge(metrics)
+                results.append(ParseResult(job, menus=menus))
+            except Exception as e:
+                results.append(ParseResult(job, error=e))
+    return results
+
+
+def save_menus(
+    work_dir: Path, restaurant: str, day: date, df: pd.DataFrame, store: str = "csv"
+) -> None:
+    """
+    Save the menus of a restaurant for a day.
+
+    Args:
+        work_dir: Working directory.
+        restaurant: Restaurant of the menus.
+        day: Day of the menus.
+        df: Menus as returned by `read_menus`, with a restaurant column.
+        store: "csv" for a csv file per restaurant and day, or "parquet" for
+            the archive of the work directory.
+    """
+    with span("save", restaurant=restaurant, store=store):
+        if store == "parquet":
+            # pyarrow is only needed for this store
+            from .store import append_menus, get_archive_dir
+
+            append_menus(get_archive_dir(work_dir), df, partitions=[(restaurant, day)])
+        else:
+            cleaned_csv_dir = Path(work_dir) / restaurant / "menus"
+            cleaned_csv_dir.mkdir(exist_ok=True, parents=True)
+            df.to_csv(
+                cleaned_csv_dir / f"menu_{day.strftime('%Y-%m-%d')}.csv", index=False
+            )
+
+
+def load_saved_menus(work_dir: Path, day: date, store: str = "csv") -> pd.DataFrame:
+    """
+    Load the menus of all the restaurants saved by `save_menus` for a day.
+
+    Returns:
+        The menus with the columns of `read_menus` and the restaurant, empty
+        if none were saved.
+    """
+    columns = MENU_COLUMNS + ["restaurant"]
+    if store == "parquet":
+        from .store import get_archive_dir, load_menus
+
+        return load_menus(get_archive_dir(work_dir), start=day, end=day)
+
+    menus = []
+    for csv_file in sorted(Path(work_dir).glob(f"*/menus/menu_{day:%Y-%m-%d}.csv")):
+        try:
+            df = pd.read_csv(csv_file)
+        except pd.errors.EmptyDataError:
+            continue
+        # The restaurant is given by the directory, older files lack the column
+        df["restaurant"] = csv_file.parent.parent.name
+        menus.append(df)
+    if not menus:
+        return pd.DataFrame(columns=columns).astype(MENU_DTYPES)
+
+    df = pd.concat(menus, ignore_index=True).reindex(columns=columns)
+    df = df.astype(MENU_DTYPES)
+    # Empty text columns are read as float NaN by read_csv
+    text_columns = [c for c in columns if c not in MENU_DTYPES]
+    df[text_columns] = (
+        df[text_columns].astype(object).where(df[text_columns].notna(), None)
+    )
+    return df
@@ -0,0 +1,313 @@
+"""
+Parse again all the saved html pages, e.g. after a change of the parser.
+
+The pages kept in `<work_dir>/<restaurant>/raw_html/menu_<YYYY-MM-DD>.html`
+and in the snapshot store (see `mensabot.snapshots`) are parsed in chunks by
+a pool of processes and the menus are written to the menu store as the
+chunks complete::
+
+    python -m mensabot.reparse --store parquet
+"""
+
+import argparse
+import logging
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import date, datetime
+from pathlib import Path
+
+import pandas as pd
+
+from .parser import ENGINES, MENU_COLUMNS, read_menus
+from .pipeline import save_menus
+from .snapshots import SnapshotStore, get_snapshot_dir, open_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Number of chunks per worker when the chunk size is not given: enough to
+# balance the load between the workers while keeping the overhead of each
+# chunk small
+CHUNKS_PER_WORKER = 4
+
+# Maximum number of pages of a chunk when the chunk size is not given
+MAX_CHUNK_SIZE = 64
+
+# Minimum time between two progress logs, in seconds
+PROGRESS_INTERVAL = 2.0
+
+_FILE_PREFIX = "menu_"
+
+
+@dataclass(frozen=True)
+class RawPage:
+    """A saved html page of a restaurant for a day, or its stored snapshot."""
+
+    restaurant: str
+    day: date
+    file: Path
+
+
+@dataclass
+class ReparseStats:
+    """Counts and duration of a re-parse."""
+
+    files: int = 0
+    items: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files / self.seconds if self.seconds else 0.0
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.seconds if self.seconds else 0.0
+
+
+def discover_raw_pages(
+    work_dir: Path, restaurants: list[str] | None = None
+) -> list[RawPage]:
+    """
+    Find the saved html pages of the work directory.
+
+    The html files of the raw_html directories are used first, the other
+    pages are read from the snapshot store.
+
+    Args:
+        work_dir: Working directory.
+        restaurants: Only the pages of these restaurants. All if not given.
+
+    Returns:
+        The pages, sorted by restaurant and day.
+    """
+    pages = {}
+    for file in sorted(Path(work_dir).glob(f"*/raw_html/{_FILE_PREFIX}*.html")):
+        restaurant = file.parent.parent.name
+        try:
+            day = datetime.strptime(file.stem[len(_FILE_PREFIX) :], "%Y-%m-%d").date()
+        except ValueError:
+            logger.debug(f"Ignoring {file}, its name has no date")
+            continue
+        pages[(restaurant, day)] = RawPage(restaurant, day, file)
+
+    snapshot_dir = get_snapshot_dir(work_dir)
+    if snapshot_dir.is_dir():
+        for restaurant, day, file in SnapshotStore(snapshot_dir).pages():
+            pages.setdefault((restaurant, day), RawPage(restaurant, day, file))
+
+    return [
+        page
+        for _, page in sorted(pages.items())
+        if restaurants is None or page.restaurant in restaurants
+    ]
+
+
+def _chunks(pages: list[RawPage], size: int) -> list[list[RawPage]]:
+    return [pages[i : i + size] for i in range(0, len(pages), size)]
+
+
+def _parse_chunk(
+    pages: list[RawPage], engine: str
+) -> tuple[pd.DataFrame, list[RawPage], list[tuple[RawPage, str]]]:
+    """
+    Parse the pages of a chunk, in a worker process.
+
+    The menus are returned as a single DataFrame, much cheaper to send back
+    to the main process than one per page.
+
+    Returns:
+        The menus with a restaurant column, the pages that were parsed and
+        the pages that failed with their error.
+    """
+    menus = []
+    parsed = []
+    errors = []
+    for page in pages:
+        try:
+            # The snapshots are decompressed while they are parsed
+            with open_snapshot(page.file) as f:
+                df = read_menus(f, date=page.day, engine=engine)
+        except Exception as e:
+            errors.append((page, f"{type(e).__name__}: {e}"))
+            continue
+        df["restaurant"] = page.restaurant
+        menus.append(df)
+        parsed.append(page)
+
+    columns = MENU_COLUMNS + ["restaurant"]
+    df = pd.concat(menus, ignore_index=True) if menus else pd.DataFrame()
+    return df.reindex(columns=columns), parsed, errors
+
+
+def _write_chunk(
+    work_dir: Path, store: str, df: pd.DataFrame, parsed: list[RawPage]
+) -> None:
+    """Write the menus of a chunk to the store, in bulk for parquet."""
+    if store == "parquet":
+        from .store import append_menus, get_archive_dir
+
+        partitions = [(page.restaurant, page.day) for page in parsed]
+        append_menus(get_archive_dir(work_dir), df, partitions=partitions)
+        return
+
+    groups = dict(iter(df.groupby(["restaurant", "date"], sort=False)))
+    for page in parsed:
+        key = (page.restaurant, page.day.strftime("%Y-%m-%d"))
+        # A page without menus (e.g. a holiday) is saved empty, like in a run
+        menus = groups.get(key, df.iloc[:0])
+        save_menus(work_dir, page.restaurant, page.day, menus.reset_index(drop=True))
+
+
+def reparse(
+    work_dir: Path,
+    store: str = "csv",
+    workers: int | None = None,
+    chunk_size: int | None = None,
+    engine: str = "auto",
+    restaurants: list[str] | None = None,
+) -> ReparseStats:
+    """
+    Parse all the saved html pages again and save their menus.
+
+    Args:
+        work_dir: Working directory with the saved pages.
+        store: Where the menus are saved, see `save_menus`.
+        workers: Number of processes, one per cpu by default. With 1, the
+            pages are parsed in this process.
+        chunk_size: Number of pages parsed by a worker at once. By default
+            each worker gets a few chunks, of at most MAX_CHUNK_SIZE pages.
+        engine: Parser engine, see `read_menus`.
+        restaurants: Only the pages of these restaurants. All if not given.
+
+    Returns:
+        The number of pages, menu items and errors, and the duration.
+    """
+    start = time.perf_counter()
+    pages = discover_raw_pages(work_dir, restaurants)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = max(
+            1,
+            min(MAX_CHUNK_SIZE, math.ceil(len(pages) / (workers * CHUNKS_PER_WORKER))),
+        )
+    chunks = _chunks(pages, chunk_size)
+    logger.info(
+        f"Parsing {len(pages)} pages in {len(chunks)} chunks with {workers} workers"
+    )
+
+    stats = ReparseStats()
+    last_progress = start
+
+    def collect(df, parsed, errors):
+        nonlocal last_progress
+        _write_chunk(work_dir, store, df, parsed)
+        for page, error in errors:
+            logger.error(f"Error parsing {page.file}: {error}")
+        stats.files += len(parsed) + len(errors)
+        stats.items += len(df)
+        stats.errors += len(errors)
+
+        now = time.perf_counter()
+        if now - last_progress >= PROGRESS_INTERVAL or stats.files == len(pages):
+            last_progress = now
+            rate = stats.files / (now - start)
+            logger.info(
+                f"Parsed {stats.files}/{len(pages)} pages "
+                f"({stats.files / len(pages):.0%}), {rate:.1f} pages/s, "
+                f"{(len(pages) - stats.files) / rate:.0f} s left"
+            )
+
+    if workers <= 1:
+        for chunk in chunks:
+            collect(*_parse_chunk(chunk, engine))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_parse_chunk, chunk, engine) for chunk in chunks]
+            for future in as_completed(futures):
+                collect(*future.result())
+
+    stats.seconds = time.perf_counter() - start
+    logger.info(
+        f"Re-parsed {stats.files} pages ({stats.errors} errors) into "
+        f"{stats.items} menu items in {stats.seconds:.1f} s: "
+        f"{stats.files_per_second:.1f} pages/s, {stats.items_per_second:.0f} items/s"
+    )
+    return stats
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Mensabot - Parse all the saved html pages again",
+    )
+
+    parser.add_argument(
+        "--work-dir",
+        type=str,
+        default=Path.home() / ".mensabot",
+        help="Working directory with the menu data (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--store",
+        choices=["csv", "parquet"],
+        default="csv",
+        help="Where to save the menus (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of parsing processes (default: one per cpu)",
+    )
+
+    parser.add_argument(
+        "--chunk-size",
+        dest="chunk_size",
+        type=int,
+        default=None,
+        help="Number of pages parsed by a worker at once (default: automatic)",
+    )
+
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="auto",
+        help="Parser engine (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--restaurant",
+        dest="restaurants",
+        action="append",
+        default=None,
+        help="Only parse the pages of this restaurant (repeatable)",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+    # The parser logs every page, keep the output to the progress
+    logging.getLogger("mensabot.parser").setLevel(logging.WARNING)
+
+    reparse(
+        Path(args.work_dir),
+        store=args.store,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        engine=args.engine,
+        restaurants=args.restaurants,
+    )
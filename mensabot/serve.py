@@ -0,0 +1,531 @@
+"""
+Long running mensabot: fetch the menus and post them on cron schedules.
+
+Instead of starting python, importing the libraries and launching a browser
+for every run, the daemon starts once and keeps a warm browser and the
+parsed menus in memory. Run it with::
+
+    python -m mensabot.serve --post "0 14 * * 1-5" --fetch "30 13 * * 1-5"
+
+The fetch schedule can be given per restaurant, e.g.
+``--fetch "Empa=*/20 12-13 * * 1-5"``. The schedules are cron expressions
+(minute, hour, day of month, month, day of week) in local time.
+"""
+
+import argparse
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+from .api import MenuApi, MenuIndex
+from .cache import ParseCache, get_cache_dir
+from .delivery import get_mattermost_webhook_urls, send_mattermost_message
+from .fetcher import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_ROUTE_POLICY,
+    RoutePolicy,
+    fetch_async,
+    make_route_policy,
+)
+from .formatting import format_message, format_sections
+from .metrics import configure_logging
+from .pipeline import (
+    RESTAURANT_URIS,
+    determine_target_date,
+    make_fetch_jobs,
+    parse_jobs,
+    save_menus,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POST_SCHEDULE = "0 14 * * 1-5"
+DEFAULT_FETCH_SCHEDULE = "30 13 * * 1-5"
+
+# Range of the values of each field of a cron expression
+_CRON_FIELDS = (
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day", 1, 31),
+    ("month", 1, 12),
+    ("weekday", 0, 7),
+)
+
+# A schedule without any match in this time is invalid (e.g. "0 0 30 2 *")
+_MAX_SEARCH = timedelta(days=366 * 5)
+
+
+def _parse_cron_field(text: str, name: str, low: int, high: int) -> set[int]:
+    values = set()
+    for part in text.split(","):
+        value_range, _, step = part.partition("/")
+        if value_range == "*":
+            start, end = low, high
+        elif "-" in value_range:
+            start, end = (int(v) for v in value_range.split("-"))
+        else:
+            start = int(value_range)
+            # "a/n" means from a to the end every n
+            end = high if step else start
+        step = int(step) if step else 1
+        if not low <= start <= end <= high or step < 1:
+            raise ValueError(f"Invalid {name} '{part}' in cron expression")
+        values.update(range(start, end + 1, step))
+    if name == "weekday" and 7 in values:
+        # Sunday is both 0 and 7
+        values.remove(7)
+        values.add(0)
+    return values
+
+
+class CronSchedule:
+    """
+    Times matching a cron expression, with minute resolution.
+
+    The expression has the 5 usual fields: minute, hour, day of month, month
+    and day of week (0 or 7 is Sunday). Each field is ``*``, a value, a
+    range ``a-b``, a step ``*/n`` or ``a-b/n``, or a comma separated list of
+    those. Like cron, if both days are restricted a time matches either.
+    """
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != len(_CRON_FIELDS):
+            raise ValueError(
+                f"Cron expression '{expression}' must have {len(_CRON_FIELDS)} fields"
+            )
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            _parse_cron_field(text, *field) for text, field in zip(fields, _CRON_FIELDS)
+        )
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    def __repr__(self) -> str:
+        return f"CronSchedule({self.expression!r})"
+
+    def _matches_day(self, day: date) -> bool:
+        in_days = day.day in self.days
+        # Python counts the days from Monday, cron from Sunday
+        in_weekdays = (day.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return in_days and in_weekdays
+        return in_days or in_weekdays
+
+    def matches(self, time: datetime) -> bool:
+        return (
+            time.minute in self.minutes
+            and time.hour in self.hours
+            and time.month in self.months
+            and self._matches_day(time)
+        )
+
+    def next_after(self, time: datetime) -> datetime:
+        """First time of the schedule strictly after `time`."""
+        start = time.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        candidate = start
+        while candidate - start < _MAX_SEARCH:
+            if candidate.month not in self.months or not self._matches_day(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron expression '{self.expression}' never matches")
+
+
+class MenuDaemon:
+    """
+    Fetch, parse and post the menus on schedules, in one long running process.
+
+    Args:
+        work_dir: Working directory, like the one of the command line.
+        fetch_schedules: When to fetch the menu of each restaurant.
+        post_schedule: When to post the menus, not posted if None.
+        uris: Menu page of each restaurant.
+        concurrency: Number of pages fetched at the same time.
+        store: Where the menus are saved, see `save_menus`.
+        use_today: Post the menus of the current day instead of the next
+            workday.
+        debug: Log the messages instead of sending them.
+        index: Menus served by the HTTP API, updated after each fetch.
+        api_address: (host, port) where the HTTP API listens, not served if
+            None.
+        route_policy: Requests of the pages let through by the browser, see
+            `mensabot.fetcher.fetch_all_async`.
+    """
+
+    def __init__(
+        self,
+        work_dir: Path,
+        fetch_schedules: dict[str, CronSchedule],
+        post_schedule: CronSchedule | None = None,
+        uris: dict[str, str] = RESTAURANT_URIS,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        store: str = "csv",
+        use_today: bool = False,
+        debug: bool = False,
+        index: MenuIndex | None = None,
+        api_address: tuple[str, int] | None = None,
+        route_policy: RoutePolicy | None = DEFAULT_ROUTE_POLICY,
+    ):
+        self.work_dir = Path(work_dir)
+        self.fetch_schedules = fetch_schedules
+        self.post_schedule = post_schedule
+        self.uris = uris
+        self.concurrency = concurrency
+        self.store = store
+        self.use_today = use_today
+        self.debug = debug
+        self.index = index
+        self.api_address = api_address
+        self.route_policy = route_policy
+
+        self.cache = ParseCache(get_cache_dir(self.work_dir))
+        # Parsed menus, by (restaurant, day)
+        self.menus: dict[tuple[str, date], pd.DataFrame] = {}
+        self.browser = None
+        # Running playwright while the browser is used, to launch it again
+        self._playwright = None
+        self._browser_lock = asyncio.Lock()
+
+    def target_day(self) -> date:
+        return determine_target_date(use_today=self.use_today)
+
+    async def _launch_browser(self):
+        return await self._playwright.chromium.launch(headless=True)
+
+    async def _check_browser(self) -> None:
+        """Launch the browser again if it crashed or was disconnected."""
+        if self._playwright is None:
+            return
+        # Fetches scheduled together launch a single browser
+        async with self._browser_lock:
+            if self.browser is not None and self.browser.is_connected():
+                return
+            if self.browser is not None:
+                logger.warning("The browser was disconnected, launching it again")
+            self.browser = await self._launch_browser()
+
+    async def refresh(self, restaurants: list[str], day: date) -> list[str]:
+        """
+        Fetch and parse the menus of the restaurants for the day.
+
+        Returns:
+            The errors, the menus of the other restaurants are updated.
+        """
+        uris = {restaurant: self.uris[restaurant] for restaurant in restaurants}
+        jobs = make_fetch_jobs(
+            self.work_dir, [day], uris=uris, append_date_to_uri=not self.use_today
+        )
+        await self._check_browser()
+        results = await fetch_async(
+            jobs,
+            concurrency=self.concurrency,
+            browser=self.browser,
+            route_policy=self.route_policy,
+        )
+
+        errors = [
+            f"Error processing {result.job.restaurant} menu of {day}: {result.error}"
+            for result in results
+            if not result.ok
+        ]
+        # The menus of the pages that did not change are already up to date
+        fetched = [
+            result.job
+            for result in results
+            if result.ok
+            and (result.changed or (result.job.restaurant, day) not in self.menus)
+        ]
+        parse_results = await asyncio.to_thread(
+            parse_jobs, fetched, cache=self.cache, workers=1
+        )
+        for result in parse_results:
+            restaurant = result.job.restaurant
+            if not result.ok:
+                errors.append(
+                    f"Error processing {restaurant} menu of {day}: {result.error}"
+                )
+                continue
+            self.menus[(restaurant, day)] = result.menus
+            await asyncio.to_thread(
+                save_menus, self.work_dir, restaurant, day, result.menus, self.store
+            )
+            if self.index is not None:
+                self.index.update(restaurant, day, result.menus)
+
+        for error in errors:
+            logger.error(error)
+        logger.info(f"Refreshed {len(parse_results)} menus of {day}")
+        return errors
+
+    async def post(self) -> str:
+        """Post the menus of the target day, fetching the missing ones first."""
+        day = self.target_day()
+        # Menus of the days that were posted are not needed anymore
+        for key in [key for key in self.menus if key[1] < day]:
+            del self.menus[key]
+
+        missing = [r for r in self.uris if (r, day) not in self.menus]
+        errors = await self.refresh(missing, day) if missing else []
+
+        menus = [self.menus[(r, day)] for r in self.uris if (r, day) in self.menus]
+        try:
+            sections = format_sections(menus, [day], uris=self.uris)
+        except Exception as e:
+            logger.error(f"Error processing the dataframes: {e}")
+            errors.append(f"Error processing the dataframes: {e}")
+            sections = [f"# {day.strftime('%A %d %B')} \n\nNo data available"]
+        text = format_message(sections, errors)
+
+        if self.debug:
+            logger.info(f"Debug mode - Message content:\n{text}")
+        else:
+            urls = get_mattermost_webhook_urls(self.work_dir / "mattermost_url.txt")
+            await asyncio.to_thread(send_mattermost_message, urls=urls, text=text)
+            logger.info(f"Posted the menus of {day}")
+        return text
+
+    async def _run_on_schedule(self, schedule: CronSchedule, action, name: str):
+        while True:
+            now = datetime.now()
+            next_time = schedule.next_after(now)
+            logger.info(f"Next {name} at {next_time:%Y-%m-%d %H:%M}")
+            await asyncio.sleep((next_time - now).total_seconds())
+            try:
+                await action()
+            except Exception as e:
+                # A failed run must not stop the daemon
+                logger.exception(f"Error during {name}: {e}")
+
+    def _tasks(self) -> list:
+        # Restaurants sharing a schedule are fetched together
+        groups = {}
+        for restaurant, schedule in self.fetch_schedules.items():
+            groups.setdefault(schedule.expression, (schedule, []))[1].append(restaurant)
+
+        tasks = []
+        for schedule, restaurants in groups.values():
+
+            async def fetch(restaurants=restaurants):
+                await self.refresh(restaurants, self.target_day())
+
+            tasks.append(
+                self._run_on_schedule(schedule, fetch, f"fetch of {restaurants}")
+            )
+        if self.post_schedule is not None:
+            tasks.append(self._run_on_schedule(self.post_schedule, self.post, "post"))
+        return tasks
+
+    async def run(self) -> None:
+        """Run the schedules (and the HTTP API) until cancelled."""
+        if self.api_address is not None:
+            if self.index is None:
+                self.index = MenuIndex(self.work_dir, store=self.store, uris=self.uris)
+            server = await MenuApi(self.index).start(*self.api_address)
+
+        try:
+            from playwright.async_api import async_playwright
+
+            # Launched once, each page gets a fresh context of the browser. It
+            # is launched again before a fetch if it crashed.
+            async with async_playwright() as p:
+                self._playwright = p
+                try:
+                    await self._check_browser()
+                    await asyncio.gather(*self._tasks())
+                finally:
+                    if self.browser is not None and self.browser.is_connected():
+                        await self.browser.close()
+                    self.browser = None
+                    self._playwright = None
+        finally:
+            if self.api_address is not None:
+                server.close()
+
+
+def parse_fetch_schedules(
+    specs: list[str], restaurants: list[str]
+) -> dict[str, CronSchedule]:
+    """
+    Read the --fetch arguments.
+
+    Args:
+        specs: Cron expressions, for all the restaurants or for one
+            restaurant as "RESTAURANT=CRON".
+        restaurants: All the restaurants.
+
+    Returns:
+        The schedule of each restaurant.
+    """
+    schedules = {}
+    for spec in specs:
+        restaurant, sep, expression = spec.partition("=")
+        if not sep:
+            schedule = CronSchedule(spec)
+            schedules.update({r: schedule for r in restaurants})
+        elif restaurant not in restaurants:
+            raise ValueError(f"Unknown restaurant {restaurant}, expected {restaurants}")
+        else:
+            schedules[restaurant] = CronSchedule(expression)
+    return schedules
+
+
+def parse_arguments(argv: list[str] | None = None, prog: str | None = None):
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Mensabot - Fetch and post the menus on schedules",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s                                       # Fetch at 13:30, post at 14:00
+  %(prog)s --today --post "30 10 * * 1-5"        # Post the menus of the day
+  %(prog)s --fetch "Empa=*/20 12-13 * * 1-5"     # Fetch one restaurant more often
+  %(prog)s --debug                               # Log the messages, don't send them
+        """,
+    )
+
+    parser.add_argument(
+        "--fetch",
+        action="append",
+        default=None,
+        metavar="[RESTAURANT=]CRON",
+        help=(
+            "When to fetch the menus, for all restaurants or for one "
+            f"(default: '{DEFAULT_FETCH_SCHEDULE}')"
+        ),
+    )
+
+    parser.add_argument(
+        "--post",
+        default=DEFAULT_POST_SCHEDULE,
+        metavar="CRON",
+        help="When to post the menus to Mattermost (default: '%(default)s')",
+    )
+
+    parser.add_argument(
+        "--today",
+        action="store_true",
+        help="Post today's menu instead of next workday's menu",
+    )
+
+    parser.add_argument(
+        "--debug",
+        action="store_true",
+        help="Enable debug mode (don't send to Mattermost, show message content)",
+    )
+
+    parser.add_argument(
+        "--work-dir",
+        type=str,
+        default=Path.home() / ".mensabot",
+        help="Working directory for storing menu data (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="Number of pages downloaded at the same time (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--allow-domain",
+        dest="allow_domains",
+        action="append",
+        default=[],
+        metavar="DOMAIN",
+        help=(
+            "Domain the browser may load resources from, besides the page's "
+            "own domain and the menu API (repeatable)"
+        ),
+    )
+
+    parser.add_argument(
+        "--load-all-resources",
+        dest="load_all_resources",
+        action="store_true",
+        help="Let the browser load the images, fonts and third-party resources",
+    )
+
+    parser.add_argument(
+        "--store",
+        choices=["csv", "parquet"],
+        default="csv",
+        help="Where to save the menus (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--api-port",
+        dest="api_port",
+        type=int,
+        default=None,
+        help="Also serve the menus over HTTP on this port, see mensabot.api",
+    )
+
+    parser.add_argument(
+        "--api-host",
+        dest="api_host",
+        default="127.0.0.1",
+        help="Address of the HTTP API (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--log-level",
+        "--log",
+        dest="log_level",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+        default="INFO",
+        help="Set logging level (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--log-format",
+        dest="log_format",
+        choices=["text", "json"],
+        default="text",
+        help="Format of the logs, see mensabot.metrics (default: %(default)s)",
+    )
+
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None, prog: str | None = None):
+    """Run the daemon, also as ``mensabot serve``."""
+    args = parse_arguments(argv, prog=prog)
+
+    configure_logging(args.log_level, args.log_format)
+
+    restaurants = list(RESTAURANT_URIS)
+    daemon = MenuDaemon(
+        Path(args.work_dir),
+        fetch_schedules=parse_fetch_schedules(
+            args.fetch or [DEFAULT_FETCH_SCHEDULE], restaurants
+        ),
+        post_schedule=CronSchedule(args.post),
+        concurrency=args.concurrency,
+        store=args.store,
+        use_today=args.today,
+        debug=args.debug,
+        api_address=(
+            (args.api_host, args.api_port) if args.api_port is not None else None
+        ),
+        route_policy=make_route_policy(
+            args.allow_domains, load_all=args.load_all_resources
+        ),
+    )
+    try:
+        asyncio.run(daemon.run())
+    except KeyboardInterrupt:
+        logger.info("Stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+"""
+Compressed and deduplicated store of the downloaded html pages.
+
+The rendered pages are large and very similar from one day and one
+restaurant to the next. Each distinct page is stored once, compressed with
+zstd (with a dictionary trained on the pages, if one was trained) or with
+gzip when the zstandard package is not installed::
+
+    <work_dir>/snapshots/objects/<ab>/<sha256>.html.zst
+    <work_dir>/snapshots/refs/<restaurant>/menu_<YYYY-MM-DD>.ref
+    <work_dir>/snapshots/dictionaries/<id>.zdict
+
+The pages saved in raw_html are moved into the store, and a dictionary
+trained on them, with::
+
+    python -m mensabot.snapshots import --train --delete
+"""
+
+import argparse
+import gzip
+import hashlib
+import logging
+import os
+import random
+from dataclasses import dataclass
+from datetime import date, datetime
+from pathlib import Path
+from typing import BinaryIO
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Compression level of zstd, the larger levels are much slower for a small gain
+ZSTD_LEVEL = 12
+
+GZIP_LEVEL = 9
+
+# Size of the trained dictionaries, in bytes
+DICTIONARY_SIZE = 112 * 1024
+
+# Maximum number of pages used to train a dictionary
+MAX_TRAINING_SAMPLES = 500
+
+# zstd needs enough samples to train a useful dictionary
+MIN_TRAINING_SAMPLES = 8
+
+_REF_SUFFIX = ".ref"
+_SUFFIXES = {"zstd": ".html.zst", "gzip": ".html.gz"}
+
+
+def get_snapshot_dir(work_dir: Path) -> Path:
+    return Path(work_dir) / "snapshots"
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(exist_ok=True, parents=True)
+    # Readers never see a partial file
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_bytes(data)
+    tmp_path.replace(path)
+
+
+def _load_dictionary(root: Path, dict_id: int) -> "zstandard.ZstdCompressionDict":
+    data = (root / "dictionaries" / f"{dict_id}.zdict").read_bytes()
+    return zstandard.ZstdCompressionDict(data)
+
+
+def open_snapshot(path: Path) -> BinaryIO:
+    """
+    Open a stored page for reading, decompressing it while it is read.
+
+    Args:
+        path: File of an object of the store.
+
+    Returns:
+        A binary file of the html, to close after use.
+    """
+    path = Path(path)
+    if path.name.endswith(_SUFFIXES["gzip"]):
+        return gzip.open(path, "rb")
+    if not path.name.endswith(_SUFFIXES["zstd"]):
+        return open(path, "rb")
+    if zstandard is None:
+        raise ImportError(f"The zstandard package is needed to read {path}")
+
+    f = open(path, "rb")
+    try:
+        dict_id = zstandard.get_frame_parameters(f.read(18)).dict_id
+        f.seek(0)
+        # The objects are in <root>/objects/<ab>/
+        root = path.parent.parent.parent
+        decompressor = zstandard.ZstdDecompressor(
+            dict_data=_load_dictionary(root, dict_id) if dict_id else None
+        )
+        return decompressor.stream_reader(f, closefd=True)
+    except Exception:
+        f.close()
+        raise
+
+
+@dataclass
+class ImportStats:
+    """Sizes of the pages imported into the store."""
+
+    pages: int = 0
+    new_objects: int = 0
+    html_bytes: int = 0
+    stored_bytes: int = 0
+
+
+class SnapshotStore:
+    """
+    Html pages of the restaurants by day, deduplicated and compressed.
+
+    Args:
+        root: Directory of the store.
+        codec: "zstd" or "gzip". By default zstd if the zstandard package is
+            installed, else gzip.
+    """
+
+    def __init__(self, root: Path, codec: str | None = None):
+        self.root = Path(root)
+        if codec is None:
+            codec = "zstd" if zstandard is not None else "gzip"
+        if codec == "zstd" and zstandard is None:
+            raise ImportError("The zstandard package is needed for zstd snapshots")
+        if codec not in _SUFFIXES:
+            raise ValueError(
+                f"Unknown codec {codec}, expected one of {list(_SUFFIXES)}"
+            )
+        self.codec = codec
+        self._compressor = None
+
+    def _ref_path(self, restaurant: str, day: date) -> Path:
+        return self.root / "refs" / restaurant / f"menu_{day:%Y-%m-%d}{_REF_SUFFIX}"
+
+    def _object_path(self, digest: str, codec: str) -> Path:
+        return self.root / "objects" / digest[:2] / f"{digest}{_SUFFIXES[codec]}"
+
+    def _current_dictionary(self) -> int | None:
+        try:
+            return int((self.root / "dictionaries" / "current").read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _compress(self, content: bytes) -> bytes:
+        if self.codec == "gzip":
+            # No timestamp, so that the same page gives the same object
+            return gzip.compress(content, GZIP_LEVEL, mtime=0)
+        if self._compressor is None:
+            dict_id = self._current_dictionary()
+            self._compressor = zstandard.ZstdCompressor(
+                level=ZSTD_LEVEL,
+                dict_data=(_load_dictionary(self.root, dict_id) if dict_id else None),
+            )
+        return self._compressor.compress(content)
+
+    def put(self, restaurant: str, day: date, content: bytes | str) -> Path:
+        """
+        Store the page of a restaurant for a day, replacing the previous one.
+
+        Returns:
+            The object of the page, shared with the identical pages.
+        """
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        digest = hashlib.sha256(content).hexdigest()
+
+        path = next(
+            (
+                self._object_path(digest, codec)
+                for codec in _SUFFIXES
+                if self._object_path(digest, codec).is_file()
+            ),
+            None,
+        )
+        if path is None:
+            path = self._object_path(digest, self.codec)
+            _write_atomic(path, self._compress(content))
+
+        ref = path.relative_to(self.root).as_posix()
+        _write_atomic(self._ref_path(restaurant, day), ref.encode())
+        return path
+
+    def get_path(self, restaurant: str, day: date) -> Path | None:
+        """Object of the page of a restaurant for a day, None if not stored."""
+        try:
+            ref = self._ref_path(restaurant, day).read_text().strip()
+        except FileNotFoundError:
+            return None
+        return self.root / ref
+
+    def open(self, restaurant: str, day: date) -> BinaryIO:
+        """
+        Open the page of a restaurant for a day, see `open_snapshot`.
+
+        Raises:
+            FileNotFoundError: If the page is not stored.
+        """
+        path = self.get_path(restaurant, day)
+        if path is None:
+            raise FileNotFoundError(f"No snapshot of {restaurant} for {day}")
+        return open_snapshot(path)
+
+    def pages(self) -> list[tuple[str, date, Path]]:
+        """All the stored pages, as (restaurant, day, object) by restaurant and day."""
+        pages = []
+        for ref in sorted((self.root / "refs").glob(f"*/menu_*{_REF_SUFFIX}")):
+            day_str = ref.name[len("menu_") : -len(_REF_SUFFIX)]
+            day = datetime.strptime(day_str, "%Y-%m-%d").date()
+            pages.append((ref.parent.name, day, self.root / ref.read_text().strip()))
+        return pages
+
+    def train_dictionary(
+        self, samples: list[bytes] | None = None, size: int = DICTIONARY_SIZE
+    ) -> int | None:
+        """
+        Train a zstd dictionary and use it for the new objects.
+
+        The objects compressed before keep their dictionary.
+
+        Args:
+            samples: Pages to train on. By default, a sample of the stored
+                pages.
+            size: Size of the dictionary, in bytes.
+
+        Returns:
+            The id of the dictionary, None if there are too few samples.
+        """
+        if self.codec != "zstd":
+            raise ValueError("Dictionaries are only used with zstd")
+        if samples is None:
+            paths = sorted({path for _, _, path in self.pages()})
+            paths = random.sample(paths, min(len(paths), MAX_TRAINING_SAMPLES))
+            samples = []
+            for path in paths:
+                with open_snapshot(path) as f:
+                    samples.append(f.read())
+        if len(samples) < MIN_TRAINING_SAMPLES:
+            logger.warning(
+                f"Only {len(samples)} pages, at least {MIN_TRAINING_SAMPLES} "
+                "are needed to train a dictionary"
+            )
+            return None
+
+        dictionary = zstandard.train_dictionary(size, samples, level=ZSTD_LEVEL)
+        dict_id = dictionary.dict_id()
+        _write_atomic(
+            self.root / "dictionaries" / f"{dict_id}.zdict", dictionary.as_bytes()
+        )
+        _write_atomic(self.root / "dictionaries" / "current", str(dict_id).encode())
+        self._compressor = None
+        logger.info(f"Trained dictionary {dict_id} on {len(samples)} pages")
+        return dict_id
+
+    def disk_usage(self) -> int:
+        """Size of the objects and dictionaries of the store, in bytes."""
+        return sum(
+            path.stat().st_size
+            for pattern in ("objects/*/*", "dictionaries/*.zdict")
+            for path in self.root.glob(pattern)
+        )
+
+    def import_raw_html(
+        self,
+        work_dir: Path,
+        train: bool = False,
+        delete_before: date | None = None,
+    ) -> ImportStats:
+        """
+        Store the pages saved in `<work_dir>/<restaurant>/raw_html`.
+
+        Args:
+            work_dir: Working directory.
+            train: Train a dictionary on the pages before storing them.
+            delete_before: Delete the html files of the days before this one
+                once they are stored. The recent pages are kept, the fetch
+                compares new pages to them.
+
+        Returns:
+            The number of pages and new objects, and their sizes.
+        """
+        files = []
+        for file in sorted(Path(work_dir).glob("*/raw_html/menu_*.html")):
+            try:
+                day = datetime.strptime(file.stem[len("menu_") :], "%Y-%m-%d").date()
+            except ValueError:
+                continue
+            files.append((file.parent.parent.name, day, file))
+
+        if train and files:
+            sample = random.sample(files, min(len(files), MAX_TRAINING_SAMPLES))
+            self.train_dictionary([file.read_bytes() for _, _, file in sample])
+
+        stats = ImportStats()
+        objects = set(self.root.glob("objects/*/*"))
+        for restaurant, day, file in files:
+            content = file.read_bytes()
+            path = self.put(restaurant, day, content)
+            stats.pages += 1
+            stats.html_bytes += len(content)
+            if path not in objects:
+                objects.add(path)
+                stats.new_objects += 1
+                stats.stored_bytes += path.stat().st_size
+            if delete_before is not None and day < delete_before:
+                file.unlink()
+        logger.info(
+            f"Imported {stats.pages} pages ({stats.html_bytes / 1e6:.1f} MB) as "
+            f"{stats.new_objects} new objects ({stats.stored_bytes / 1e6:.1f} MB)"
+        )
+        return stats
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Mensabot - Compressed store of the downloaded pages",
+    )
+
+    parser.add_argument(
+        "command",
+        choices=["import", "train", "stats"],
+        help=(
+            "import: store the pages of the raw_html directories, train: train "
+            "a new zstd dictionary on the stored pages, stats: show the sizes"
+        ),
+    )
+
+    parser.add_argument(
+        "--work-dir",
+        type=str,
+        default=Path.home() / ".mensabot",
+        help="Working directory with the menu data (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--train",
+        action="store_true",
+        help="import: train a dictionary on the pages before storing them",
+    )
+
+    parser.add_argument(
+        "--delete",
+        action="store_true",
+        help="import: delete the html files of the past days once stored",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+
+    work_dir = Path(args.work_dir)
+    store = SnapshotStore(get_snapshot_dir(work_dir))
+    if args.command == "import":
+        store.import_raw_html(
+            work_dir,
+            train=args.train,
+            delete_before=date.today() if args.delete else None,
+        )
+    elif args.command == "train":
+        store.train_dictionary()
+    pages = store.pages()
+    logger.info(
+        f"{len(pages)} pages in {len({path for _, _, path in pages})} objects, "
+        f"{store.disk_usage() / 1e6:.1f} MB on disk ({store.codec})"
+    )
@@ -0,0 +1,223 @@
+"""
+Columnar archive of the parsed menus.
+
+The menus are stored as a Parquet dataset partitioned by restaurant and
+date::
+
+    <work_dir>/archive/restaurant=<restaurant>/date=<YYYY-MM-DD>/menu-0.parquet
+
+so that any history query is a single vectorized read. The csv files of
+older runs can be folded into the archive with::
+
+    python -m mensabot.store compact
+"""
+
+import argparse
+import logging
+import shutil
+from collections.abc import Iterable
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from .parser import MENU_COLUMNS, MENU_DTYPES
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SCHEMA = pa.schema(
+    [
+        ("day", pa.string()),
+        ("title", pa.string()),
+        ("description", pa.string()),
+        ("price", pa.float64()),
+        ("provenance", pa.string()),
+        ("vegan", pa.bool_()),
+        ("vegetarian", pa.bool_()),
+        ("glutenfree", pa.bool_()),
+        ("co2_footprint", pa.float64()),
+        ("restaurant", pa.string()),
+        ("date", pa.string()),
+    ]
+)
+
+PARTITIONING = ds.partitioning(
+    pa.schema([("restaurant", pa.string()), ("date", pa.string())]), flavor="hive"
+)
+
+
+def get_archive_dir(work_dir: Path) -> Path:
+    return Path(work_dir) / "archive"
+
+
+def _partition_dir(archive_dir: Path, restaurant: str, day: date) -> Path:
+    path, _ = PARTITIONING.format(
+        (ds.field("restaurant") == restaurant)
+        & (ds.field("date") == day.strftime("%Y-%m-%d"))
+    )
+    return Path(archive_dir) / path
+
+
+def append_menus(
+    archive_dir: Path,
+    df: pd.DataFrame,
+    partitions: Iterable[tuple[str, date]] = (),
+) -> None:
+    """
+    Write menus to the archive.
+
+    The partitions of the (restaurant, date) pairs present in `df` are
+    replaced, so writing the same day again does not duplicate it.
+
+    Args:
+        archive_dir: Root directory of the archive.
+        df: Menus as returned by `read_menus`, with a restaurant column.
+        partitions: (restaurant, day) pairs that `df` replaces. Their menus
+            are deleted when `df` has none, e.g. a day fetched again empty.
+    """
+    written = set(zip(df["restaurant"], df["date"])) if not df.empty else set()
+    for restaurant, day in partitions:
+        if (restaurant, day.strftime("%Y-%m-%d")) not in written:
+            shutil.rmtree(
+                _partition_dir(archive_dir, restaurant, day), ignore_errors=True
+            )
+    if df.empty:
+        return
+    table = pa.Table.from_pandas(
+        df[ARCHIVE_SCHEMA.names], schema=ARCHIVE_SCHEMA, preserve_index=False
+    )
+    ds.write_dataset(
+        table,
+        archive_dir,
+        format="parquet",
+        partitioning=PARTITIONING,
+        basename_template="menu-{i}.parquet",
+        existing_data_behavior="delete_matching",
+    )
+
+
+def load_menus(
+    archive_dir: Path,
+    restaurants: list[str] | None = None,
+    start: date | None = None,
+    end: date | None = None,
+) -> pd.DataFrame:
+    """
+    Load menus from the archive in one read.
+
+    Args:
+        archive_dir: Root directory of the archive.
+        restaurants: Only load these restaurants. All if not given.
+        start: First date to load (included).
+        end: Last date to load (included).
+
+    Returns:
+        The menus with the columns of `read_menus` and the restaurant,
+        sorted by date and restaurant.
+    """
+    columns = MENU_COLUMNS + ["restaurant"]
+    archive_dir = Path(archive_dir)
+    if not archive_dir.is_dir():
+        return pd.DataFrame(columns=columns)
+
+    dataset = ds.dataset(
+        archive_dir, schema=ARCHIVE_SCHEMA, format="parquet", partitioning=PARTITIONING
+    )
+
+    # Dates are ISO strings so they compare in chronological order
+    conditions = []
+    if restaurants is not None:
+        conditions.append(ds.field("restaurant").isin(restaurants))
+    if start is not None:
+        conditions.append(ds.field("date") >= start.strftime("%Y-%m-%d"))
+    if end is not None:
+        conditions.append(ds.field("date") <= end.strftime("%Y-%m-%d"))
+    condition = None
+    for c in conditions:
+        condition = c if condition is None else condition & c
+
+    df = dataset.to_table(filter=condition).to_pandas()
+    df = df.sort_values(["date", "restaurant"], kind="stable", ignore_index=True)
+    return df[columns]
+
+
+def compact_csv_history(work_dir: Path, archive_dir: Path | None = None) -> int:
+    """
+    Fold the csv files of `work_dir/<restaurant>/menus` into the archive.
+
+    The csv files are kept.
+
+    Returns:
+        The number of menu items written to the archive.
+    """
+    work_dir = Path(work_dir)
+    if archive_dir is None:
+        archive_dir = get_archive_dir(work_dir)
+
+    csv_files = sorted(work_dir.glob("*/menus/menu_*.csv"))
+    logger.info(f"Found {len(csv_files)} csv files in {work_dir}")
+
+    menus = []
+    for csv_file in csv_files:
+        try:
+            df = pd.read_csv(csv_file)
+        except pd.errors.EmptyDataError:
+            continue
+        if df.empty:
+            continue
+        # The restaurant is given by the directory, older files lack the column
+        df["restaurant"] = csv_file.parent.parent.name
+        menus.append(df)
+
+    if not menus:
+        return 0
+
+    df = pd.concat(menus, ignore_index=True)
+    # Older files lack the newer columns (e.g. co2_footprint)
+    df = df.reindex(columns=MENU_COLUMNS + ["restaurant"])
+    df = df.astype(MENU_DTYPES)
+    # Empty text columns are read as float NaN by read_csv
+    text_columns = [c for c in df.columns if c not in MENU_DTYPES]
+    df[text_columns] = (
+        df[text_columns].astype(object).where(df[text_columns].notna(), None)
+    )
+    append_menus(archive_dir, df)
+
+    logger.info(f"Wrote {len(df)} menu items to {archive_dir}")
+    return len(df)
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Mensabot - Parquet archive of the menus",
+    )
+
+    parser.add_argument(
+        "command",
+        choices=["compact"],
+        help="compact: fold the csv history of the work directory into the archive",
+    )
+
+    parser.add_argument(
+        "--work-dir",
+        type=str,
+        default=Path.home() / ".mensabot",
+        help="Working directory for storing menu data (default: %(default)s)",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+
+    if args.command == "compact":
+        compact_csv_history(Path(args.work_dir))
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import time
+import urllib.error
+import urllib.request
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+from mensabot.api import MenuApi, MenuIndex, parse_query
+from mensabot.parser import read_menus
+from mensabot.pipeline import save_menus
+
+TEST_DATA_DIR = Path(__file__).parent / "data"
+
+URIS = {
+    "Empa": "https://example.com/empa",
+    "Eawag": "https://example.com/eawag",
+}
+
+DAY = date(2025, 8, 1)
+
+
+@pytest.fixture
+def index(tmp_path):
+    """Index of the menus of two restaurants saved for a day."""
+    for restaurant, file_name in [
+        ("Empa", "menu_default.html"),
+        ("Eawag", "menu_with_co2.html"),
+    ]:
+        df = read_menus(TEST_DATA_DIR / file_name, date=DAY)
+        df["restaurant"] = restaurant
+        save_menus(tmp_path, restaurant, DAY, df)
+    return MenuIndex(tmp_path, uris=URIS)
+
+
+def test_query_filters(index):
+    """Test that the filters select the expected menus."""
+    all_menus = json.loads(index.query(DAY))
+    vegan = json.loads(index.query(DAY, flags=["vegan"]))
+    low_co2 = json.loads(index.query(DAY, max_co2=0.6))
+    empa = json.loads(index.query(DAY, restaurants=["Empa"]))
+
+    assert len(all_menus) == 8
+    assert vegan and all(menu["vegan"] for menu in vegan)
+    assert [menu["co2_footprint"] for menu in low_co2] == [0.6, 0.6]
+    assert {menu["restaurant"] for menu in empa} == {"Empa"}
+    assert json.loads(index.query(date(2020, 1, 1))) == []
+
+
+def test_query_markdown(index):
+    """Test that the markdown is the table of the messages."""
+    body = index.query(DAY, flags=["vegan"], format="markdown").decode()
+
+    assert body.startswith("| Restaurant")
+    assert "[Eawag](https://example.com/eawag)" in body
+
+
+def test_update_replaces_restaurant(index):
+    """Test that pushed menus replace the ones of the restaurant."""
+    index.query(DAY)
+    df = read_menus(TEST_DATA_DIR / "menu_holiday.html", date=DAY)
+
+    index.update("Empa", DAY, df)
+
+    empa = json.loads(index.query(DAY, restaurants=["Empa"]))
+    assert [menu["title"] for menu in empa] == df["title"].tolist()
+    assert len(json.loads(index.query(DAY))) == 4 + len(df)
+
+
+def test_update_does_not_read_disk(index, monkeypatch):
+    """Test that the menus of a day not in memory are read on the next query."""
+    df = read_menus(TEST_DATA_DIR / "menu_holiday.html", date=DAY)
+    save_menus(index.work_dir, "Empa", DAY, df.assign(restaurant="Empa"))
+    monkeypatch.setattr(index, "load_day", lambda day: pytest.fail("disk read"))
+
+    index.update("Empa", DAY, df)
+
+    monkeypatch.undo()
+    assert len(json.loads(index.query(DAY))) == 4 + len(df)
+
+
+def test_stale_load_is_not_stored(index):
+    """Test that menus loaded before an update do not replace the update."""
+    index.query(DAY)
+    loaded_at = time.monotonic()
+    stale = index.load_day(DAY)
+    df = read_menus(TEST_DATA_DIR / "menu_holiday.html", date=DAY)
+    index.update("Empa", DAY, df)
+
+    index.set_day(DAY, stale, loaded_at)
+
+    assert len(json.loads(index.query(DAY))) == 4 + len(df)
+
+
+@pytest.mark.parametrize(
+    "query", ["vegan=maybe", "date=01.08.2025", "format=xml", "color=red"]
+)
+def test_parse_query_invalid(query):
+    with pytest.raises(ValueError):
+        parse_query(query)
+
+
+def test_api_serves_http(index):
+    """Test the requests and responses of the HTTP server."""
+
+    async def main():
+        api = MenuApi(index)
+        server = await api.start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        def get(path):
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}") as r:
+                    return r.status, r.headers["Content-Type"], r.read()
+            except urllib.error.HTTPError as e:
+                return e.code, e.headers["Content-Type"], e.read()
+
+        async with server:
+            results = [
+                await asyncio.to_thread(get, path)
+                for path in [
+                    "/menus?date=2025-08-01&vegan=1&restaurant=Eawag",
+                    "/menus?date=2025-08-01&format=markdown",
+                    "/menus?vegan=maybe",
+                    "/nothing",
+                    "/metrics",
+                ]
+            ]
+        return results
+
+    vegan, markdown, invalid, not_found, metrics = asyncio.run(main())
+
+    assert vegan[0] == 200
+    assert vegan[1] == "application/json"
+    assert {menu["restaurant"] for menu in json.loads(vegan[2])} == {"Eawag"}
+    assert markdown[0] == 200
+    assert markdown[2].decode().startswith("| Restaurant")
+    assert invalid[0] == 400
+    assert not_found[0] == 404
+    assert metrics[1].startswith("text/plain; version=0.0.4")
+    assert b'mensabot_stage_seconds_count{stage="save"' in metrics[2]
+
+
+def test_api_reads_request_bodies(index):
+    """Test that a body does not end a keep-alive connection, and the methods."""
+
+    async def main():
+        server = await MenuApi(index).start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(
+                b"POST /health HTTP/1.1\r\nContent-Length: 10\r\n\r\nGET / HTTP"
+                b"GET /health HTTP/1.1\r\n\r\n"
+                b"GET /health HTTP/1.1\r\nContent-Length: 999999\r\n\r\n"
+            )
+            await writer.drain()
+            responses = (await reader.read()).split(b"HTTP/1.1 ")[1:]
+            writer.close()
+        return [response.split(b"\r\n")[0] for response in responses]
+
+    assert asyncio.run(main()) == [
+        b"405 Method Not Allowed",
+        b"200 OK",
+        b"413 Content Too Large",
+    ]
@@ -0,0 +1,49 @@
+import asyncio
+from pathlib import Path
+from urllib.request import urlopen
+
+from mensabot import bench
+from mensabot.fetcher import FetchResult
+
+TEST_DATA_DIR = Path(__file__).parent / "data"
+
+
+def test_bench_fetch(monkeypatch, tmp_path):
+    """Test the fetch benchmark with a fetcher that only downloads the page."""
+    policies = []
+
+    async def fake_fetch_all_async(jobs, retries, route_policy):
+        policies.append(route_policy)
+        (job,) = jobs
+        html = await asyncio.to_thread(lambda: urlopen(job.uri).read())
+        job.file.write_bytes(html)
+        return [FetchResult(job)]
+
+    monkeypatch.setattr(bench, "fetch_all_async", fake_fetch_all_async)
+
+    results = bench.bench_fetch(TEST_DATA_DIR / "menu_default.html", tmp_path, 2)
+
+    assert [result["case"] for result in results] == ["load all", "blocking"]
+    assert all(result["seconds"] > 0 for result in results)
+    assert all(result["requests"] == 1 for result in results)
+    assert policies[0] is None and policies[-1] is not None
+    assert (tmp_path / "fetched.html").exists()
+
+
+def test_run_benchmarks(tmp_path):
+    """Test that every case is timed, with extract_co2_value cold and cached."""
+    results = bench.run_benchmarks(TEST_DATA_DIR, tmp_path, sizes=(5,), repeat=1)
+
+    names = {result["name"] for result in results}
+    assert {"read_menus", "find_labels", "format_as_markdown"} <= names
+    cases = {
+        (result["name"], result["case"])
+        for result in results
+        if result["name"].startswith("extract_co2_value")
+    }
+    assert cases == {
+        (name, f"{size} texts")
+        for name in ["extract_co2_value", "extract_co2_value[cached]"]
+        for size in [1, 5]
+    }
+    assert all(result["seconds"] >= 0 for result in results)
@@ -0,0 +1,53 @@
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+
+from mensabot import cache as cache_module
+from mensabot.cache import ParseCache, read_menus_cached
+from mensabot.parser import read_menus
+
+TEST_DATA_DIR = Path(__file__).parent / "data"
+
+
+class TestParseCache:
+    """Test suite for the cache of the parsed menus."""
+
+    def test_hit_skips_parsing(self, tmp_path, monkeypatch):
+        """Test that a page parsed before is not parsed again."""
+        file = TEST_DATA_DIR / "menu_with_co2.html"
+        cache = ParseCache(tmp_path)
+        expected = read_menus_cached(file, date(2025, 8, 1), cache)
+
+        def fail(*args, **kwargs):
+            raise AssertionError("read_menus should not be called on a cache hit")
+
+        monkeypatch.setattr(cache_module, "read_menus", fail)
+        df = read_menus_cached(file, date(2025, 8, 1), cache)
+
+        pd.testing.assert_frame_equal(df, expected)
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_key_depends_on_date(self, tmp_path):
+        """Test that the same page for another date is parsed again."""
+        file = TEST_DATA_DIR / "menu_default.html"
+        cache = ParseCache(tmp_path)
+        read_menus_cached(file, date(2025, 8, 1), cache)
+        df = read_menus_cached(file, date(2025, 8, 4), cache)
+
+        assert (df["date"] == "2025-08-04").all()
+        assert cache.misses == 2
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        """Test that the oldest entries are removed above the size limit."""
+        df = read_menus(TEST_DATA_DIR / "menu_default.html", date(2025, 8, 1))
+        cache = ParseCache(tmp_path)
+        cache.put("first", df)
+        entry_size = (tmp_path / "first.pkl").stat().st_size
+
+        cache.max_bytes = 2 * entry_size
+        cache.put("second", df)
+        cache.get("first")
+        cache.put("third", df)
+
+        assert sorted(p.stem for p in tmp_path.glob("*.pkl")) == ["first", "third"]
@@ -0,0 +1,193 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from mensabot import delivery
+from mensabot.delivery import (
+    DeliveryError,
+    get_mattermost_webhook_url,
+    get_mattermost_webhook_urls,
+    send_mattermost_message,
+    send_messages,
+    split_message,
+)
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """
+    Stub Mattermost webhook recording the posts by path.
+
+    /limited answers 429 to the first request, /flaky 503 with Retry-After to
+    the first two, /gateway 502 to the first, /missing always 404 and /slow
+    waits before answering.
+    """
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        with server.lock:
+            server.attempts[self.path] = server.attempts.get(self.path, 0) + 1
+            attempt = server.attempts[self.path]
+
+        if self.path == "/slow":
+            time.sleep(0.3)
+        if self.path == "/limited" and attempt == 1:
+            status = 429
+        elif self.path == "/flaky" and attempt <= 2:
+            status = 503
+        elif self.path == "/gateway" and attempt == 1:
+            status = 502
+        elif self.path == "/missing":
+            status = 404
+        else:
+            status = 200
+            with server.lock:
+                server.posts.setdefault(self.path, []).append(body["text"])
+
+        self.send_response(status)
+        if status in (429, 503):
+            self.send_header("Retry-After", "0")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def webhook_server(monkeypatch):
+    """Local webhook server, with no delay between the retries."""
+    monkeypatch.setattr(delivery, "backoff_delay", lambda attempt: 0)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), WebhookHandler)
+    server.lock = threading.Lock()
+    server.attempts = {}
+    server.posts = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_send_to_several_webhooks(webhook_server):
+    """Test that the webhooks are posted to at the same time."""
+    urls = [f"{webhook_server.url}/slow?channel={i}" for i in range(4)]
+
+    start = time.monotonic()
+    results = send_messages(urls, "Menus", concurrency=4)
+
+    assert time.monotonic() - start < 1.0
+    assert all(result.ok for result in results)
+    assert [result.url for result in results] == urls
+    assert webhook_server.posts["/slow?channel=3"] == ["Menus"]
+
+
+def test_retries(webhook_server):
+    """Test that the rate limited and failed posts are retried."""
+    urls = [f"{webhook_server.url}/limited", f"{webhook_server.url}/flaky"]
+    results = send_messages(urls, "Menus")
+
+    assert all(result.ok for result in results)
+    assert webhook_server.attempts == {"/limited": 2, "/flaky": 3}
+    assert webhook_server.posts["/flaky"] == ["Menus"]
+
+
+def test_maybe_posted_not_retried(webhook_server):
+    """Test that a post that may have been accepted is not posted again."""
+    (result,) = send_messages([f"{webhook_server.url}/gateway"], "Menus")
+
+    assert not result.ok
+    assert webhook_server.attempts == {"/gateway": 1}
+
+
+def test_failed_webhook(webhook_server):
+    """Test that a wrong webhook is not retried and does not stop the others."""
+    with pytest.raises(DeliveryError, match="1 of 2"):
+        send_mattermost_message(
+            [f"{webhook_server.url}/missing", f"{webhook_server.url}/menus"], "Menus"
+        )
+
+    assert webhook_server.attempts["/missing"] == 1
+    assert webhook_server.posts["/menus"] == ["Menus"]
+
+
+def test_long_message_is_split(webhook_server):
+    """Test that the parts of a long message are posted in order."""
+    text = "\n\n".join(f"# Day {i}\n\n" + "x" * 50 for i in range(10))
+    (result,) = send_messages([f"{webhook_server.url}/menus"], text, max_length=100)
+
+    assert result.ok and result.parts > 1
+    assert "\n\n".join(webhook_server.posts["/menus"]) == text
+
+
+def test_split_message_repeats_table_header():
+    """Test that a long table is split between its rows, under its header."""
+    header = ["| Restaurant | Title |", "|:--|:--|"]
+    rows = [f"| Empa | Menu {i} |" for i in range(20)]
+    text = "# Monday\n\n" + "\n".join(header + rows)
+
+    parts = split_message(text, max_length=120)
+
+    assert len(parts) > 2
+    assert all(len(part) <= 120 for part in parts)
+    assert all(part.split("\n")[:2] == header for part in parts[2:])
+    table_rows = [
+        line for part in parts for line in part.split("\n") if line.startswith("| E")
+    ]
+    assert table_rows == rows
+    assert split_message("Short") == ["Short"]
+
+
+def test_webhook_urls(monkeypatch, tmp_path):
+    """Test that several webhooks can be given, in the variable or the file."""
+    monkeypatch.setenv("MATTERMOST_WEBHOOK_URL", "https://a/hooks/1, https://b/hooks/2")
+    assert get_mattermost_webhook_urls(tmp_path / "url.txt") == [
+        "https://a/hooks/1",
+        "https://b/hooks/2",
+    ]
+
+    monkeypatch.delenv("MATTERMOST_WEBHOOK_URL")
+    (tmp_path / "url.txt").write_text("https://a/hooks/1\n")
+    assert get_mattermost_webhook_urls(tmp_path / "url.txt") == ["https://a/hooks/1"]
+
+
+def test_single_webhook_api(webhook_server, monkeypatch, tmp_path):
+    """Test the names of the functions for a single webhook."""
+    monkeypatch.setenv("MATTERMOST_WEBHOOK_URL", f"{webhook_server.url}/menus")
+
+    url = get_mattermost_webhook_url(tmp_path / "url.txt")
+    send_mattermost_message(url=url, text="Menus")
+
+    assert webhook_server.posts["/menus"] == ["Menus"]
+
+
+@pytest.mark.parametrize("error, attempts", [("connect", 2), ("read", 1)])
+def test_connection_errors(monkeypatch, error, attempts):
+    """Test that only the posts that were not sent are retried after an error."""
+    import requests
+
+    monkeypatch.setattr(delivery, "backoff_delay", lambda attempt: 0)
+    calls = []
+
+    class Session:
+        def post(self, url, json, timeout):
+            calls.append(url)
+            if len(calls) == 1:
+                raise (
+                    requests.ConnectionError("refused")
+                    if error == "connect"
+                    else requests.ReadTimeout("no answer")
+                )
+            return SimpleNamespace(status_code=200, headers={})
+
+    (result,) = send_messages(
+        ["https://example.com/hooks/1"], "Menus", session=Session()
+    )
+
+    assert result.ok == (error == "connect")
+    assert len(calls) == attempts
@@ -0,0 +1,312 @@
+import asyncio
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from mensabot import fetcher
+from mensabot.fetcher import (
+    CircuitBreaker,
+    CircuitOpenError,
+    FetchJob,
+    RoutePolicy,
+    _wait_for_products,
+    backoff_delay,
+    fetch_async,
+    load_validators,
+    make_route_policy,
+    save_content,
+)
+
+
+def render_with(monkeypatch, render):
+    """Replace the rendering of the pages in the browser by `render(job)`."""
+
+    async def fake_render_page(browser, job, policy, timeout):
+        return await render(job)
+
+    monkeypatch.setattr(fetcher, "_render_page", fake_render_page)
+
+
+def fetch(jobs, **kwargs):
+    """Fetch the jobs in a fake browser, see `render_with`."""
+    return asyncio.run(fetch_async(jobs, browser=object(), **kwargs))
+
+
+class TestChangeDetection:
+    """Test suite for the detection of the pages that did not change."""
+
+    def test_same_content(self, monkeypatch, tmp_path):
+        """Test that a page rendered again with the same content is kept."""
+
+        async def render(job):
+            return "<p>Pasta</p>"
+
+        render_with(monkeypatch, render)
+        job = FetchJob("Empa", "https://example.com/empa", tmp_path / "menu.html")
+        (first,) = fetch([job])
+        mtime = job.file.stat().st_mtime_ns
+
+        (second,) = fetch([job])
+
+        assert first.ok and first.changed
+        assert second.ok and not second.changed
+        assert job.file.stat().st_mtime_ns == mtime
+
+    def test_changed_content(self, tmp_path):
+        """Test that a new content replaces the saved html."""
+        job = FetchJob("Empa", "https://example.com/empa", tmp_path / "menu.html")
+
+        assert save_content(job, "<p>Pasta</p>")
+        assert not save_content(job, "<p>Pasta</p>")
+        assert save_content(job, "<p>Pizza</p>")
+        assert job.file.read_text() == "<p>Pizza</p>"
+
+    def test_validators_need_same_uri_and_file(self, tmp_path):
+        """Test that the validators of another uri or a deleted file are ignored."""
+        job = FetchJob("Empa", "https://example.com/empa", tmp_path / "menu.html")
+        save_content(job, "<p>Pasta</p>")
+        other_uri = FetchJob("Empa", "https://example.com/other", job.file)
+
+        assert "sha256" in load_validators(job)
+        assert load_validators(other_uri) == {}
+        job.file.unlink()
+        assert load_validators(job) == {}
+
+
+class TestTimeouts:
+    """Test suite for the timeouts and the deadline of the fetches."""
+
+    @pytest.fixture(autouse=True)
+    def slow_render(self, monkeypatch):
+        """Render the pages of "Empa" in 1 s, the others at once."""
+
+        async def render(job):
+            if job.restaurant == "Empa":
+                await asyncio.sleep(1)
+            return "<html></html>"
+
+        render_with(monkeypatch, render)
+
+    def test_site_timeout(self, tmp_path):
+        """Test that a slow site fails after its own timeout."""
+        slow = FetchJob(
+            "Empa", "https://example.com/a", tmp_path / "a.html", timeout=0.2
+        )
+        fast = FetchJob("Eawag", "https://example.com/b", tmp_path / "b.html")
+
+        start = time.monotonic()
+        results = fetch([slow, fast], retries=0)
+
+        assert time.monotonic() - start < 0.9
+        assert [result.ok for result in results] == [False, True]
+        assert isinstance(results[0].error, TimeoutError)
+
+    def test_deadline(self, tmp_path):
+        """Test that the deadline shortens the timeouts of the pages."""
+        job = FetchJob("Empa", "https://example.com/empa", tmp_path / "menu.html")
+
+        start = time.monotonic()
+        (result,) = fetch([job], retries=0, deadline=0.2)
+
+        assert time.monotonic() - start < 0.9
+        assert not result.ok
+
+    def test_expired_deadline(self, tmp_path):
+        """Test that no page is fetched once the deadline is reached."""
+        job = FetchJob("Eawag", "https://example.com/eawag", tmp_path / "menu.html")
+        (result,) = fetch([job], deadline=0)
+
+        assert isinstance(result.error, TimeoutError)
+        assert not job.file.exists()
+
+
+class TestSharedBrowser:
+    """Test suite for the concurrent fetch of the pages in one browser."""
+
+    def test_concurrent_fetch(self, monkeypatch, tmp_path):
+        """Test that pages are rendered together, at most `concurrency` at once."""
+        active = []
+        peak = []
+
+        async def fake_render_page(browser, job, policy, timeout):
+            active.append(job)
+            peak.append(len(active))
+            await asyncio.sleep(0.05)
+            active.remove(job)
+            if job.restaurant == "2":
+                raise ConnectionError("Connection reset")
+            return f"<html>{job.restaurant}</html>"
+
+        monkeypatch.setattr(fetcher, "_render_page", fake_render_page)
+        jobs = [
+            FetchJob(str(i), f"https://example.com/{i}", tmp_path / f"{i}.html")
+            for i in range(6)
+        ]
+
+        results = asyncio.run(
+            fetcher.fetch_all_async(jobs, concurrency=3, retries=0, browser=object())
+        )
+
+        assert max(peak) == 3
+        assert [result.job for result in results] == jobs
+        assert [result.ok for result in results] == [i != 2 for i in range(6)]
+        assert jobs[5].file.read_text() == "<html>5</html>"
+
+
+class TestBrowserRetries:
+    """Test suite for the retries of the pages rendered in the browser."""
+
+    @pytest.fixture
+    def renders(self, monkeypatch):
+        """Replace the rendering, failing the first `failures` attempts."""
+        renders = SimpleNamespace(failures=0, attempts=[])
+
+        async def fake_render_page(browser, job, policy, timeout):
+            renders.attempts.append(job.restaurant)
+            if len(renders.attempts) <= renders.failures:
+                raise ConnectionError("Connection reset")
+            return "<html></html>"
+
+        monkeypatch.setattr(fetcher, "_render_page", fake_render_page)
+        return renders
+
+    def test_retry_succeeds(self, renders, monkeypatch, tmp_path):
+        """Test that a page failing once is rendered again."""
+        monkeypatch.setattr(fetcher, "backoff_delay", lambda attempt: 0)
+        renders.failures = 1
+        job = FetchJob("Empa", "https://example.com/empa", tmp_path / "menu.html")
+
+        (result,) = asyncio.run(fetcher.fetch_all_async([job], browser=object()))
+
+        assert result.ok
+        assert renders.attempts == ["Empa", "Empa"]
+
+    def test_backoff_ends_by_deadline(self, renders, monkeypatch, tmp_path):
+        """Test that the delay before a retry does not go past the deadline."""
+        monkeypatch.setattr(fetcher, "backoff_delay", lambda attempt: 10)
+        renders.failures = 10
+        job = FetchJob("Empa", "https://example.com/empa", tmp_path / "menu.html")
+
+        start = time.monotonic()
+        (result,) = asyncio.run(
+            fetcher.fetch_all_async([job], browser=object(), retries=3, deadline=0.2)
+        )
+
+        assert time.monotonic() - start < 1
+        assert isinstance(result.error, TimeoutError)
+        assert renders.attempts == ["Empa"]
+
+
+def test_backoff_delay():
+    """Test that the delays grow exponentially up to the cap, with jitter."""
+    delays = [backoff_delay(attempt, base=1, cap=5) for attempt in range(10)]
+
+    assert all(0 <= delay <= min(5, 2**i) for i, delay in enumerate(delays))
+    assert len(set(delays)) > 1
+
+
+class TestCircuitBreaker:
+    """Test suite for the skipping of the restaurants failing repeatedly."""
+
+    def test_opens_after_threshold(self, tmp_path):
+        """Test that a circuit opens after failed runs in a row, and persists."""
+        breaker = CircuitBreaker(tmp_path / "circuits.json", threshold=2, cooldown=60)
+        breaker.record("Empa", ok=False, now=0)
+        breaker.check("Empa", now=1)
+        breaker.record("Empa", ok=False, now=1)
+
+        with pytest.raises(CircuitOpenError):
+            breaker.check("Empa", now=2)
+        # Tried again after the cooldown
+        breaker.check("Empa", now=62)
+        breaker.record("Empa", ok=True, now=62)
+        assert breaker.state == {}
+
+    def test_skips_restaurant(self, monkeypatch, tmp_path):
+        """Test that the fetch skips the open circuits and records the others."""
+        rendered = []
+
+        async def render(job):
+            rendered.append(job.restaurant)
+            if job.restaurant == "Empa":
+                raise ConnectionError("Connection reset")
+            return "<html></html>"
+
+        render_with(monkeypatch, render)
+        path = tmp_path / "circuits.json"
+        jobs = [
+            FetchJob("Empa", "https://example.com/empa", tmp_path / "empa.html"),
+            FetchJob("Eawag", "https://example.com/eawag", tmp_path / "eawag.html"),
+        ]
+        for _ in range(2):
+            fetch(jobs, retries=0, breaker=CircuitBreaker(path, threshold=2))
+        rendered.clear()
+
+        results = fetch(jobs, retries=0, breaker=CircuitBreaker(path, threshold=2))
+
+        assert isinstance(results[0].error, CircuitOpenError)
+        assert results[1].ok
+        assert rendered == ["Eawag"]
+        assert CircuitBreaker(path).state["Empa"]["failures"] == 2
+
+
+PAGE_URL = "https://sv-restaurant.ch/menu/Empa"
+
+
+@pytest.mark.parametrize(
+    "url, resource_type, expected",
+    [
+        (PAGE_URL, "document", True),
+        ("https://sv-restaurant.ch/main.js", "script", True),
+        ("https://api.qnips.com/menus?day=1", "fetch", True),
+        ("https://files.qnips.com/releaseicons/vegan.png", "image", False),
+        ("https://sv-restaurant.ch/fonts/roboto.woff2", "font", False),
+        ("https://www.googletagmanager.com/gtm.js", "script", False),
+        ("https://notqnips.com/tracker.js", "script", False),
+        ("data:text/css,body{}", "stylesheet", True),
+    ],
+)
+def test_route_policy(url, resource_type, expected):
+    """Test that only the requests needed by the menu are let through."""
+    assert RoutePolicy().allows(url, resource_type, PAGE_URL) == expected
+
+
+def test_make_route_policy():
+    """Test that the allowed domains are added to the defaults."""
+    policy = make_route_policy(["cdn.example.com"])
+
+    assert policy.allows("https://cdn.example.com/menu.js", "script", PAGE_URL)
+    assert policy.allows("https://api.qnips.com/menus", "fetch", PAGE_URL)
+    assert make_route_policy(load_all=True) is None
+
+
+class FakePage:
+    """Page whose menu grid is attached, with the given counts of products."""
+
+    def __init__(self, counts):
+        self.counts = iter(counts)
+        self.last = 0
+
+    async def wait_for_selector(self, selector, state, timeout):
+        pass
+
+    def locator(self, selector):
+        return self
+
+    async def count(self):
+        self.last = next(self.counts, self.last)
+        return self.last
+
+
+@pytest.mark.parametrize("counts, expected", [([], 0), ([0, 2, 5, 5], 5), ([3, 3], 3)])
+def test_wait_for_products(monkeypatch, counts, expected):
+    """Test that a stable list of products is ready, also when empty."""
+    monkeypatch.setattr(fetcher, "STABLE_INTERVAL", 0.01)
+
+    start = time.monotonic()
+    products = asyncio.run(_wait_for_products(FakePage(counts), timeout=5))
+
+    assert products == expected
+    assert time.monotonic() - start < 1
@@ -0,0 +1,93 @@
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from mensabot.formatting import format_as_markdown, iter_markdown_table
+from mensabot.parser import read_menus
+
+TEST_DATA_DIR = Path(__file__).parent / "data"
+
+URIS = {"Eawag": "https://example.com/eawag"}
+
+
+@pytest.fixture
+def menus():
+    """Menus of a page with CO2 values and non ASCII titles."""
+    df = read_menus(TEST_DATA_DIR / "menu_with_co2.html", date=date(2025, 8, 1))
+    df["restaurant"] = ["Eawag", "Eawag", "Amag", "Eawag"][: len(df)]
+    return df
+
+
+def test_format_as_markdown_matches_tabulate(menus):
+    """Test that the table is the same as the "github" format of tabulate."""
+    pytest.importorskip("tabulate")
+
+    expected = pd.DataFrame(
+        {
+            "Restaurant": [
+                f"[{r}]({URIS[r]})" if r in URIS else r for r in menus["restaurant"]
+            ],
+            "Price": [f"*{p:.2f}*" if pd.notnull(p) else "N/A" for p in menus["price"]],
+            "Vegan": ["✔️" if v else "❌" for v in menus["vegan"]],
+            "Glutenfree": ["✔️" if v else "❌" for v in menus["glutenfree"]],
+            "Title": menus["title"]
+            .astype(object)
+            .str.replace(r"(\w+)", r"**\1**", regex=True),
+            "Description": menus["description"],
+            "kg CO2eq": [
+                f"{x:.2f}" if pd.notnull(x) else "" for x in menus["co2_footprint"]
+            ],
+        }
+    ).to_markdown(index=False, tablefmt="github")
+
+    assert format_as_markdown(menus, uris=URIS) == expected
+
+
+def test_format_as_markdown_bold_non_ascii_words():
+    """Test that the words with umlauts are bold as a whole."""
+    df = pd.DataFrame(
+        {
+            "restaurant": ["Eawag"],
+            "price": [11.5],
+            "vegan": [True],
+            "glutenfree": [False],
+            "title": ["Linsen-Wurzelgemüse"],
+            "description": [""],
+            "co2_footprint": [np.nan],
+        }
+    )
+
+    md = format_as_markdown(df)
+
+    assert "**Linsen**-**Wurzelgemüse**" in md
+    assert "*11.50*" in md
+
+
+def test_format_as_markdown_empty(menus):
+    """Test that no menus give only the header of the table."""
+    lines = format_as_markdown(menus.iloc[:0]).splitlines()
+
+    assert len(lines) == 2
+    assert lines[0].startswith("| Restaurant ")
+
+
+def test_iter_markdown_table_decimal_alignment():
+    """Test that the decimal points of numeric columns are aligned."""
+    lines = list(
+        iter_markdown_table(
+            ["Name", "Value"],
+            [pd.Series(["a", "b", "c"]), pd.Series(["12.5", "0.25", ""])],
+            [False, True],
+        )
+    )
+
+    assert lines == [
+        "| Name   |   Value |",
+        "|--------|---------|",
+        "| a      |   12.5  |",
+        "| b      |    0.25 |",
+        "| c      |         |",
+    ]
@@ -0,0 +1,82 @@
+import pytest
+
+from mensabot.labels import LabelClassifier, classify_icon, extract_co2_value
+from mensabot.parser import find_all_labels, find_labels
+
+
+@pytest.mark.parametrize(
+    "alt, title, expected",
+    [
+        ("Vegan", "Vegan", ("vegan",)),
+        ("Vegetarisch", "", ("vegetarian",)),
+        ("", "Glutenfrei", ("glutenfree",)),
+        ("Gluten-free", "", ("glutenfree",)),
+        ("Laktosefrei", "Laktosefrei", ("lactosefree",)),
+        ("CO₂ CO₂-Wert", "", ("co2",)),
+        ("Vegan, glutenfrei", "", ("vegan", "glutenfree")),
+        ("Fleisch", "Schwein", ()),
+    ],
+)
+def test_classify_icon(alt, title, expected):
+    """Test that all the labels of an icon are found, in priority order."""
+    assert classify_icon(alt, title) == expected
+
+
+def test_find_labels_co2_from_tooltip():
+    """Test that the CO2 value is read from the tooltip of the icon."""
+    img = {"alt": "CO₂ CO₂-Wert", "aria-describedby": "tip"}
+    tooltips = {"tip": "The CO₂ value of this menu is 0,6 kg CO₂e."}
+
+    assert find_all_labels(img, tooltips) == ["co2_0.6"]
+    assert find_labels(img, tooltips) == "co2_0.6"
+    # Without its value, a CO2 icon has no label
+    assert find_labels(img, {}) is None
+
+
+def test_find_labels_priority():
+    """Test that the first label of an icon with several labels is returned."""
+    assert find_labels({"alt": "Vegan", "title": "Laktosefrei"}) == "vegan"
+
+
+def test_register_label():
+    """Test that a label is added without changing the other ones."""
+    classifier = LabelClassifier()
+    classifier.classify("Bio", "")
+
+    classifier.register("organic", "Bio", "organic")
+
+    assert classifier.classify("Bio", "") == ("organic",)
+    assert classifier.classify("Vegan", "Organic") == ("vegan", "organic")
+    assert classify_icon("Bio", "") == ()
+
+
+def test_register_overlapping_label():
+    """Test that labels whose patterns overlap in the text are all found."""
+    classifier = LabelClassifier()
+
+    classifier.register("frei", "frei")
+
+    assert classifier.classify("laktosefrei", "") == ("lactosefree", "frei")
+    assert classifier.classify("Vegetarisch", "vegan") == ("vegan", "vegetarian")
+
+
+def test_classify_is_memoized():
+    """Test that the same icon is classified once."""
+    classifier = LabelClassifier()
+    for _ in range(3):
+        classifier.classify("Vegan", "Vegan")
+
+    assert classifier.classify.cache_info().hits == 2
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("co₂-wert 0.6 kg co₂e", "0.6"),
+        ("the co2 value is 1,25 kg co2e", "1.25"),
+        ("co2-wert: 300 g", "300"),
+        ("co2-wert", None),
+    ],
+)
+def test_extract_co2_value(text, expected):
+    assert extract_co2_value(text) == expected
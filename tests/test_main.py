@@ -0,0 +1,119 @@
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ["pandas", "requests", "bs4", "playwright"]
+
+
+def _imported_modules(code: str) -> list[str]:
+    """Heavy modules imported by running the code in a fresh interpreter."""
+    check = (
+        f"import sys\n{code}\nprint(sorted(set(sys.modules) & {set(HEAVY_MODULES)}))"
+    )
+    process = subprocess.run(
+        [sys.executable, "-c", check], capture_output=True, text=True, check=True
+    )
+    return eval(process.stdout.strip().splitlines()[-1])
+
+
+def test_help_does_not_import_heavy_modules():
+    """Test that parsing the arguments does not import the heavy modules."""
+    code = (
+        "from mensabot.__main__ import parse_arguments\n"
+        "parse_arguments(['--debug', '--no-download'])"
+    )
+    assert _imported_modules(code) == []
+
+
+@pytest.mark.parametrize(
+    "module", ["mensabot.fetcher", "mensabot.delivery", "mensabot.parser"]
+)
+def test_backends_are_imported_lazily(module):
+    """Test that requests, bs4 and playwright are only imported when used."""
+    assert set(_imported_modules(f"import {module}")) <= {"pandas"}
+
+
+@pytest.mark.parametrize(
+    "argv, expected",
+    [
+        ([], True),
+        (["--today"], False),
+        (["--today", "--range", "2026-02-02", "2026-02-02"], True),
+        (["--today", "--week"], True),
+        (["--date", "2026-02-02"], True),
+    ],
+)
+def test_should_append_date(argv, expected):
+    """Test that only a plain --today fetches the pages without a date."""
+    from mensabot.__main__ import parse_arguments, should_append_date
+
+    args = parse_arguments(argv)
+
+    assert should_append_date(args.today, args.date_range, args.week) == expected
+
+
+def test_run_end_to_end(monkeypatch, tmp_path):
+    """Test that the message of a run is the one of the menus saved on disk."""
+    import shutil
+    import time
+    from datetime import date
+    from pathlib import Path
+
+    import pandas as pd
+
+    from mensabot import delivery, fetcher, pipeline
+    from mensabot.__main__ import parse_arguments, run
+    from mensabot.formatting import format_message, format_sections
+    from mensabot.parser import read_menus
+    from mensabot.pipeline import RESTAURANT_URIS, load_saved_menus, save_menus
+
+    pages = dict(
+        zip(
+            RESTAURANT_URIS,
+            [
+                "menu_default.html",
+                "menu_with_co2.html",
+                "menu_format_matcard.html",
+                "menu_holiday.html",
+            ],
+        )
+    )
+    data_dir = Path(__file__).parent / "data"
+
+    def fake_fetch_all(jobs, **kwargs):
+        for job in jobs:
+            job.file.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy(data_dir / pages[job.restaurant], job.file)
+        return [fetcher.FetchResult(job) for job in jobs]
+
+    def slow_save_menus(*args, **kwargs):
+        time.sleep(0.05)
+        save_menus(*args, **kwargs)
+
+    messages = []
+    monkeypatch.setattr(fetcher, "fetch_all", fake_fetch_all)
+    monkeypatch.setattr(pipeline, "save_menus", slow_save_menus)
+    monkeypatch.setattr(
+        delivery, "send_mattermost_message", lambda urls, text: messages.append(text)
+    )
+    monkeypatch.setenv("MATTERMOST_WEBHOOK_URL", "https://example.com/hooks/1")
+    day = date(2025, 8, 1)
+
+    run(parse_arguments(["--work-dir", str(tmp_path), "--date", "2025-08-01"]))
+
+    saved = load_saved_menus(tmp_path, day)
+    assert set(saved["restaurant"]) == set(RESTAURANT_URIS)
+    # The message built in memory is the one of the menus read back from disk
+    by_restaurant = [saved[saved["restaurant"] == r] for r in RESTAURANT_URIS]
+    expected = format_message(format_sections(by_restaurant, [day], RESTAURANT_URIS))
+    assert messages == [expected]
+    # The csv files are all written when run returns
+    empa = read_menus(data_dir / "menu_default.html", date=day)
+    pd.testing.assert_frame_equal(
+        saved[saved["restaurant"] == "Empa"]
+        .drop(columns="restaurant")
+        .reset_index(drop=True),
+        empa,
+        check_dtype=False,
+    )
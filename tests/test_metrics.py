@@ -0,0 +1,83 @@
+import json
+import logging
+import shutil
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+from mensabot.fetcher import FetchJob
+from mensabot.metrics import METRICS, JsonFormatter, Metrics
+from mensabot.pipeline import parse_jobs
+
+TEST_DATA_DIR = Path(__file__).parent / "data"
+
+
+def test_span_records_durations_and_errors():
+    """Test that the spans are timed by labels, also when they fail."""
+    metrics = Metrics()
+    with metrics.span("parse", restaurant="Empa"):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.span("parse", restaurant="Empa", engine=None):
+            raise ValueError("broken page")
+
+    ((key, (n, seconds)),) = metrics.durations.items()
+    assert key == ("parse", (("restaurant", "Empa"),))
+    assert n == 2 and seconds >= 0
+    assert metrics.counters == {
+        ("stage_errors", (("restaurant", "Empa"), ("stage", "parse"))): 1
+    }
+
+
+def test_to_prometheus():
+    """Test the text exposition format of the metrics."""
+    metrics = Metrics()
+    metrics.observe("goto", 1.5, restaurant='Em"pa')
+    metrics.observe("goto", 0.5, restaurant='Em"pa')
+    metrics.count("fetched_bytes", 1024, restaurant="Eawag")
+    metrics.set_gauge("last_run_timestamp_seconds", 100)
+
+    lines = metrics.to_prometheus().splitlines()
+
+    assert lines == [
+        "# HELP mensabot_stage_seconds Time spent in the stages of the pipeline",
+        "# TYPE mensabot_stage_seconds summary",
+        'mensabot_stage_seconds_count{stage="goto",restaurant="Em\\"pa"} 2',
+        'mensabot_stage_seconds_sum{stage="goto",restaurant="Em\\"pa"} 2',
+        "# HELP mensabot_fetched_bytes_total Size of the fetched html",
+        "# TYPE mensabot_fetched_bytes_total counter",
+        'mensabot_fetched_bytes_total{restaurant="Eawag"} 1024',
+        "# HELP mensabot_last_run_timestamp_seconds Time of the end of the last run",
+        "# TYPE mensabot_last_run_timestamp_seconds gauge",
+        "mensabot_last_run_timestamp_seconds 100",
+    ]
+
+
+def test_json_formatter():
+    """Test that the fields of the spans are added to the JSON logs."""
+    record = logging.LogRecord(
+        "mensabot", logging.INFO, __file__, 1, "Stage parse took 0.1 s", (), None
+    )
+    record.metrics = {"stage": "parse", "seconds": 0.1}
+
+    entry = json.loads(JsonFormatter().format(record))
+
+    assert entry["message"] == "Stage parse took 0.1 s"
+    assert (entry["level"], entry["stage"], entry["seconds"]) == ("INFO", "parse", 0.1)
+
+
+def test_worker_metrics_are_merged(tmp_path):
+    """Test that the metrics of the parsing processes reach the main process."""
+    jobs = []
+    for restaurant in ["Empa", "Eawag"]:
+        file = tmp_path / f"{restaurant}.html"
+        shutil.copy(TEST_DATA_DIR / "menu_default.html", file)
+        jobs.append(FetchJob(restaurant, "", file, day=date(2025, 8, 1)))
+    METRICS.reset()
+
+    results = parse_jobs(jobs, workers=2)
+
+    items = METRICS.counters[("items_parsed", (("restaurant", "Empa"),))]
+    assert items == len(results[0].menus)
+    assert METRICS.durations[("parse", (("restaurant", "Eawag"),))][0] == 1
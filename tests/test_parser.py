@@ -0,0 +1,55 @@
+import logging
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+from mensabot import parser
+from mensabot.parser import read_menus
+
+TEST_DATA_DIR = Path(__file__).parent / "data"
+
+# A CO2 tooltip at the end of the page, after the item referring to it
+TOOLTIP_AFTER_ITEM = (
+    '<html><body><div class="category-grid"><div class="product-wrapper">'
+    '<span class="pre-wrap">A</span><div class="label-list">'
+    '<img alt="CO₂ CO₂-Wert" aria-describedby="co2-a"></div></div></div>'
+    '<div id="co2-a">The CO₂ value of this menu is 0.8 kg CO₂e.</div>'
+    "</body></html>"
+)
+
+
+@pytest.mark.parametrize("engine", ["lxml", "bs4"])
+def test_tooltip_after_item(tmp_path, engine):
+    """Test that a tooltip defined after its item gives the CO2 of the item."""
+    if engine == "lxml":
+        pytest.importorskip("lxml")
+    file = tmp_path / "menu.html"
+    file.write_text(TOOLTIP_AFTER_ITEM, encoding="utf-8")
+
+    df = read_menus(file, date(2025, 8, 1), engine=engine)
+
+    assert df[["title", "co2_footprint"]].values.tolist() == [["A", 0.8]]
+
+
+@pytest.mark.parametrize("engine", ["lxml", "bs4"])
+def test_html_serialized_only_at_debug(monkeypatch, caplog, engine):
+    """Test that the html of the items is only serialized for the debug logs."""
+    if engine == "lxml":
+        pytest.importorskip("lxml")
+    from bs4.element import Tag
+
+    calls = []
+    pretty = parser._lxml_pretty
+    prettify = Tag.prettify
+    monkeypatch.setattr(parser, "_lxml_pretty", lambda e: calls.append(e) or pretty(e))
+    monkeypatch.setattr(Tag, "prettify", lambda t: calls.append(t) or prettify(t))
+    file = TEST_DATA_DIR / "menu_default.html"
+
+    caplog.set_level(logging.INFO, logger="mensabot.parser")
+    read_menus(file, date(2025, 8, 1), engine=engine)
+    assert calls == []
+
+    caplog.set_level(logging.DEBUG, logger="mensabot.parser")
+    read_menus(file, date(2025, 8, 1), engine=engine)
+    assert calls
@@ -0,0 +1,79 @@
+import shutil
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from mensabot.pipeline import make_fetch_jobs, parse_jobs, parse_timeouts
+
+TEST_DATA_DIR = Path(__file__).parent / "data"
+
+URIS = {
+    "Empa": "https://example.com/empa",
+    "Eawag": "https://example.com/eawag",
+}
+
+DAYS = [date(2025, 8, 1), date(2025, 8, 4)]
+
+
+@pytest.fixture
+def fetched_jobs(tmp_path):
+    """Jobs of two restaurants for two days, with their html already saved."""
+    jobs = make_fetch_jobs(tmp_path, DAYS, uris=URIS)
+    for job in jobs:
+        file_name = (
+            "menu_default.html" if job.restaurant == "Empa" else "menu_with_co2.html"
+        )
+        shutil.copy(TEST_DATA_DIR / file_name, job.file)
+    return jobs
+
+
+class TestPipeline:
+    """Test suite for the fetch jobs and the parsing of several pages."""
+
+    def test_make_fetch_jobs(self, tmp_path):
+        """Test that there is one job per restaurant and day."""
+        jobs = make_fetch_jobs(tmp_path, DAYS, uris=URIS)
+
+        assert [(job.restaurant, job.day) for job in jobs] == [
+            ("Empa", DAYS[0]),
+            ("Eawag", DAYS[0]),
+            ("Empa", DAYS[1]),
+            ("Eawag", DAYS[1]),
+        ]
+        assert jobs[0].uri == "https://example.com/empa/date/2025-08-01"
+        assert jobs[0].file == tmp_path / "Empa" / "raw_html" / "menu_2025-08-01.html"
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_parse_jobs(self, fetched_jobs, workers):
+        """Test that pages are parsed the same in this or in worker processes."""
+        results = parse_jobs(fetched_jobs, workers=workers)
+
+        assert [result.job for result in results] == fetched_jobs
+        df = pd.concat([result.menus for result in results])
+        assert len(df) == 16
+        assert set(zip(df["restaurant"], df["date"])) == {
+            (restaurant, day.strftime("%Y-%m-%d"))
+            for restaurant in URIS
+            for day in DAYS
+        }
+
+    def test_parse_jobs_reports_errors(self, fetched_jobs):
+        """Test that a missing page is reported without stopping the others."""
+        fetched_jobs[1].file.unlink()
+        results = parse_jobs(fetched_jobs, workers=1)
+
+        assert [result.ok for result in results] == [True, False, True, True]
+        assert isinstance(results[1].error, FileNotFoundError)
+
+
+def test_parse_timeouts():
+    """Test that a restaurant timeout overrides the one of all restaurants."""
+    timeouts = parse_timeouts(["20", "Empa=5"], list(URIS))
+
+    assert timeouts == {"Empa": 5.0, "Eawag": 20.0}
+    with pytest.raises(ValueError):
+        parse_timeouts(["Nowhere=5"], list(URIS))
+    with pytest.raises(ValueError):
+        parse_timeouts(["0"], list(URIS))
@@ -1,7 +1,15 @@
 import pytest
 from pathlib import Path
 from datetime import date
-from mensabot.parser import read_menus
+from mensabot.parser import (
+    LAYOUTS,
+    MENU_COLUMNS,
+    ItemLayout,
+    MenuItem,
+    iter_menu_items,
+    menu_items_to_frame,
+    read_menus,
+)
 
 # Get the test data directory
 TEST_DATA_DIR = Path(__file__).parent / "data"
@@ -159,3 +167,150 @@ class TestReadMenus:
         if html_test_files["file_name"] == "with_co2.html":
             # This file is expected to have no CO2 footprint data
             assert not df["co2_footprint"].isnull().all(), "Expected some co2_footprint"
+
+
+@pytest.mark.parametrize("engine", ["lxml", "bs4"])
+def test_read_menus_engines_match(html_test_files, engine):
+    """Test that all parser engines give the same DataFrame."""
+    import pandas as pd
+
+    if engine == "lxml":
+        pytest.importorskip("lxml")
+
+    expected = read_menus(html_test_files["path"], date=date(2025, 8, 1), engine="bs4")
+    df = read_menus(html_test_files["path"], date=date(2025, 8, 1), engine=engine)
+
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_read_menus_unknown_engine():
+    """Test that an unknown parser engine is rejected."""
+    with pytest.raises(ValueError):
+        read_menus(TEST_DATA_DIR / "menu_default.html", date(2025, 8, 1), engine="xyz")
+
+
+@pytest.mark.parametrize("engine", ["lxml", "bs4"])
+def test_iter_menu_items_matches_read_menus(html_test_files, engine):
+    """Test that the streamed items are the rows of read_menus."""
+    import types
+
+    if engine == "lxml":
+        pytest.importorskip("lxml")
+
+    items = iter_menu_items(html_test_files["path"], date(2025, 8, 1), engine=engine)
+    assert isinstance(items, types.GeneratorType)
+
+    df = read_menus(html_test_files["path"], date=date(2025, 8, 1), engine=engine)
+    records = list(items)
+    assert all(isinstance(item, MenuItem) for item in records)
+    assert [item.title for item in records] == df["title"].tolist()
+    assert [item.vegan for item in records] == df["vegan"].tolist()
+
+
+def test_iter_menu_items_tooltips_after_items(tmp_path):
+    """Test that items are streamed with the CO2 of tooltips at the page end."""
+    pytest.importorskip("lxml")
+    from mensabot.bench import make_synthetic_page
+
+    file = tmp_path / "menu.html"
+    file.write_text(make_synthetic_page(50), encoding="utf-8")
+
+    records = list(iter_menu_items(file, date(2025, 8, 1), engine="lxml"))
+
+    assert [item.title for item in records] == [f"Menu {i}" for i in range(50)]
+    assert [item.co2_footprint for item in records] == [
+        float(f"{0.1 * (i % 20):.1f}") for i in range(50)
+    ]
+    assert [item.price for item in records] == [10.0 + i % 10 for i in range(50)]
+
+
+@pytest.mark.parametrize("engine", ["lxml", "bs4"])
+def test_read_menus_tooltip_before_item(tmp_path, engine):
+    """Test that a tooltip without role found before its item gives the CO2."""
+    if engine == "lxml":
+        pytest.importorskip("lxml")
+    file = tmp_path / "menu.html"
+    file.write_text(
+        '<html><body><div id="co2-a">The CO₂ value of this menu is 1.5 kg CO₂e.'
+        '</div><div class="category-grid"><div class="product-wrapper">'
+        '<span class="pre-wrap">A</span><div class="label-list">'
+        '<img alt="CO₂ CO₂-Wert" aria-describedby="co2-a"></div></div></div>'
+        "</body></html>",
+        encoding="utf-8",
+    )
+
+    df = read_menus(file, date(2025, 8, 1), engine=engine)
+
+    assert df[["title", "co2_footprint"]].values.tolist() == [["A", 1.5]]
+
+
+@pytest.mark.parametrize("engine", ["lxml", "bs4"])
+def test_read_menus_custom_layout(tmp_path, engine):
+    """Test that a page is parsed with a layout given as selectors."""
+    if engine == "lxml":
+        pytest.importorskip("lxml")
+    file = tmp_path / "menu.html"
+    file.write_text(
+        '<html><body><div class="category-grid"><section class="dish">'
+        '<h4 class="name">Tofu Curry</h4><p class="text">mit Reis</p>'
+        '<span class="cost">CHF 9.50</span><span class="cost">CHF 12.00</span>'
+        '<ul class="tags"><li><img alt="Vegan" title="Vegan"></li></ul>'
+        "</section></div></body></html>",
+        encoding="utf-8",
+    )
+    layout = ItemLayout(
+        name="test",
+        item="section.dish",
+        title="h4.name",
+        description="p.text",
+        prices="span.cost",
+        images="ul.tags img",
+    )
+
+    df = read_menus(file, date(2025, 8, 1), engine=engine, layouts=(*LAYOUTS, layout))
+
+    assert df[["title", "description", "price"]].values.tolist() == [
+        ["Tofu Curry", "mit Reis", 9.5]
+    ]
+    assert df["vegan"].tolist() == [True]
+    assert read_menus(file, date(2025, 8, 1), engine=engine).empty
+
+
+@pytest.mark.parametrize("engine", ["lxml", "bs4"])
+def test_read_menus_layout_of_innermost_items(tmp_path, engine):
+    """Test that an item of a layout around items of another one is not an item."""
+    if engine == "lxml":
+        pytest.importorskip("lxml")
+    from mensabot.bench import make_synthetic_page
+
+    page = make_synthetic_page(3)
+    file = tmp_path / "menu.html"
+    file.write_text(
+        page.replace('<app-category class="', '<app-category class="product-card '),
+        encoding="utf-8",
+    )
+
+    df = read_menus(file, date(2025, 8, 1), engine=engine)
+
+    assert df["title"].tolist() == ["Menu 0", "Menu 1", "Menu 2"]
+
+
+@pytest.mark.parametrize("selector", ["", "div..price", "div. span", "."])
+def test_item_layout_invalid_selector(tmp_path, selector):
+    """Test that a layout with an invalid selector is rejected."""
+    file = tmp_path / "menu.html"
+    file.write_text("<html><body></body></html>", encoding="utf-8")
+    layout = ItemLayout(name="test", item=".dish", title=selector, description="p")
+
+    with pytest.raises(ValueError, match="selector"):
+        read_menus(file, date(2025, 8, 1), engine="bs4", layouts=(layout,))
+
+
+def test_menu_items_to_frame_empty():
+    """Test that no items give an empty DataFrame with the typed columns."""
+    df = menu_items_to_frame([])
+
+    assert list(df.columns) == MENU_COLUMNS
+    assert df.empty
+    assert df["price"].dtype == float
+    assert df["vegan"].dtype == bool
@@ -0,0 +1,79 @@
+import shutil
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+from mensabot.parser import read_menus
+from mensabot.pipeline import get_html_file, load_saved_menus
+from mensabot.reparse import discover_raw_pages, reparse
+
+TEST_DATA_DIR = Path(__file__).parent / "data"
+
+PAGES = {
+    ("Empa", date(2025, 8, 1)): "menu_default.html",
+    ("Empa", date(2025, 8, 4)): "menu_holiday.html",
+    ("Eawag", date(2025, 8, 1)): "menu_with_co2.html",
+    ("Eawag", date(2025, 8, 4)): "menu_format_matcard.html",
+}
+
+
+@pytest.fixture
+def work_dir(tmp_path):
+    """Work directory with saved html pages of two restaurants."""
+    for (restaurant, day), file_name in PAGES.items():
+        file = get_html_file(tmp_path, restaurant, day)
+        file.parent.mkdir(exist_ok=True, parents=True)
+        shutil.copy(TEST_DATA_DIR / file_name, file)
+    # Not a page of a day
+    (tmp_path / "Empa" / "raw_html" / "menu_backup.html").touch()
+    return tmp_path
+
+
+def test_discover_raw_pages(work_dir):
+    pages = discover_raw_pages(work_dir)
+
+    assert [(page.restaurant, page.day) for page in pages] == sorted(PAGES)
+    assert [page.restaurant for page in discover_raw_pages(work_dir, ["Eawag"])] == [
+        "Eawag",
+        "Eawag",
+    ]
+
+
+@pytest.mark.parametrize("workers, chunk_size", [(1, None), (2, 1)])
+def test_reparse_csv(work_dir, workers, chunk_size):
+    """Test that the saved menus are the ones of the parser, for every page."""
+    stats = reparse(work_dir, workers=workers, chunk_size=chunk_size)
+
+    assert (stats.files, stats.errors) == (4, 0)
+    for (restaurant, day), file_name in PAGES.items():
+        expected = read_menus(TEST_DATA_DIR / file_name, date=day)
+        saved = load_saved_menus(work_dir, day)
+        saved = saved[saved["restaurant"] == restaurant].reset_index(drop=True)
+        assert saved["title"].tolist() == expected["title"].tolist()
+    assert stats.items == sum(
+        len(read_menus(TEST_DATA_DIR / name, date=day))
+        for (_, day), name in PAGES.items()
+    )
+
+
+def test_reparse_parquet(work_dir):
+    """Test that the menus are written in bulk to the archive."""
+    pytest.importorskip("pyarrow")
+    from mensabot.store import get_archive_dir, load_menus
+
+    stats = reparse(work_dir, store="parquet", workers=1)
+
+    df = load_menus(get_archive_dir(work_dir))
+    assert len(df) == stats.items
+    assert set(df["restaurant"]) == {"Empa", "Eawag"}
+
+
+def test_reparse_counts_errors(work_dir):
+    """Test that a page failing to parse does not stop the others."""
+    get_html_file(work_dir, "Empa", date(2025, 8, 5)).mkdir()
+
+    stats = reparse(work_dir, workers=1)
+
+    assert (stats.files, stats.errors) == (5, 1)
+    assert len(load_saved_menus(work_dir, date(2025, 8, 1))) > 0
@@ -0,0 +1,169 @@
+import asyncio
+import shutil
+from datetime import date, datetime
+from pathlib import Path
+
+import pytest
+
+from mensabot import serve
+from mensabot.fetcher import FetchResult
+from mensabot.serve import CronSchedule, MenuDaemon, parse_fetch_schedules
+
+TEST_DATA_DIR = Path(__file__).parent / "data"
+
+URIS = {
+    "Empa": "https://example.com/empa",
+    "Eawag": "https://example.com/eawag",
+}
+
+DAY = date(2025, 8, 1)
+
+
+class TestCronSchedule:
+    """Test suite for the cron expressions of the daemon."""
+
+    @pytest.mark.parametrize(
+        "expression, time, expected",
+        [
+            # Friday afternoon, next workday at 14:00 is Monday
+            ("0 14 * * 1-5", datetime(2025, 8, 1, 14, 0), datetime(2025, 8, 4, 14, 0)),
+            ("0 14 * * 1-5", datetime(2025, 8, 1, 13, 59), datetime(2025, 8, 1, 14, 0)),
+            (
+                "*/20 12-13 * * *",
+                datetime(2025, 8, 1, 12, 41),
+                datetime(2025, 8, 1, 13),
+            ),
+            ("30 10 * * 7", datetime(2025, 8, 1), datetime(2025, 8, 3, 10, 30)),
+            ("0 0 1 1 *", datetime(2025, 8, 1), datetime(2026, 1, 1)),
+            # Both days restricted: the 15th or any Monday
+            ("0 9 15 * 1", datetime(2025, 8, 5), datetime(2025, 8, 11, 9)),
+            ("0 9 15 * 1", datetime(2025, 8, 12), datetime(2025, 8, 15, 9)),
+        ],
+    )
+    def test_next_after(self, expression, time, expected):
+        schedule = CronSchedule(expression)
+
+        assert schedule.next_after(time) == expected
+        assert schedule.matches(expected)
+
+    @pytest.mark.parametrize(
+        "expression", ["0 14 * *", "60 * * * *", "0 14 * * 1-9", "0 */0 * * *"]
+    )
+    def test_invalid_expression(self, expression):
+        with pytest.raises(ValueError):
+            CronSchedule(expression)
+
+    def test_never_matches(self):
+        with pytest.raises(ValueError):
+            CronSchedule("0 0 30 2 *").next_after(datetime(2025, 8, 1))
+
+
+def test_parse_fetch_schedules():
+    """Test that a restaurant schedule overrides the one of all restaurants."""
+    schedules = parse_fetch_schedules(
+        ["30 13 * * 1-5", "Empa=*/20 12-13 * * 1-5"], list(URIS)
+    )
+
+    assert schedules["Empa"].expression == "*/20 12-13 * * 1-5"
+    assert schedules["Eawag"].expression == "30 13 * * 1-5"
+
+    with pytest.raises(ValueError):
+        parse_fetch_schedules(["Nowhere=0 12 * * *"], list(URIS))
+
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch):
+    """A daemon fetching the test pages, for a fixed day."""
+    fetched = []
+    browsers = []
+
+    async def fake_fetch_async(jobs, **kwargs):
+        browsers.append(kwargs["browser"])
+        for job in jobs:
+            fetched.append(job.restaurant)
+            file_name = (
+                "menu_default.html"
+                if job.restaurant == "Empa"
+                else "menu_with_co2.html"
+            )
+            shutil.copy(TEST_DATA_DIR / file_name, job.file)
+        return [FetchResult(job) for job in jobs]
+
+    monkeypatch.setattr(serve, "fetch_async", fake_fetch_async)
+
+    daemon = MenuDaemon(
+        tmp_path,
+        fetch_schedules={r: CronSchedule("30 13 * * 1-5") for r in URIS},
+        uris=URIS,
+        debug=True,
+    )
+    monkeypatch.setattr(daemon, "target_day", lambda: DAY)
+    daemon.fetched = fetched
+    daemon.browsers = browsers
+    return daemon
+
+
+def test_daemon_post_fetches_missing_menus(daemon):
+    """Test that the menus not fetched before the post are fetched by it."""
+    asyncio.run(daemon.refresh(["Empa"], DAY))
+    assert daemon.fetched == ["Empa"]
+
+    text = asyncio.run(daemon.post())
+
+    assert daemon.fetched == ["Empa", "Eawag"]
+    assert set(daemon.menus) == {("Empa", DAY), ("Eawag", DAY)}
+    assert text.startswith("# Friday 01 August")
+    assert "[Eawag](https://example.com/eawag)" in text
+    assert (daemon.work_dir / "Empa" / "menus" / "menu_2025-08-01.csv").is_file()
+
+
+def test_daemon_post_reuses_menus(daemon):
+    """Test that a second post does not fetch the menus again."""
+    first = asyncio.run(daemon.post())
+    second = asyncio.run(daemon.post())
+
+    assert first == second
+    assert daemon.fetched == ["Empa", "Eawag"]
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.connected = True
+
+    def is_connected(self):
+        return self.connected
+
+
+def test_daemon_relaunches_crashed_browser(daemon, monkeypatch):
+    """Test that a browser closed between two fetches is launched again."""
+    launched = []
+
+    async def launch_browser():
+        launched.append(FakeBrowser())
+        return launched[-1]
+
+    async def main():
+        # As in run, with playwright started
+        daemon._playwright = object()
+        monkeypatch.setattr(daemon, "_launch_browser", launch_browser)
+        await daemon._check_browser()
+        await daemon.refresh(["Empa"], DAY)
+        launched[0].connected = False
+        await daemon.refresh(["Empa", "Eawag"], DAY)
+        await daemon.refresh(["Eawag"], DAY)
+
+    asyncio.run(main())
+
+    assert len(launched) == 2
+    assert daemon.browsers == [launched[0], launched[1], launched[1]]
+
+
+def test_serve_subcommand(capsys):
+    """Test that `mensabot serve` runs the daemon command."""
+    from mensabot.__main__ import main
+
+    with pytest.raises(SystemExit) as exit_info:
+        main(["serve", "--help"])
+
+    assert exit_info.value.code == 0
+    assert capsys.readouterr().out.startswith("usage: mensabot serve")
@@ -0,0 +1,99 @@
+import shutil
+from datetime import date, timedelta
+from pathlib import Path
+
+import pytest
+
+from mensabot.parser import read_menus
+from mensabot.pipeline import get_html_file
+from mensabot.reparse import discover_raw_pages, reparse
+from mensabot.snapshots import SnapshotStore, get_snapshot_dir, open_snapshot
+
+TEST_DATA_DIR = Path(__file__).parent / "data"
+
+PAGE_NAMES = [
+    "menu_default.html",
+    "menu_holiday.html",
+    "menu_with_co2.html",
+    "menu_format_matcard.html",
+]
+
+
+@pytest.fixture(params=["zstd", "gzip"])
+def store(request, tmp_path):
+    """Empty snapshot store, with each codec."""
+    if request.param == "zstd":
+        pytest.importorskip("zstandard")
+    return SnapshotStore(get_snapshot_dir(tmp_path), codec=request.param)
+
+
+def test_put_deduplicates(store):
+    """Test that identical pages share a single object."""
+    content = (TEST_DATA_DIR / "menu_default.html").read_bytes()
+    first = store.put("Empa", date(2025, 8, 1), content)
+    second = store.put("Eawag", date(2025, 8, 4), content)
+
+    assert first == second
+    assert store.get_path("Empa", date(2025, 8, 1)) == first
+    assert store.get_path("Empa", date(2025, 8, 5)) is None
+    assert len(store.pages()) == 2
+    assert store.disk_usage() < len(content) / 4
+
+
+@pytest.mark.parametrize("engine", ["lxml", "bs4"])
+@pytest.mark.parametrize("file_name", PAGE_NAMES)
+def test_read_menus_from_snapshot(store, engine, file_name):
+    """Test that a stored page parses like the original html."""
+    day = date(2025, 8, 1)
+    store.put("Empa", day, (TEST_DATA_DIR / file_name).read_bytes())
+
+    with store.open("Empa", day) as f:
+        df = read_menus(f, date=day, engine=engine)
+
+    expected = read_menus(TEST_DATA_DIR / file_name, date=day, engine=engine)
+    assert df.equals(expected)
+
+
+def test_dictionary(tmp_path):
+    """Test that the objects stay readable once a dictionary is trained."""
+    pytest.importorskip("zstandard")
+    store = SnapshotStore(tmp_path, codec="zstd")
+    pages = [(TEST_DATA_DIR / name).read_bytes() for name in PAGE_NAMES]
+    old = store.put("Empa", date(2025, 8, 1), pages[0])
+
+    # Variants of the pages, enough to train on
+    samples = [page + f"<!-- {i} -->".encode() for i in range(3) for page in pages]
+    assert store.train_dictionary(samples[:2]) is None
+    dict_id = store.train_dictionary(samples, size=16 * 1024)
+    new = store.put("Empa", date(2025, 8, 4), pages[1])
+
+    assert dict_id
+    with open_snapshot(old) as f:
+        assert f.read() == pages[0]
+    with open_snapshot(new) as f:
+        assert f.read() == pages[1]
+
+
+def test_import_raw_html(tmp_path):
+    """Test that the pages are stored and the old html files deleted."""
+    today = date(2025, 8, 4)
+    days = [today - timedelta(days=1), today]
+    for day, name in zip(days, PAGE_NAMES):
+        file = get_html_file(tmp_path, "Empa", day)
+        file.parent.mkdir(exist_ok=True, parents=True)
+        shutil.copy(TEST_DATA_DIR / name, file)
+    store = SnapshotStore(get_snapshot_dir(tmp_path))
+
+    stats = store.import_raw_html(tmp_path, delete_before=today)
+
+    assert (stats.pages, stats.new_objects) == (2, 2)
+    assert stats.stored_bytes < stats.html_bytes
+    assert not get_html_file(tmp_path, "Empa", days[0]).exists()
+    assert get_html_file(tmp_path, "Empa", today).exists()
+
+    # The deleted page is re-parsed from the store
+    pages = discover_raw_pages(tmp_path)
+    assert [page.day for page in pages] == days
+    assert pages[0].file.parent.parent.name == "objects"
+    stats = reparse(tmp_path, workers=1)
+    assert (stats.files, stats.errors) == (2, 0)
@@ -0,0 +1,94 @@
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from mensabot.parser import read_menus  # noqa: E402
+from mensabot.store import (  # noqa: E402
+    append_menus,
+    compact_csv_history,
+    load_menus,
+)
+
+TEST_DATA_DIR = Path(__file__).parent / "data"
+
+
+def _menus(file_name: str, restaurant: str, day: date) -> pd.DataFrame:
+    df = read_menus(TEST_DATA_DIR / file_name, date=day)
+    df["restaurant"] = restaurant
+    return df
+
+
+class TestArchive:
+    """Test suite for the parquet archive of the menus."""
+
+    def test_roundtrip_keeps_dtypes(self, tmp_path):
+        """Test that the menus read back are the ones written."""
+        df = _menus("menu_with_co2.html", "Eawag", date(2025, 8, 1))
+        append_menus(tmp_path, df)
+        loaded = load_menus(tmp_path)
+
+        # Missing texts can come back as another null value than None
+        pd.testing.assert_frame_equal(
+            loaded.drop(columns="provenance"),
+            df.drop(columns="provenance"),
+            check_dtype=False,
+        )
+        assert loaded["provenance"].isna().all()
+        assert loaded["price"].dtype == float
+        assert loaded["vegan"].dtype == bool
+
+    def test_append_same_day_replaces(self, tmp_path):
+        """Test that writing a day again does not duplicate its menus."""
+        df = _menus("menu_default.html", "Empa", date(2025, 8, 1))
+        append_menus(tmp_path, df)
+        append_menus(tmp_path, df)
+
+        assert len(load_menus(tmp_path)) == len(df)
+
+    def test_append_empty_day_deletes(self, tmp_path):
+        """Test that a day written again without menus has none anymore."""
+        day = date(2025, 8, 1)
+        df = _menus("menu_default.html", "Empa", day)
+        append_menus(tmp_path, df)
+        append_menus(tmp_path, _menus("menu_with_co2.html", "Eawag", day))
+
+        append_menus(tmp_path, df.iloc[:0], partitions=[("Empa", day)])
+
+        assert set(load_menus(tmp_path)["restaurant"]) == {"Eawag"}
+
+    def test_load_filters(self, tmp_path):
+        """Test the restaurant and date filters."""
+        for day in [date(2025, 8, 1), date(2025, 8, 4), date(2025, 8, 5)]:
+            append_menus(tmp_path, _menus("menu_default.html", "Empa", day))
+            append_menus(tmp_path, _menus("menu_with_co2.html", "Eawag", day))
+
+        df = load_menus(
+            tmp_path,
+            restaurants=["Eawag"],
+            start=date(2025, 8, 2),
+            end=date(2025, 8, 4),
+        )
+
+        assert set(df["restaurant"]) == {"Eawag"}
+        assert set(df["date"]) == {"2025-08-04"}
+
+    def test_compact_csv_history(self, tmp_path):
+        """Test that the csv files of the work directory go to the archive."""
+        for restaurant, file_name in [
+            ("Empa", "menu_default.html"),
+            ("Memphis", "menu_holiday.html"),
+        ]:
+            menus_dir = tmp_path / restaurant / "menus"
+            menus_dir.mkdir(parents=True)
+            df = _menus(file_name, restaurant, date(2025, 8, 1))
+            df.to_csv(menus_dir / "menu_2025-08-01.csv", index=False)
+
+        n_items = compact_csv_history(tmp_path)
+
+        df = load_menus(tmp_path / "archive")
+        assert n_items == len(df) == 5
+        assert df["vegetarian"].dtype == bool